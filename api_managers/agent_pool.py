@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    def __init__(self, name, agents):
+        """
+        Pool of the agents (credentials of an agent, bot or account) available for one api and one language.
+        An agent is leased to one manager at a time.
+
+        Every agent listed is a slot of the pool, even when the same credentials are listed several times
+        (several luis apps of one key). A slot keeps the artifact (luis app) of the manager which last used it,
+        which the next lease of the slot starts from, and an artifact belongs to one slot at most.
+
+        :param name: name of the pool, for logging
+        :param agents: list of dictionaries of constructor arguments, one per agent
+        """
+        self.name = name
+        self.agents = list(agents)
+        self.size = len(agents)
+        self._free = list(range(self.size))
+        self._condition = threading.Condition()
+        # slot -> manager using it while it is leased
+        self._leased = {}
+        # slot -> manager which last used it
+        self._last_apis = {}
+        # slot -> artifact it holds
+        self._artifacts = {}
+        # artifacts a slot held before loading another one, which no slot holds any more
+        self._abandoned = []
+
+    def acquire(self):
+        """
+        :return: index of a free slot, waiting until one is released if they are all leased
+        """
+        with self._condition:
+            while not self._free:
+                logger.debug('[{}] waiting for a free agent'.format(self.name))
+                self._condition.wait(1.)
+            slot = self._free.pop(0)
+            self._leased[slot] = None
+            return slot
+
+    def agent(self, slot):
+        """
+        :return: constructor arguments of the agent of the slot
+        """
+        return self.agents[slot]
+
+    def attach(self, slot, api):
+        """
+        Bind a leased slot to the manager using it
+
+        :return: the artifact held by the slot, None if it holds none
+        """
+        with self._condition:
+            self._leased[slot] = api
+            return self._artifacts.get(slot)
+
+    def load_artifact(self, api, artifact):
+        """
+        Make the manager of a leased slot use an artifact (see ApiManager.load_artifact).
+        The artifact is refused if another leased slot holds it: two managers would train and query it together.
+        A free slot holding it loses it: its next lease starts without artifact.
+
+        :return: True if the manager uses the artifact from now on
+        """
+        with self._condition:
+            slot = self._slot(api)
+            others = [other for other, other_artifact in self._artifacts.items()
+                      if other != slot and other_artifact == artifact]
+            # a leased slot may hold an artifact created since its lease, only recorded at its release
+            used = [other for other, leased_api in self._leased.items() if other != slot and
+                    (other in others or (leased_api is not None and leased_api.get_artifact() == artifact))]
+            if used:
+                logger.debug('[{}] artifact {} used by another agent'.format(self.name, artifact))
+                return False
+            # loaded under the lock: no other slot can take the artifact meanwhile
+            former_artifact = api.get_artifact()
+            if not api.load_artifact(artifact):
+                return False
+            for other in others:
+                del self._artifacts[other]
+            if former_artifact is not None and former_artifact != artifact:
+                self._abandoned.append(former_artifact)
+            self._artifacts[slot] = artifact
+            if artifact in self._abandoned:
+                self._abandoned.remove(artifact)
+            return True
+
+    def holds(self, artifact):
+        """
+        :return: True if a slot holds the artifact
+        """
+        with self._condition:
+            return artifact in self._artifacts.values()
+
+    def release(self, slot, api=None):
+        """
+        :param api: manager which used the slot: the next lease of the slot starts from the artifact it holds
+        """
+        with self._condition:
+            self._leased.pop(slot, None)
+            if api is not None:
+                self._last_apis[slot] = api
+                artifact = api.get_artifact()
+                if artifact is None:
+                    self._artifacts.pop(slot, None)
+                else:
+                    self._artifacts[slot] = artifact
+                    if artifact in self._abandoned:
+                        self._abandoned.remove(artifact)
+            self._free.append(slot)
+            self._condition.notify()
+
+    def artifacts(self):
+        """
+        :return: list of (manager, artifact) of the artifacts held by the slots or abandoned by them,
+            with a manager of the pool able to release each one
+        """
+        with self._condition:
+            if not self._last_apis:
+                return []
+            any_api = list(self._last_apis.values())[0]
+            artifacts = [(self._last_apis.get(slot, any_api), artifact) for slot, artifact in self._artifacts.items()]
+            return artifacts + [(any_api, artifact) for artifact in self._abandoned]
+
+    def forget(self, artifact):
+        """
+        Drop an artifact which has been deleted
+        """
+        with self._condition:
+            for slot, slot_artifact in list(self._artifacts.items()):
+                if slot_artifact == artifact:
+                    del self._artifacts[slot]
+            if artifact in self._abandoned:
+                self._abandoned.remove(artifact)
+
+    def _slot(self, api):
+        for slot, leased_api in self._leased.items():
+            if leased_api is api:
+                return slot
+        raise Exception('[{}] the manager is not leased from this pool'.format(self.name))
@@ -1,34 +1,151 @@
 # -*- coding: utf-8 -*-
 
-from apis.apiai import ApiaiManager
-from apis.luis import LuisManager
-from apis.recast import RecastManager
-from settings import credentials
+from agent_pool import AgentPool
+from contextlib import contextmanager
+from settings import settings
 
+import importlib
+import json
+import threading
 
-def build_api(api_name, fallback_name, language, params):
-    if api_name == 'apiai':
-        return ApiaiManager(token=credentials.APIAI_TOKENS[language], fallback_name=fallback_name, **params)
-    if api_name == 'luis':
-        if language == 'en':
-            return LuisManager(credentials.LUIS_KEY, fallback_name, 'en-us', **params)
-        elif language == 'fr':
-            return LuisManager(credentials.LUIS_KEY, fallback_name, 'fr-fr', **params)
-    if api_name == 'recast':
-        return RecastManager(credentials.RECAST_USER_SLUG, credentials.RECAST_BOT_SLUG, credentials.RECAST_TOKEN,
-                             language, fallback_name, **params)
+_pools = {}
+_pools_lock = threading.Lock()
+
+# api name -> manager class, or 'module:class' of the manager imported when the api is first used
+_providers = {
+    'apiai': 'api_managers.apis.apiai:ApiaiManager',
+    'luis': 'api_managers.apis.luis:LuisManager',
+    'recast': 'api_managers.apis.recast:RecastManager',
+    'local': 'api_managers.apis.local:LocalManager'
+}
+_providers_lock = threading.RLock()
+
+
+def register(api_name, manager):
+    """
+    Add an api (see settings.PLUGINS)
+
+    :param manager: class of the manager of the api (inheriting ApiManager), or 'module:class' to import it
+        only when the api is used
+    """
+    with _providers_lock:
+        _providers[api_name] = manager
+
+
+def is_registered(api_name):
+    return api_name in _providers
+
+
+def get_manager_class(api_name):
+    """
+    :return: class of the manager of the api, its module being imported at the first call
+    """
+    with _providers_lock:
+        if api_name not in _providers:
+            raise Exception('The Api \'{}\' is not registered'.format(api_name))
+        manager = _providers[api_name]
+        if not isinstance(manager, str):
+            return manager
+        module_name, class_name = manager.split(':')
+        _providers[api_name] = getattr(importlib.import_module(module_name), class_name)
+        return _providers[api_name]
+
+
+def get_agents(api_name, language):
+    """
+    :return: list of the constructor arguments of every agent of the api configured in credentials
+    """
+    return get_manager_class(api_name).get_agents(language)
+
+
+def get_pool(api_name, language):
+    agents = get_agents(api_name, language)
+    # languages using the same agents (recast bots, luis keys) share their pool
+    key = (api_name, json.dumps(agents, sort_keys=True))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = AgentPool('{}_{}'.format(api_name, language), agents)
+        return _pools[key]
+
+
+def build_api(api_name, fallback_name, language, params, agent=None):
+    """
+    :param agent: constructor arguments of the agent to use (see get_agents). Defaults to the first agent
+    """
+    if agent is None:
+        agent = get_agents(api_name, language)[0]
+    return get_manager_class(api_name).from_agent(agent, fallback_name, language, params,
+                                                  n_workers=settings.PREDICT_WORKERS)
+
+
+class ApiFactory:
+    def __init__(self, api_name, fallback_name, language, params):
+        """
+        Build managers of an api, each one bound to an agent leased from the pool of the api
+        """
+        self.api_name = api_name
+        self.fallback_name = fallback_name
+        self.language = language
+        self.params = params
+        self.size = get_pool(api_name, language).size
+
+    def __repr__(self):
+        return self.api_name
+
+    @contextmanager
+    def lease(self):
+        """
+        Context manager giving a manager of the api, whose agent is returned to the pool at exit
+        """
+        pool = get_pool(self.api_name, self.language)
+        slot = pool.acquire()
+        api = None
+        try:
+            api = build_api(self.api_name, self.fallback_name, self.language, self.params, agent=pool.agent(slot))
+            artifact = pool.attach(slot, api)
+            if artifact is not None:
+                # the agent keeps its artifact (luis app) from one lease to the next instead of creating a new one
+                pool.load_artifact(api, artifact)
+            yield api
+        finally:
+            pool.release(slot, api)
+
+    def load_artifact(self, api, artifact):
+        """
+        Make a leased manager use an artifact, unless another agent leased from the pool uses it
+
+        :return: True if the manager uses the artifact from now on
+        """
+        return get_pool(self.api_name, self.language).load_artifact(api, artifact)
+
+    def release_artifact(self, api, artifact):
+        """
+        Delete an artifact evicted from the model registry, unless an agent of the pool still holds it:
+        it is then released with the agents (see release_artifacts)
+        """
+        pool = get_pool(self.api_name, self.language)
+        if pool.holds(artifact):
+            return
+        api.release_artifact(artifact)
+        pool.forget(artifact)
+
+
+def release_artifacts(registry=None):
+    """
+    Delete the artifacts (luis apps) still held by the agents of the pools, unless the model registry keeps them.
+    Called once the apis are no longer used
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    for (api_name, _), pool in pools:
+        for api, artifact in pool.artifacts():
+            if registry is None or not registry.holds(api_name, artifact):
+                api.release_artifact(artifact)
+                pool.forget(artifact)
 
 
 def check_params(api_name, params):
-    api_class = None
-    if api_name == 'recast':
-        api_class = RecastManager
-    elif api_name == 'apiai':
-        api_class = ApiaiManager
-    elif api_name == 'luis':
-        api_class = LuisManager
-
-    api_parameters = api_class.get_parametors()
+    api_parameters = get_manager_class(api_name).get_parametors()
 
     for parameter in params:
         if parameter not in api_parameters:
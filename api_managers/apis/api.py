@@ -1,14 +1,35 @@
 # -*- coding: utf-8 -*-
 
+from multiprocessing.pool import ThreadPool
+
+import time
+
+
+def as_list(value):
+    """
+    :return: value if it is a list (several agents configured in credentials.py), else [value]
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
 
 class ApiManager:
-    def __init__(self, fallback_name):
+    def __init__(self, fallback_name, n_workers=1):
         """
         Initialize the manager of the Api. Should keep in memory the fallback_name
         :param fallback_name:
             name of the intent to return in fallback case.
+        :param n_workers:
+            number of queries the manager may send concurrently in predict.
         """
         self._fallback_name = fallback_name
+        self._n_workers = max(1, n_workers)
+        # seconds between the end of the upload of the training data and the model being queryable,
+        # observed during the last fit
+        self.time_to_ready = None
+        # seconds taken to answer each sentence of the last predict
+        self.latencies = []
 
     def __repr__(self):
         """
@@ -24,6 +45,7 @@ class ApiManager:
             - train its model
             - be available from http requests (for predictions)
                 (some apis like Luis must be 'published' here
+                see api_managers.readiness to wait for the model and record time_to_ready
 
         :param
             - df_train: Pandas DataFrame
@@ -40,6 +62,7 @@ class ApiManager:
     def predict(self, sentences_list):
         """
         Given a list of sentences, this function must return the list of intents relative to the sentences.
+        It should record the seconds taken to answer each sentence in latencies (see _predict_concurrently)
         :param
             sentences_list: list
                 list of the sentences you want to get the intent
@@ -48,6 +71,83 @@ class ApiManager:
         """
         raise NotImplementedError('predict method has not been implemented')
 
+    @staticmethod
+    def _utterances_by_intent(df_train):
+        """
+        :return: dictionary intent -> list of the distinct sentences of the intent in df_train
+        """
+        utterances = {}
+        seen = set()
+        for sentence, intent in zip(df_train['sentence'], df_train['intent']):
+            intent_utterances = utterances.setdefault(intent, [])
+            if (intent, sentence) not in seen:
+                seen.add((intent, sentence))
+                intent_utterances.append(sentence)
+        return utterances
+
+    def _map_concurrently(self, func, items):
+        """
+        Apply func to every item using up to n_workers threads.
+        The results are returned in the same order as the items.
+        """
+        items = list(items)
+        n_workers = min(self._n_workers, len(items))
+        if n_workers <= 1:
+            return [func(item) for item in items]
+        pool = ThreadPool(n_workers)
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _predict_concurrently(self, predict_one, sentences):
+        """
+        Apply predict_one to every sentence using up to n_workers threads,
+        and record the latency of every query in latencies.
+        :return: the list of the intents, in the same order as the sentences
+        """
+        def timed_predict(sentence):
+            start = time.time()
+            intent = predict_one(sentence)
+            return intent, time.time() - start
+
+        results = self._map_concurrently(timed_predict, sentences)
+        self.latencies = [latency for _, latency in results]
+        return [intent for intent, _ in results]
+
+    def get_artifact(self):
+        """
+        Optional. Describe the remote artifact (agent, bot, app...) holding the model trained by the last fit,
+        so that a model registry can skip a later fit on the same data.
+        :return:
+            json serializable object, or None if the api does not hold any model
+        """
+        return None
+
+    def load_artifact(self, artifact):
+        """
+        Optional. Make the manager use the model held by the artifact instead of training a new one.
+        :param artifact: object returned by get_artifact
+        :return:
+            True if the artifact is still available and is used by the manager from now on
+        """
+        return False
+
+    def detach_artifact(self):
+        """
+        Optional. Called before fit when the current artifact holds a registered model that should be kept:
+        the next fit must then train a new artifact instead of overwriting this one.
+        Apis which cannot create new artifacts (single agent) can ignore it.
+        """
+        pass
+
+    def release_artifact(self, artifact):
+        """
+        Optional. Delete an artifact which is no longer referenced by the model registry.
+        """
+        pass
+
     @classmethod
     def get_parametors(cls):
         """
@@ -59,3 +159,42 @@ class ApiManager:
 
         """
         raise NotImplementedError('get_parametors class method has not been implemented')
+
+    @classmethod
+    def get_agents(cls, language):
+        """
+        Optional. Return the agents of the api available for a language (tokens, apps, bots... configured in
+        credentials.py), each one as a dictionary of constructor arguments. Folds are scored concurrently
+        on different agents. Defaults to a single agent without arguments
+
+        :return:
+            list of dictionaries
+        """
+        return [{}]
+
+    @classmethod
+    def estimate_calls(cls, n_intents, n_train, n_test, n_probes=1):
+        """
+        Optional. Estimate the requests sent to train the api on a fold and predict it, for the planner.
+        Without a model registry, the agent is assumed to hold the model of another fold
+
+        :param n_intents: number of intents of the training set
+        :param n_train: number of training sentences
+        :param n_test: number of sentences predicted
+        :param n_probes: number of probes sent by each wait for the model to be ready (see readiness)
+        :return:
+            dictionary with the number of requests sent by the fit ('fit'), the predict ('predict')
+            and of the deletions ('delete'). None if unknown
+        """
+        return None
+
+    @classmethod
+    def from_agent(cls, agent, fallback_name, language, params, n_workers=1):
+        """
+        Optional. Build a manager of the api bound to one of its agents (see get_agents)
+
+        :param params: values of some of the parameters given by get_parametors
+        :param n_workers: number of queries the manager may send concurrently in predict
+        """
+        arguments = dict(agent, **params)
+        return cls(fallback_name=fallback_name, n_workers=n_workers, **arguments)
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
-from api import ApiManager
+from api import ApiManager, as_list
+from api_managers import readiness
+from api_managers import transport
+from settings import credentials
+from settings import settings
+from tools import fingerprint
 from urllib import quote
 
 import logging
-import requests
-import time
+import threading
 
 
 class ApiAiException(Exception):
@@ -24,49 +28,114 @@ class ApiAiException(Exception):
 
 
 class ApiaiManager(ApiManager):
-    def __init__(self, token, fallback_name, sleeping_time=3):
-        ApiManager.__init__(self, fallback_name)
+    # agent -> intent name -> (intent id, templates) as left by the last sync of the process.
+    # An agent is leased to one manager at a time, which is the only one changing it
+    _synced = {}
+    _synced_lock = threading.Lock()
+
+    def __init__(self, token, fallback_name, n_workers=1):
+        ApiManager.__init__(self, fallback_name, n_workers)
         logging.debug('[ApiAi] connect with token={token}'.format(token=token))
 
-        self._base_url = 'https://api.api.ai/v1/'
+        self._base_url = settings.APIAI_URL
         self._headers = {
             'Authorization': 'Bearer {0}'.format(token)
         }
-        self._sleeping_time = sleeping_time
+        self._agent = fingerprint.hash_values(token)
+        self._http = transport.get_transport('apiai')
 
     def __repr__(self):
         return 'apiai'
 
     def fit(self, df_train):
-        self._clear()
-        X_train = df_train['sentence']
-        y_train = df_train['intent']
-        intents = set(y_train)
-        for intent in intents:
-            self._create_intent(intent, list(X_train[y_train == intent]), intent)
-        self._create_intent(self._fallback_name, [], self._fallback_name, fallback=True)
+        utterances = self._utterances_by_intent(df_train)
+        added = self._sync(utterances)
 
-        time.sleep(self._sleeping_time)
+        # api.ai does not expose its training status: wait until it recognizes the new training sentences
+        self.time_to_ready = 0.
+        if added:
+            self.time_to_ready = readiness.wait_until_ready(readiness.prediction_probe(self._predict_one, added),
+                                                            str(self), required=False)
 
     def predict(self, x_list):
-        predictions = []
-        for i, x in enumerate(x_list):
-            predictions.append(self._query(x)['action'])
-        return predictions
+        return self._predict_concurrently(self._predict_one, x_list)
+
+    def get_artifact(self):
+        return {'agent': self._agent}
+
+    def load_artifact(self, artifact):
+        # a single agent is used: it still holds the model if nothing has been trained on it since
+        return artifact == self.get_artifact()
 
     @classmethod
     def get_parametors(cls):
         return []
 
-    def _clear(self):
-        entities_name = self._get_intents().keys()
-        for entity in entities_name:
-            self._remove_intent_byname(entity)
+    @classmethod
+    def get_agents(cls, language):
+        return [{'token': token} for token in as_list(credentials.APIAI_TOKENS[language])]
+
+    @classmethod
+    def estimate_calls(cls, n_intents, n_train, n_test, n_probes=1):
+        # intents listed, each intent read then updated, fallback intent, probes of the training sentences
+        probe_calls = 3 * (n_probes - 1) + 1
+        return {'fit': 2 + 2 * n_intents + probe_calls, 'predict': n_test, 'delete': 0}
+
+    @classmethod
+    def from_agent(cls, agent, fallback_name, language, params, n_workers=1):
+        return cls(token=agent['token'], fallback_name=fallback_name, n_workers=n_workers, **params)
+
+    def _sync(self, utterances):
+        """
+        Update the agent so that its intents are exactly the ones given.
+        Only the intents which have been added, removed or whose templates changed are sent.
+        The templates of an intent are read only if it has not been synced by this process:
+        the intents listed are else compared with the templates left by the last sync.
+
+        :param utterances: dictionary intent -> list of templates
+        :return: dictionary intent -> list of the templates added to it
+        """
+        with self._synced_lock:
+            synced = ApiaiManager._synced.setdefault(self._agent, {})
+        remote_intents = self._get_intents()
+        for name in list(synced):
+            if name not in remote_intents:
+                del synced[name]
+        for name, intent in remote_intents.items():
+            if name not in utterances and name != self._fallback_name:
+                self._remove_intent_byid(intent['id'])
+                synced.pop(name, None)
+
+        added = {}
+
+        def upload(name):
+            templates = utterances[name]
+            intent = remote_intents.get(name)
+            if intent is None:
+                synced[name] = (self._create_intent(name, templates, name), frozenset(templates))
+                added[name] = templates
+                return
+            intent_id, remote_templates = synced.get(name, (None, None))
+            if intent_id != intent['id']:
+                remote_templates = frozenset(self._get_intent(intent['id']).get('templates', []))
+            if remote_templates != frozenset(templates):
+                self._update_intent(intent['id'], name, templates, name)
+                new_templates = [template for template in templates if template not in remote_templates]
+                if new_templates:
+                    added[name] = new_templates
+            synced[name] = (intent['id'], frozenset(templates))
+
+        # api.ai v1 has no bulk import: every intent is one request, sent concurrently
+        self._map_concurrently(upload, list(utterances))
+
+        if self._fallback_name not in remote_intents:
+            self._create_intent(self._fallback_name, [], self._fallback_name, fallback=True)
+        return added
 
     def _get_entities(self):
         logging.debug('[ApiAi] get_entities')
 
-        r = requests.get(
+        r = self._http.get(
             '{url}entities'.format(url=self._base_url),
             headers=self._headers,
         )
@@ -86,7 +155,7 @@ class ApiaiManager(ApiManager):
             'entries': entries,
         }
 
-        r = requests.post(
+        r = self._http.post(
             '{url}entities'.format(url=self._base_url),
             headers=self._headers,
             json=payload
@@ -102,7 +171,7 @@ class ApiaiManager(ApiManager):
     def _remove_entity_byid(self, entity_id):
         logging.debug('[ApiAi] remove_entity_byid: id={id}'.format(id=entity_id))
 
-        r = requests.delete(
+        r = self._http.delete(
             '{url}entities/{id}'.format(url=self._base_url, id=entity_id),
             headers=self._headers,
         )
@@ -133,7 +202,7 @@ class ApiaiManager(ApiManager):
     def _get_intents(self):
         logging.debug('[ApiAi] get_intents')
 
-        r = requests.get(
+        r = self._http.get(
             '{url}intents'.format(url=self._base_url),
             headers=self._headers,
         )
@@ -145,10 +214,24 @@ class ApiaiManager(ApiManager):
 
         return dict([(item['name'], item) for item in result])
 
-    def _create_intent(self, name, templates, action, parameters=None, fallback=False):
-        logging.debug('[ApiAi] create_intent: name={name}'.format(name=name))
+    def _get_intent(self, intent_id):
+        logging.debug('[ApiAi] get_intent: id={id}'.format(id=intent_id))
 
-        payload = {
+        r = self._http.get(
+            '{url}intents/{id}'.format(url=self._base_url, id=intent_id),
+            headers=self._headers,
+        )
+
+        result = r.json()
+
+        if r.status_code != 200:
+            raise ApiAiException(result['status'])
+
+        return result
+
+    @staticmethod
+    def _intent_payload(name, templates, action, parameters=None, fallback=False):
+        return {
             'name': name,
             'templates': templates,
             'responses': [
@@ -162,10 +245,14 @@ class ApiaiManager(ApiManager):
             'state': 'LEARNED'
         }
 
-        r = requests.post(
+    def _create_intent(self, name, templates, action, parameters=None, fallback=False):
+        logging.debug('[ApiAi] create_intent: name={name}'.format(name=name))
+
+        r = self._http.post(
             '{url}intents'.format(url=self._base_url),
             headers=self._headers,
-            json=payload
+            json=self._intent_payload(name, templates, action, parameters, fallback),
+            compress=True
         )
 
         result = r.json()
@@ -175,10 +262,25 @@ class ApiaiManager(ApiManager):
 
         return result['id']
 
+    def _update_intent(self, intent_id, name, templates, action, parameters=None, fallback=False):
+        logging.debug('[ApiAi] update_intent: name={name}'.format(name=name))
+
+        r = self._http.put(
+            '{url}intents/{id}'.format(url=self._base_url, id=intent_id),
+            headers=self._headers,
+            json=self._intent_payload(name, templates, action, parameters, fallback),
+            compress=True
+        )
+
+        result = r.json()
+
+        if r.status_code != 200:
+            raise ApiAiException(result['status'])
+
     def _remove_intent_byid(self, entity_id):
         logging.debug('[ApiAi] remove_intent_byid: id={id}'.format(id=entity_id))
 
-        r = requests.delete(
+        r = self._http.delete(
             '{url}intents/{id}'.format(url=self._base_url, id=entity_id),
             headers=self._headers,
         )
@@ -188,13 +290,8 @@ class ApiaiManager(ApiManager):
         if r.status_code != 200:
             raise ApiAiException(result['status'])
 
-    def _remove_intent_byname(self, name):
-        logging.debug('[ApiAi] remove_intent_byname: name={name}'.format(name=name))
-
-        intents = self._get_intents()
-        intent = intents.get(name)
-        if intent:
-            self._remove_intent_byid(intent['id'])
+    def _predict_one(self, x):
+        return self._query(x)['action']
 
     def _query(self, q):
         logging.debug(u'[ApiAi] query: q={q}'.format(q=q))
@@ -204,10 +301,11 @@ class ApiaiManager(ApiManager):
             'lang': 'en',
         }
 
-        r = requests.post(
+        r = self._http.post(
             '{url}query'.format(url=self._base_url),
             headers=self._headers,
-            json=payload
+            json=payload,
+            idempotent=True
         )
 
         result = r.json()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from api import ApiManager
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from settings import settings
+
+import logging
+import numpy as np
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LocalManager(ApiManager):
+    def __init__(self, fallback_name, threshold=0.3, C=10., max_ngram=4, n_workers=1):
+        """
+        Baseline trained in-process: tf-idf of the character n-grams of the sentences and a logistic regression.
+        No request is sent: it shows what a basic model reaches on the criteria, with no latency.
+
+        :param threshold: the fallback is returned when the probability of the best intent is below it
+        :param C: inverse of the regularization strength of the logistic regression
+        :param max_ngram: longest character n-gram used, from 1 to max_ngram characters
+        """
+        ApiManager.__init__(self, fallback_name, n_workers)
+        self.threshold = threshold
+        self.C = C
+        self.max_ngram = max_ngram
+        self._model = None
+        self._single_intent = None
+
+    def __repr__(self):
+        return 'local'
+
+    def fit(self, df_train):
+        sentences = [sentence.lower() for sentence in df_train['sentence']]
+        intents = list(df_train['intent'])
+        logger.debug('[local] fit on {} sentences'.format(len(sentences)))
+        self._model = None
+        self._single_intent = None
+        self.time_to_ready = 0.
+        if len(set(intents)) < 2:
+            # a classifier needs two classes: every sentence belongs to the only intent
+            self._single_intent = intents[0] if intents else self._fallback_name
+            return
+
+        self._model = Pipeline([
+            ('tfidf', TfidfVectorizer(analyzer='char_wb', ngram_range=(1, int(self.max_ngram)), sublinear_tf=True)),
+            ('classifier', LogisticRegression(C=float(self.C)))
+        ])
+        self._model.fit(sentences, intents)
+
+    def predict(self, sentences):
+        start = time.time()
+        intents = self._predict_batch([sentence.lower() for sentence in sentences])
+        # the sentences are classified together: each one is given an equal share of the time
+        self.latencies = [(time.time() - start) / max(1, len(sentences))] * len(sentences)
+        return intents
+
+    def _predict_batch(self, sentences):
+        if not sentences:
+            return []
+        if self._model is None:
+            return [self._single_intent or self._fallback_name] * len(sentences)
+
+        # the whole list is classified at once
+        probabilities = self._model.predict_proba(sentences)
+        best = probabilities.argmax(axis=1)
+        intents = self._model.classes_[best].tolist()
+        confident = probabilities[np.arange(len(sentences)), best] >= float(self.threshold)
+        return [intent if is_confident else self._fallback_name for intent, is_confident in zip(intents, confident)]
+
+    @classmethod
+    def get_parametors(cls):
+        return ['threshold', 'C', 'max_ngram']
+
+    @classmethod
+    def get_agents(cls, language):
+        # trained in-process: no credentials, every fold scored concurrently has its own model
+        return [{} for _ in range(max(1, settings.FOLD_WORKERS))]
+
+    @classmethod
+    def estimate_calls(cls, n_intents, n_train, n_test, n_probes=1):
+        # trained and queried in-process
+        return {'fit': 0, 'predict': 0, 'delete': 0}
+
+    @classmethod
+    def from_agent(cls, agent, fallback_name, language, params, n_workers=1):
+        return cls(fallback_name, **params)
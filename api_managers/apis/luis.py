@@ -1,19 +1,27 @@
 # -*- coding: utf-8 -*-
 
 # https://dev.projectoxford.ai/docs/services/56d95961e597ed0f04b76e58/operations/56f8a55119845511c81de488
-from api import ApiManager
+from api import ApiManager, as_list
+from api_managers import readiness
+from api_managers import transport
+from settings import credentials
+from settings import settings
 
 import json
-import requests
+import math
 import time
 
 
 class LuisManager(ApiManager):
-    def __init__(self, key, fallback_name, language='en-us', app_id=None):
-        ApiManager.__init__(self, fallback_name)
+    # culture of the app created for each language
+    CULTURES = {'en': 'en-us', 'fr': 'fr-fr'}
+
+    def __init__(self, key, fallback_name, language='en-us', app_id=None, n_workers=1):
+        ApiManager.__init__(self, fallback_name, n_workers)
         self._key = key
         self._language = language
         self._app_id = app_id
+        self._http = transport.get_transport('luis')
         if app_id is not None:
             self._api = ApiLuis(self._key, self._app_id)
         else:
@@ -23,39 +31,132 @@ class LuisManager(ApiManager):
         return 'luis'
 
     def fit(self, df_train):
-        self._clear()
-        X_train = df_train['sentence']
-        y_train = df_train['intent']
-        intents = set(y_train)
-        for intent in intents:
-            utterances = list(X_train[y_train == intent])
-            self._api.create_intent_with_utterances(intent, utterances)
+        if self._api is None:
+            self._clear()
+        utterances = self._utterances_by_intent(df_train)
+        added = self._sync(utterances)
 
         self._api.train()
-        while not self._api.is_trained():
-            time.sleep(1)
+        start = time.time()
+        readiness.wait_until_ready(self._api.is_trained, str(self))
         self._publish()
+        if added:
+            # the status tells the model is trained: the published endpoint only has to answer
+            readiness.wait_until_ready(readiness.prediction_probe(self._predict_one, added, any_answer=True),
+                                       str(self), required=False)
+        self.time_to_ready = time.time() - start
 
     def predict(self, x_list):
-        predictions = []
-        for i, x in enumerate(x_list):
-            intent = self._api.query(x)
-            if intent == 'None':
-                intent = self._fallback_name
-            predictions.append(intent)
-        return predictions
+        return self._predict_concurrently(self._predict_one, x_list)
+
+    def get_artifact(self):
+        if self._app_id is None:
+            return None
+        return {'app_id': self._app_id}
+
+    def load_artifact(self, artifact):
+        if not self._app_exists(artifact['app_id']):
+            return False
+        self._app_id = artifact['app_id']
+        self._api = ApiLuis(self._key, self._app_id)
+        return True
+
+    def detach_artifact(self):
+        # keep the current app: the next fit creates a new one
+        self._app_id = None
+        self._api = None
+
+    def release_artifact(self, artifact):
+        self._delete_app(artifact['app_id'])
 
     @classmethod
     def get_parametors(cls):
         return []
 
+    @classmethod
+    def get_agents(cls, language):
+        return [{'key': key} for key in as_list(credentials.LUIS_KEY)]
+
+    @classmethod
+    def estimate_calls(cls, n_intents, n_train, n_test, n_probes=1):
+        # new app, examples and intents listed, intents created, utterances by batches, train, status probes,
+        # publish and prediction probes. The app replaced (or evicted from the registry) is deleted
+        probe_calls = 3 * (n_probes - 1) + 1
+        n_batches = int(math.ceil(float(n_train) / ApiLuis.BATCH_SIZE))
+        return {'fit': 4 + n_intents + n_batches + n_probes + 1 + probe_calls, 'predict': n_test, 'delete': 1}
+
+    @classmethod
+    def from_agent(cls, agent, fallback_name, language, params, n_workers=1):
+        if language not in cls.CULTURES:
+            raise Exception('language {} is not handled by luis'.format(language))
+        return cls(agent['key'], fallback_name, cls.CULTURES[language], n_workers=n_workers, **params)
+
+    def _predict_one(self, x):
+        intent = self._api.query(x)
+        if intent == 'None':
+            intent = self._fallback_name
+        return intent
+
+    def _sync(self, utterances):
+        """
+        Update the app so that its intents and labeled utterances are exactly the ones given.
+        Only the utterances and intents which have been added or removed are sent, unless filling a new app
+        takes fewer requests than deleting the removed utterances one by one.
+
+        :param utterances: dictionary intent -> list of utterances
+        :return: dictionary intent -> list of the utterances added to it
+        """
+        # luis stores the utterances lowercased
+        expected = set()
+        for intent, intent_utterances in utterances.items():
+            for utterance in intent_utterances:
+                expected.add((intent, utterance.lower()))
+
+        labeled = set()
+        obsolete = []
+        for example in self._api.get_examples():
+            label = (example['IntentsResults']['Name'], example['utteranceText'].lower())
+            if label in expected and label not in labeled:
+                labeled.add(label)
+            else:
+                obsolete.append(example['exampleId'])
+
+        # every example is deleted by its own request: beyond a few, a new app is filled from scratch instead
+        n_batches = int(math.ceil(len(expected - labeled) / float(ApiLuis.BATCH_SIZE)))
+        n_rebatches = int(math.ceil(len(expected) / float(ApiLuis.BATCH_SIZE)))
+        if len(obsolete) + n_batches > 2 + len(utterances) + n_rebatches:
+            self._clear()
+            labeled = set()
+        else:
+            for example_id in obsolete:
+                self._api.delete_example(example_id)
+
+        remote_intents = self._api.get_intent_ids()
+        for intent, intent_id in remote_intents.items():
+            if intent not in utterances and intent != 'None':
+                self._api.delete_intent_byid(intent_id)
+
+        new_labels = []
+        added = {}
+        for intent, intent_utterances in utterances.items():
+            if intent not in remote_intents:
+                self._api.create_intent(name=intent)
+            for utterance in intent_utterances:
+                if (intent, utterance.lower()) not in labeled:
+                    labeled.add((intent, utterance.lower()))
+                    new_labels.append((intent, utterance))
+                    added.setdefault(intent, []).append(utterance)
+        self._api.new_utterances(new_labels)
+        return added
+
     def _clear(self):
         if self._api is not None:
             self._delete_app()
-        self._create_app(app_name='luis_app', lang=self._language)
+        # registered apps may be kept alongside the new one: names must be unique
+        self._create_app(app_name='luis_app_{}'.format(int(time.time() * 1000)), lang=self._language)
 
     def _create_app(self, app_name, lang='en-us'):
-        url = 'https://api.projectoxford.ai/luis/v1.0/prog/apps?subscription-key={0}'.format(self._key)
+        url = '{0}v1.0/prog/apps?subscription-key={1}'.format(settings.LUIS_URL, self._key)
         payload = {
             "Name": app_name,
             "Culture": lang,
@@ -64,7 +165,7 @@ class LuisManager(ApiManager):
             "NumberOfEntities": 0,
             "IsTrained": True
         }
-        resp = requests.post(url=url, data=payload)
+        resp = self._http.post(url=url, data=payload)
         app_id = resp.json()
         self._app_id = app_id
         self._api = ApiLuis(self._key, app_id)
@@ -77,14 +178,18 @@ class LuisManager(ApiManager):
             appId = self._app_id
         else:
             appId = appIdGiven
-        url = 'https://api.projectoxford.ai/luis/v1.0/prog/apps/{0}?subscription-key={1}'.format(
-            appId, self._key)
-        resp = requests.delete(url=url)
+        url = '{0}v1.0/prog/apps/{1}?subscription-key={2}'.format(settings.LUIS_URL, appId, self._key)
+        resp = self._http.delete(url=url)
         if appIdGiven == self._app_id:
             self._app_id = None
             self._api = None
         return resp
 
+    def _app_exists(self, app_id):
+        url = '{0}v1.0/prog/apps/{1}?subscription-key={2}'.format(settings.LUIS_URL, app_id, self._key)
+        resp = self._http.get(url=url)
+        return resp.status_code == 200
+
     def _publish(self, appIdGiven=None):
 
         if appIdGiven is None:
@@ -92,17 +197,20 @@ class LuisManager(ApiManager):
         else:
             appId = appIdGiven
 
-        url = 'https://api.projectoxford.ai/luis/v1.0/prog/apps/{0}/publish?subscription-key={1}'.format(
-            appId, self._key)
-        resp = requests.post(url=url)
+        url = '{0}v1.0/prog/apps/{1}/publish?subscription-key={2}'.format(settings.LUIS_URL, appId, self._key)
+        resp = self._http.post(url=url)
         return resp
 
 
 class ApiLuis(object):
+    # maximum number of labeled utterances luis accepts in one batch
+    BATCH_SIZE = 100
+
     def __init__(self, key, appId):
-        self._base_url = "https://api.projectoxford.ai/luis/"
+        self._base_url = settings.LUIS_URL
         self._key = key
         self._app_id = appId
+        self._http = transport.get_transport('luis')
 
     def get_intents(self, intent_type='name'):
         """
@@ -113,13 +221,48 @@ class ApiLuis(object):
         params = {
             'subscription-key': self._key
         }
-        resp = requests.get(url=url, params=params)
+        resp = self._http.get(url=url, params=params)
         resp = resp.json()
         intents = []
         for intent in resp:
             intents.append(intent[intent_type])
         return intents
 
+    def get_intent_ids(self):
+        """
+        :return: dictionary intent name -> intent id
+        """
+        url = '{0}v1.0/prog/apps/{1}/intents'.format(self._base_url, self._app_id)
+        params = {
+            'subscription-key': self._key
+        }
+        resp = self._http.get(url=url, params=params)
+        return dict((intent['name'], intent['id']) for intent in resp.json())
+
+    def get_examples(self, page_size=100):
+        """
+        :return: list of all the labeled utterances of the app
+        """
+        url = '{0}v1.0/prog/apps/{1}/examples'.format(self._base_url, self._app_id)
+        examples = []
+        while True:
+            params = {
+                'subscription-key': self._key,
+                'skip': len(examples),
+                'count': page_size
+            }
+            resp = self._http.get(url=url, params=params)
+            page = resp.json()
+            examples.extend(page)
+            if len(page) < page_size:
+                return examples
+
+    def delete_example(self, example_id):
+        url = '{0}v1.0/prog/apps/{1}/examples/{2}?&subscription-key={3}'.format(
+            self._base_url, self._app_id, example_id, self._key)
+        resp = self._http.delete(url)
+        return resp
+
     def query(self, txt, retry=2):
         url = '{0}v1/application'.format(self._base_url)
         params = {
@@ -127,7 +270,7 @@ class ApiLuis(object):
             'subscription-key': self._key,
             'q': txt
         }
-        resp = requests.get(url=url, params=params)
+        resp = self._http.get(url=url, params=params)
         resp = resp.json()
         try:
             return resp['intents'][0]['intent']
@@ -144,7 +287,7 @@ class ApiLuis(object):
             'Name': name,
             'Children': {}
         }
-        resp = requests.post(url=url, data=json.dumps(data))
+        resp = self._http.post(url=url, data=json.dumps(data))
         try:
             return resp.json()
         except ValueError as err:
@@ -158,7 +301,7 @@ class ApiLuis(object):
         params = {
             'subscription-key': self._key
         }
-        resp = requests.get(url=url, params=params)
+        resp = self._http.get(url=url, params=params)
         resp = resp.json()
         for intent in resp:
             if intent['name'].lower() == name_intent.lower():
@@ -169,7 +312,7 @@ class ApiLuis(object):
         url = '{0}v1.0/prog/apps/{1}/intents/{2}?&subscription-key={3}'.format(
             self._base_url, self._app_id, intent_id, self._key)
 
-        resp = requests.delete(url)
+        resp = self._http.delete(url)
         return resp
 
     def delete_intent_byname(self, name):
@@ -178,12 +321,12 @@ class ApiLuis(object):
 
     def train(self):
         url = '{0}v1.0/prog/apps/{1}/train?&subscription-key={2}'.format(self._base_url, self._app_id, self._key)
-        resp = requests.post(url)
+        resp = self._http.post(url)
         return resp
 
     def is_trained(self):
         url = '{0}v1.0/prog/apps/{1}/train?&subscription-key={2}'.format(self._base_url, self._app_id, self._key)
-        resp = requests.get(url)
+        resp = self._http.get(url)
         resp = resp.json()
         for model in resp:
             if model['Details']['Status'] not in ['Success', 'Up to date']:
@@ -197,9 +340,29 @@ class ApiLuis(object):
             "SelectedIntentName": intent_name,
             "EntityLabels": {}
         }
-        resp = requests.post(url=url, data=payload)
+        resp = self._http.post(url=url, data=payload)
         return resp
 
+    def new_utterances(self, labels):
+        """
+        Label utterances by batches of BATCH_SIZE
+
+        :param labels: list of (intent name, utterance)
+        :return: responses of the requests
+        """
+        url = '{0}v1.0/prog/apps/{1}/examples?&subscription-key={2}'.format(self._base_url, self._app_id, self._key)
+        responses = []
+        for start in range(0, len(labels), self.BATCH_SIZE):
+            payload = [
+                {
+                    "ExampleText": uterrance,
+                    "SelectedIntentName": intent_name,
+                    "EntityLabels": []
+                } for intent_name, uterrance in labels[start:start + self.BATCH_SIZE]
+            ]
+            responses.append(self._http.post(url=url, json=payload, compress=True))
+        return responses
+
     def create_intent_with_utterances(self, name, uterrances):
         """
 
@@ -209,5 +372,4 @@ class ApiLuis(object):
         """
 
         self.create_intent(name=name)
-        for utter in uterrances:
-            self.new_utterance(intent_name=name, uterrance=utter)
+        return self.new_utterances([(name, utter) for utter in uterrances])
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
 #  https://man.recast.ai/
-from api import ApiManager
+from api import ApiManager, as_list
+from api_managers import readiness
+from api_managers import transport
+from settings import credentials
+from settings import settings
 
 import logging
-import requests
+import math
 
 
 logger = logging.getLogger(__name__)
@@ -12,9 +16,12 @@ logger = logging.getLogger(__name__)
 
 
 class RecastManager(ApiManager):
-    def __init__(self, user_slug, bot_slug, token, language, fallback_name, strictness=50):
-        ApiManager.__init__(self, fallback_name)
-        self._base_url = 'https://api.recast.ai/v2'
+    # maximum number of expressions sent in one request
+    BATCH_SIZE = 100
+
+    def __init__(self, user_slug, bot_slug, token, language, fallback_name, strictness=50, n_workers=1):
+        ApiManager.__init__(self, fallback_name, n_workers)
+        self._base_url = settings.RECAST_URL
         self._user_slug = user_slug
         self._bot_slug = bot_slug
         self.strictness = strictness
@@ -24,33 +31,60 @@ class RecastManager(ApiManager):
             'Authorization': 'Token {}'.format(self._token)
         }
         self._language = language
+        self._http = transport.get_transport('recast')
         self._update_bot()
 
     def __repr__(self):
         return 'recast'
 
     def predict(self, sentences):
-        predictions = []
-        for sentence in sentences:
-            predictions.append(self._predict_one(sentence))
-        return predictions
+        return self._predict_concurrently(self._predict_one, sentences)
 
     def fit(self, df_train):
-        self._clear()
-        X_train = df_train['sentence']
-        y_train = df_train['intent']
-        intents = set(y_train)
-        for intent in intents:
-            utterances = list(X_train[y_train == intent])
-            self._create_intent(intent, utterances, self._language)
+        utterances = self._utterances_by_intent(df_train)
+        added = self._sync(utterances)
+
+        self.time_to_ready = 0.
+        if added:
+            self.time_to_ready = readiness.wait_until_ready(readiness.prediction_probe(self._predict_one, added),
+                                                            str(self), required=False)
+
+    def get_artifact(self):
+        return {'bot': '{}/{}'.format(self._user_slug, self._bot_slug)}
+
+    def load_artifact(self, artifact):
+        # a single bot is used: it still holds the model if nothing has been trained on it since
+        return artifact == self.get_artifact()
 
     @classmethod
     def get_parametors(cls):
         return ['strictness']
 
+    @classmethod
+    def get_agents(cls, language):
+        bot_slugs = as_list(credentials.RECAST_BOT_SLUG)
+        tokens = as_list(credentials.RECAST_TOKEN)
+        # recast finds the bot queried from the token: each bot is leased with its own token
+        if len(tokens) != len(bot_slugs):
+            raise Exception('RECAST_TOKEN must list the token of every bot of RECAST_BOT_SLUG')
+        return [{'bot_slug': bot_slug, 'token': token} for bot_slug, token in zip(bot_slugs, tokens)]
+
+    @classmethod
+    def estimate_calls(cls, n_intents, n_train, n_test, n_probes=1):
+        # bot updated, intents listed, expressions of each intent read, new expressions by batches,
+        # prediction probes. The expressions of the fold trained before are deleted
+        probe_calls = 3 * (n_probes - 1) + 1
+        n_batches = n_intents + int(math.ceil(float(n_train) / cls.BATCH_SIZE))
+        return {'fit': 2 + n_intents + n_batches + probe_calls, 'predict': n_test, 'delete': n_test}
+
+    @classmethod
+    def from_agent(cls, agent, fallback_name, language, params, n_workers=1):
+        return cls(credentials.RECAST_USER_SLUG, agent['bot_slug'], agent['token'], language, fallback_name,
+                   n_workers=n_workers, **params)
+
     def _update_bot(self):
 
-        response = requests.put(
+        response = self._http.put(
             url='{}'.format(self._url),
             json={
                 'name': self._bot_slug,
@@ -72,14 +106,15 @@ class RecastManager(ApiManager):
                 }
             )
 
-        response = requests.post(
+        response = self._http.post(
             url='{}/intents'.format(self._url),
             json={
                 'name': name,
                 'description': description,
                 'expressions': array
             },
-            headers=self._headers
+            headers=self._headers,
+            compress=True
         )
 
         try:
@@ -89,44 +124,122 @@ class RecastManager(ApiManager):
                 return self._create_intent(name, expressions, language, '', n_try=n_try + 1)
             raise Exception('no json could be decoded')
 
-    def _clear(self):
-        intent_slugs = self._get_intents_slug()
-        for slug in intent_slugs:
-            self._delete_intent_by_slug(slug)
+    def _sync(self, utterances):
+        """
+        Update the bot so that its intents and expressions are exactly the ones given.
+        Only the intents and expressions which have been added or removed are sent, unless creating an intent again
+        takes fewer requests than deleting its removed expressions one by one.
+
+        :param utterances: dictionary intent -> list of expressions
+        :return: dictionary intent -> list of the expressions added to it
+        """
+        remote_intents = self._get_intents()
+        for name, slug in remote_intents.items():
+            if name not in utterances:
+                self._delete_intent_by_slug(slug)
+
+        added = {}
+        for name, expressions in utterances.items():
+            slug = remote_intents.get(name)
+            if slug is None:
+                intent = self._create_intent(name, expressions[:self.BATCH_SIZE], self._language)
+                self._create_expressions(intent['results']['slug'], expressions[self.BATCH_SIZE:], self._language)
+                added[name] = expressions
+                continue
+
+            remote_expressions = {}
+            obsolete = []
+            expected_expressions = set(expressions)
+            for expression in self._get_expressions(slug):
+                if expression['language']['isocode'] == self._language and \
+                        expression['source'] in expected_expressions and \
+                        expression['source'] not in remote_expressions:
+                    remote_expressions[expression['source']] = expression['id']
+                else:
+                    # removed, other language or duplicate
+                    obsolete.append(expression['id'])
+            new_expressions = [expression for expression in expressions if expression not in remote_expressions]
+
+            # every expression is deleted by its own request: beyond a few, the intent is created again instead
+            n_batches = int(math.ceil(len(new_expressions) / float(self.BATCH_SIZE)))
+            n_rebatches = int(math.ceil(max(0, len(expressions) - self.BATCH_SIZE) / float(self.BATCH_SIZE)))
+            if len(obsolete) + n_batches > 2 + n_rebatches:
+                self._delete_intent_by_slug(slug)
+                intent = self._create_intent(name, expressions[:self.BATCH_SIZE], self._language)
+                self._create_expressions(intent['results']['slug'], expressions[self.BATCH_SIZE:], self._language)
+            else:
+                for expression_id in obsolete:
+                    self._delete_expression(slug, expression_id)
+                self._create_expressions(slug, new_expressions, self._language)
+            if new_expressions:
+                added[name] = new_expressions
+        return added
+
+    def _get_intents(self):
+        """
+        :return: dictionary intent name -> intent slug
+        """
+        logger.debug(u'Get all intents')
+        response = self._http.get(
+            url='{}/intents'.format(self._url),
+            headers=self._headers
+        )
+        return dict((intent['name'], intent['slug']) for intent in response.json()['results'])
 
-    def _delete_intent_by_slug(self, intent_slug):
-        logger.debug(u'Delete intent {0}'.format(intent_slug))
-        response = requests.delete(
+    def _get_expressions(self, intent_slug):
+        logger.debug(u'Get expressions of intent {0}'.format(intent_slug))
+        response = self._http.get(
             url='{}/intents/{}'.format(self._url, intent_slug),
             headers=self._headers
         )
-        return response.json()
+        return response.json()['results']['expressions']
+
+    def _create_expressions(self, intent_slug, expressions, language):
+        """
+        Add expressions to an intent by batches of BATCH_SIZE
+        """
+        responses = []
+        for start in range(0, len(expressions), self.BATCH_SIZE):
+            chunk = expressions[start:start + self.BATCH_SIZE]
+            logger.debug(u'Create {0} expressions for intent {1}'.format(len(chunk), intent_slug))
+            response = self._http.post(
+                url='{}/intents/{}/expressions/bulk_create'.format(self._url, intent_slug),
+                json={
+                    'expressions': [{'source': expression, 'language': {'isocode': language}}
+                                    for expression in chunk]
+                },
+                headers=self._headers,
+                compress=True
+            )
+            responses.append(response.json())
+        return responses
 
-    def _get_intents_slug(self):
-        logger.debug(u'Get all intents')
-        response = requests.get(
-            url='{}/intents'.format(self._url),
-            # url = 'https://api.recast.ai/v1/users/pytha/bots/test/intents',
+    def _delete_expression(self, intent_slug, expression_id):
+        logger.debug(u'Delete expression {0} of intent {1}'.format(expression_id, intent_slug))
+        response = self._http.delete(
+            url='{}/intents/{}/expressions/{}'.format(self._url, intent_slug, expression_id),
             headers=self._headers
         )
+        return response.json()
 
-        response = response.json()
-        intents = response['results']
-
-        intent_slugs = []
-        for intent in intents:
-            intent_slugs.append(intent['slug'])
-        return intent_slugs
+    def _delete_intent_by_slug(self, intent_slug):
+        logger.debug(u'Delete intent {0}'.format(intent_slug))
+        response = self._http.delete(
+            url='{}/intents/{}'.format(self._url, intent_slug),
+            headers=self._headers
+        )
+        return response.json()
 
     def _predict_one(self, sentence):
         logger.debug(u'Predict sentence {0}'.format(sentence))
-        response = requests.post(
+        response = self._http.post(
             url='{}/request'.format(self._base_url),
             data={
                 'text': sentence,
                 'language': self._language
             },
-            headers=self._headers
+            headers=self._headers,
+            idempotent=True
         )
         response = response.json()
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from settings import settings
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_budgets = {}
+_lock = threading.Lock()
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class CallBudget:
+    def __init__(self, provider, calls=None, period=None):
+        """
+        Count the requests sent to a provider and stop them once its quota is spent.
+
+        :param calls: maximum number of requests. None for no limit
+        :param period: if None, the requests are refused (BudgetExhausted) once calls have been sent.
+            Else at most calls requests are sent every period seconds: the requests beyond wait for the next period
+        """
+        self.provider = provider
+        self.calls = calls
+        self.period = period
+        self.spent = 0
+        self._period_start = None
+        self._period_spent = 0
+        self._lock = threading.Lock()
+
+    def spend(self):
+        """
+        Count a request, waiting if the quota of the current period is spent
+
+        :raise BudgetExhausted: the quota of the run is spent
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                if self.period is not None and (self._period_start is None or
+                                                now - self._period_start >= self.period):
+                    self._period_start = now
+                    self._period_spent = 0
+                if self.calls is None or (self.period is None and self.spent < self.calls) or \
+                        (self.period is not None and self._period_spent < self.calls):
+                    self.spent += 1
+                    self._period_spent += 1
+                    return
+                if self.period is None:
+                    raise BudgetExhausted('[{}] budget of {} requests exhausted: set RESUME to True to go on from the '
+                                          'last fold scored once the quota is renewed'.format(self.provider,
+                                                                                            self.calls))
+                wait = self._period_start + self.period - now
+            logger.info('[{}] {} requests sent in {}s: pause {:.1f}s'.format(self.provider, self.calls, self.period,
+                                                                            wait))
+            time.sleep(wait)
+
+
+def get_budget(provider):
+    """
+    Return the budget of the provider configured in settings.CALL_BUDGETS, creating it at first use
+    """
+    with _lock:
+        if provider not in _budgets:
+            budget = settings.CALL_BUDGETS.get(provider, {})
+            _budgets[provider] = CallBudget(provider, budget.get('calls'), budget.get('period'))
+        return _budgets[provider]
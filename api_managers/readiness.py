@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+from api_managers.budget import BudgetExhausted
+from settings import settings
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessTimeout(Exception):
+    pass
+
+
+def wait_until_ready(probe, name, timeout=None, initial_delay=None, max_delay=None, factor=2, required=True):
+    """
+    Call probe until it returns True, waiting exponentially longer between two calls.
+
+    :param probe: function without argument returning True once the model can be queried
+    :param name: name of the api, for logging
+    :param timeout: maximum number of seconds to wait. Defaults to settings.READINESS_TIMEOUT
+    :param initial_delay: seconds to wait after the first failed probe. Defaults to settings.READINESS_INITIAL_DELAY
+    :param max_delay: maximum seconds between two probes. Defaults to settings.READINESS_MAX_DELAY
+    :param factor: growth of the delay after each failed probe
+    :param required: if True, ReadinessTimeout is raised at the timeout. Else the model is assumed ready,
+        with a warning: a model which is live but answers the probes wrong must not abort the run
+    :return: number of seconds it took for the model to be ready
+    """
+    timeout = settings.READINESS_TIMEOUT if timeout is None else timeout
+    delay = settings.READINESS_INITIAL_DELAY if initial_delay is None else initial_delay
+    max_delay = settings.READINESS_MAX_DELAY if max_delay is None else max_delay
+
+    start = time.time()
+    n_probes = 0
+    while True:
+        n_probes += 1
+        if probe():
+            time_to_ready = time.time() - start
+            logger.debug('[{}] ready after {:.2f}s ({} probes)'.format(name, time_to_ready, n_probes))
+            return time_to_ready
+        elapsed = time.time() - start
+        if elapsed >= timeout:
+            if not required:
+                logger.warning('[{}] model not confirmed ready after {:.0f}s ({} probes): assumed ready'.format(
+                    name, elapsed, n_probes))
+                return elapsed
+            raise ReadinessTimeout('[{}] model not ready after {:.0f}s ({} probes)'.format(name, elapsed, n_probes))
+        time.sleep(min(delay, max_delay, timeout - elapsed))
+        delay *= factor
+
+
+def expected_probes(time_to_ready, initial_delay=None, max_delay=None, factor=2):
+    """
+    Number of probes wait_until_ready sends for a model ready after time_to_ready seconds (see planner)
+
+    :param time_to_ready: seconds, None if unknown: a single probe is then counted
+    """
+    delay = settings.READINESS_INITIAL_DELAY if initial_delay is None else initial_delay
+    max_delay = settings.READINESS_MAX_DELAY if max_delay is None else max_delay
+    n_probes = 1
+    waited = 0.
+    while time_to_ready is not None and waited < time_to_ready and waited < settings.READINESS_TIMEOUT:
+        waited += min(delay, max_delay)
+        delay *= factor
+        n_probes += 1
+    return n_probes
+
+
+def prediction_probe(predict_one, utterances, n_sentences=3, any_answer=False):
+    """
+    Build a probe which considers the model ready once it predicts the right intent
+    for at least one training sentence, or answers one of them differently than at the first probe:
+    the answer then comes from the new model, even if it is wrong.
+    The sentences must be new to their intent in this training (see the _sync of the managers):
+    the former model, still answering meanwhile, already predicts the others right.
+
+    :param predict_one: function returning the intent of a sentence
+    :param utterances: dictionary intent -> list of training sentences added to it by the training
+    :param n_sentences: number of training sentences (of distinct intents) tried at each probe
+    :param any_answer: if True, any answer is enough, for the apis whose status already tells the model is trained
+    """
+    sentences = [(intent, intent_utterances[0]) for intent, intent_utterances in sorted(utterances.items())
+                 if intent_utterances][:n_sentences]
+    first_answers = {}
+
+    def probe():
+        for intent, sentence in sentences:
+            try:
+                answer = predict_one(sentence)
+            except BudgetExhausted:
+                raise
+            except Exception as err:
+                logger.debug('probe failed: {}'.format(err))
+                continue
+            if any_answer or answer.lower() == intent.lower():
+                return True
+            if first_answers.setdefault(sentence, answer) != answer:
+                return True
+        return not sentences
+
+    return probe
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+from api_managers import budget
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3 import disable_warnings
+from settings import settings
+
+import gzip
+import io
+import json
+import logging
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_transports = {}
+_lock = threading.Lock()
+
+# methods sent again without any risk to apply them twice
+_IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE'}
+
+# Disable HTTPS warning
+disable_warnings()
+
+
+class Transport:
+    def __init__(self, provider, pool_size, headers=None, compress_threshold=None, retries=0, retry_delay=0.):
+        """
+        Keep-alive http transport shared by all the managers of one provider.
+
+        :param provider: name of the api using this transport
+        :param pool_size: maximum number of connections kept open to the provider
+        :param headers: headers sent with every request
+        :param compress_threshold:
+            size in bytes above which a compressible json payload is sent gzipped.
+            None disables the compression
+        :param retries: number of times a request answered with a server error (5xx) is sent again
+        :param retry_delay: seconds to wait before the first retry, doubled at each retry
+        """
+        self.provider = provider
+        self.compress_threshold = compress_threshold
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        if headers:
+            self._session.headers.update(headers)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def request(self, method, url, compress=False, idempotent=None, **kwargs):
+        """
+        Send a request through the pooled session.
+        With compress=True, a json payload bigger than compress_threshold is gzipped.
+        A request answered with a server error is sent again up to retries times, if it is idempotent.
+        Every request sent is counted in the budget of the provider (see settings.CALL_BUDGETS).
+
+        :param idempotent: True if the request can be sent again without side effect.
+            Defaults to True for GET, HEAD, PUT and DELETE: a POST is only retried if it only reads (a query)
+        """
+        if idempotent is None:
+            idempotent = method.upper() in _IDEMPOTENT_METHODS
+        if compress and kwargs.get('json') is not None:
+            kwargs = self._encode_json(kwargs)
+
+        retries = self.retries if idempotent else 0
+        delay = self.retry_delay
+        while True:
+            budget.get_budget(self.provider).spend()
+            response = self._session.request(method, url, **kwargs)
+            if response.status_code < 500 or retries <= 0:
+                return response
+            logger.debug('[{}] {} {} answered {}: retry in {:.2f}s'.format(self.provider, method, url,
+                                                                         response.status_code, delay))
+            retries -= 1
+            time.sleep(delay)
+            delay *= 2
+
+    def close(self):
+        self._session.close()
+
+    def _encode_json(self, kwargs):
+        body = json.dumps(kwargs.pop('json'))
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Content-Type'] = 'application/json'
+        if self.compress_threshold is not None and len(body) >= self.compress_threshold:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            logger.debug('[{}] gzip payload {} -> {} bytes'.format(self.provider, len(body), len(buf.getvalue())))
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        kwargs['data'] = body
+        kwargs['headers'] = headers
+        return kwargs
+
+
+def pool_size():
+    """
+    :return: settings.HTTP_POOL_SIZE, or by default one connection per query sent concurrently to a provider
+    """
+    if settings.HTTP_POOL_SIZE is not None:
+        return settings.HTTP_POOL_SIZE
+    # every fold scored concurrently queries the provider with PREDICT_WORKERS threads
+    return settings.PREDICT_WORKERS * max(1, settings.FOLD_WORKERS)
+
+
+def get_transport(provider):
+    """
+    Return the transport of the provider, creating it at first use
+    """
+    with _lock:
+        if provider not in _transports:
+            _transports[provider] = Transport(provider, pool_size(), settings.HTTP_HEADERS,
+                                              settings.HTTP_COMPRESS_THRESHOLD, settings.HTTP_RETRIES,
+                                              settings.HTTP_RETRY_DELAY)
+        return _transports[provider]
+
+
+def close_all():
+    with _lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
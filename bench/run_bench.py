@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of BUNT against the local stand-ins of the apis (see stand_ins).
+It measures the overhead and the throughput of the comparator and the parametor offline and repeatably,
+so that concurrency and caching changes can be compared.
+
+Run it from the root of the project:
+    python -m bench.run_bench --latency 0.05 --training-delay 1 --agents 2
+
+For each scenario, it reports the wall time, the number of sentences predicted per second,
+the time spent in every stage (summed over the threads), the http calls received by the stand-ins
+and the peak memory of the process.
+"""
+
+from api_managers import api_builder
+from api_managers import transport
+from api_managers.apis.apiai import ApiaiManager
+from api_managers.apis.luis import LuisManager
+from api_managers.apis.recast import RecastManager
+from bench.stand_ins import ApiaiStandIn, LuisStandIn, RecastStandIn
+from logging.config import dictConfig
+from settings import credentials
+from settings import settings
+from tools.comparator import Comparator
+from tools.model_registry import ModelRegistry
+from tools.parametor import Parametor
+from tools.prediction_cache import PredictionCache
+from tools.scorer import Scorer
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MANAGERS = {
+    'apiai': ApiaiManager,
+    'luis': LuisManager,
+    'recast': RecastManager
+}
+
+
+class StageTimer:
+    def __init__(self):
+        """
+        Time spent in the fit and predict methods of the managers, summed over the threads
+        """
+        self._lock = threading.Lock()
+        self._originals = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = {}
+            self.sentences = 0
+
+    def _add(self, api_name, stage, seconds, n_sentences=0):
+        with self._lock:
+            key = '{}.{}'.format(api_name, stage)
+            self.seconds[key] = self.seconds.get(key, 0) + seconds
+            self.sentences += n_sentences
+
+    def install(self):
+        for api_name, manager_class in MANAGERS.items():
+            self._wrap(api_name, manager_class, 'fit', lambda args: 0)
+            self._wrap(api_name, manager_class, 'predict', lambda args: len(args[0]))
+
+    def uninstall(self):
+        for manager_class, method_name, method in self._originals:
+            setattr(manager_class, method_name, method)
+        self._originals = []
+
+    def _wrap(self, api_name, manager_class, method_name, n_sentences):
+        method = getattr(manager_class, method_name)
+        timer = self
+
+        def timed(manager, *args):
+            start = time.time()
+            try:
+                return method(manager, *args)
+            finally:
+                timer._add(api_name, method_name, time.time() - start, n_sentences(args))
+
+        self._originals.append((manager_class, method_name, method))
+        setattr(manager_class, method_name, timed)
+
+
+class _Logs:
+    """
+    Stand-in of the manager given to the scorer: the predictions are not logged
+    """
+
+    def log_success(self, api_name, sentence, intent_to_find):
+        pass
+
+    def log_fallback(self, api_name, sentence, intent_to_find):
+        pass
+
+    def log_error(self, api_name, sentence, intent_to_find, intent_found):
+        pass
+
+
+def configure(stand_ins, n_agents):
+    """
+    Point the settings and the credentials to the stand-ins
+    """
+    settings.APIAI_URL = stand_ins['apiai'].url
+    settings.LUIS_URL = stand_ins['luis'].url
+    settings.RECAST_URL = stand_ins['recast'].url
+    settings.READINESS_INITIAL_DELAY = 0.05
+    settings.READINESS_MAX_DELAY = 1
+
+    agents = ['bench_{}'.format(i) for i in range(n_agents)]
+    credentials.APIAI_TOKENS = {'en': ['en_{}'.format(agent) for agent in agents],
+                                'fr': ['fr_{}'.format(agent) for agent in agents]}
+    credentials.LUIS_KEY = agents
+    credentials.RECAST_USER_SLUG = 'bench'
+    # as recast, the stand-in finds the bot queried from the token: every bot has its own
+    credentials.RECAST_BOT_SLUG = agents
+    credentials.RECAST_TOKEN = ['token_{}'.format(agent) for agent in agents]
+
+
+def build_scorer(folder, use_cache):
+    cache = None
+    registry = None
+    if use_cache:
+        cache = PredictionCache(os.path.join(folder, 'predictions.sqlite'), settings.PREDICTION_CACHE_SIZE)
+        registry = ModelRegistry(os.path.join(folder, 'models.json'), settings.MODEL_REGISTRY_SIZE,
+                                 settings.MODEL_REGISTRY_KEEP_MODELS)
+    return Scorer(_Logs(), settings.METRICS, settings.FALLBACK_NAME, cache=cache, registry=registry,
+                  fold_workers=settings.FOLD_WORKERS, n_bootstrap=settings.BOOTSTRAP_RESAMPLES,
+                  confidence=settings.BOOTSTRAP_CONFIDENCE)
+
+
+def run_scenario(name, func, timer, stand_ins):
+    """
+    :return: report of the scenario
+    """
+    timer.reset()
+    calls_before = dict((api_name, dict(stand_in.calls)) for api_name, stand_in in stand_ins.items())
+    start = time.time()
+    func()
+    wall_time = time.time() - start
+
+    calls = {}
+    for api_name, stand_in in stand_ins.items():
+        for endpoint, n_calls in stand_in.calls.items():
+            n_calls -= calls_before[api_name].get(endpoint, 0)
+            if n_calls:
+                calls['{}.{}'.format(api_name, endpoint)] = n_calls
+    return {
+        'scenario': name,
+        'wall_time': wall_time,
+        'sentences': timer.sentences,
+        'sentences_per_second': timer.sentences / wall_time if wall_time else 0.,
+        'stages': dict(timer.seconds),
+        'http_calls': calls,
+        # kilobytes on linux
+        'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def print_report(report):
+    print('{scenario}: {wall_time:.2f}s wall, {sentences} sentences, {sentences_per_second:.1f} sentences/s, '
+          'peak memory {peak_memory_kb} kB'.format(**report))
+    for stage, seconds in sorted(report['stages'].items()):
+        print('\t{:<20} {:8.2f}s'.format(stage, seconds))
+    for endpoint, n_calls in sorted(report['http_calls'].items()):
+        print('\t{:<35} {:6} calls'.format(endpoint, n_calls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BUNT against local stand-ins of the apis')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds waited by the stand-ins per request')
+    parser.add_argument('--error-rate', type=float, default=0., help='probability of an error per prediction')
+    parser.add_argument('--training-delay', type=float, default=0.2, help='seconds before a trained model is ready')
+    parser.add_argument('--agents', type=int, default=1, help='number of agents of each api')
+    parser.add_argument('--apis', default='apiai,luis,recast', help='apis compared')
+    parser.add_argument('--languages', default='en,fr', help='languages of the criteria')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='number of runs of each scenario, to measure the benefit of the caches')
+    parser.add_argument('--cache', action='store_true', help='use the prediction cache and the model registry')
+    parser.add_argument('--output', help='json file where the reports are written')
+    args = parser.parse_args()
+
+    dictConfig(settings.LOGGING)
+    logging.getLogger().setLevel(logging.WARNING)
+    folder = tempfile.mkdtemp(prefix='bunt_bench_')
+    stand_in_params = {'latency': args.latency, 'error_rate': args.error_rate,
+                       'training_delay': args.training_delay}
+    stand_ins = {
+        'apiai': ApiaiStandIn(**stand_in_params).start(),
+        'luis': LuisStandIn(**stand_in_params).start(),
+        'recast': RecastStandIn(**stand_in_params).start()
+    }
+    timer = StageTimer()
+    timer.install()
+    reports = []
+    try:
+        configure(stand_ins, args.agents)
+        criteria = dict((language, settings.CRITERIA[language]) for language in args.languages.split(','))
+        apis = args.apis.split(',')
+        scorer = build_scorer(folder, args.cache)
+
+        def compare():
+            Comparator(criteria, apis, scorer, settings.FALLBACK_NAME, settings.COMPARATOR_WORKERS,
+                       settings.API_CONCURRENCY).compare()
+            api_builder.release_artifacts(scorer.registry)
+
+        def score_parameters():
+            api_builder.check_params('recast', settings.PARAMS)
+            Parametor('recast', criteria, scorer, settings.FALLBACK_NAME, settings.PARAMETOR_WORKERS,
+                      settings.PARAMETOR_SEARCH, settings.PARAMETOR_RANDOM_CANDIDATES,
+                      settings.PARAMETOR_HALVING_RATE if settings.PARAMETOR_HALVING else None
+                      ).score_parameter_for_language(settings.PARAMS)
+            api_builder.release_artifacts(scorer.registry)
+
+        for run in range(args.repeat):
+            for name, func in [('comparator', compare), ('parametor', score_parameters)]:
+                report = run_scenario('{} #{}'.format(name, run + 1), func, timer, stand_ins)
+                print_report(report)
+                reports.append(report)
+    finally:
+        timer.uninstall()
+        transport.close_all()
+        for stand_in in stand_ins.values():
+            stand_in.stop()
+        shutil.rmtree(folder)
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
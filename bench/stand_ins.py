@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local http stand-ins of the apis, speaking the subset of their endpoints used by the managers.
+
+The stand-ins learn the training sentences and predict the intent of the training sentence
+sharing the most words with the query. Their latency, error rate and training delay are configurable,
+so that the overhead and the throughput of BUNT can be measured offline.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import namedtuple
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+
+import gzip
+import io
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Model:
+    def __init__(self, training_delay):
+        """
+        Intents and sentences known by an agent. The model is ready training_delay seconds after its last change
+        """
+        self.training_delay = training_delay
+        self.intents = {}
+        self.changed_at = time.time()
+
+    def changed(self):
+        self.changed_at = time.time()
+
+    def is_ready(self):
+        return time.time() - self.changed_at >= self.training_delay
+
+    def predict(self, sentence):
+        """
+        :return: the intent of the training sentence sharing the most words with the sentence,
+            None if no sentence shares half of its words or if the model is not ready
+        """
+        if not self.is_ready():
+            return None
+        words = set(sentence.lower().split())
+        best_intent, best_score = None, 0.5
+        for intent, sentences in self.intents.items():
+            for training_sentence in sentences:
+                training_words = set(training_sentence.lower().split())
+                if not training_words or not words:
+                    continue
+                score = len(words & training_words) / float(len(words | training_words))
+                if score >= best_score:
+                    best_intent, best_score = intent, score
+        return best_intent
+
+
+Request = namedtuple('Request', ['query', 'body', 'token'])
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # endpoints of the api: list of (method, path regex, name of the handler method)
+    routes = []
+
+    def __init__(self, latency=0., error_rate=0., training_delay=0., random_state=42):
+        """
+        :param latency: seconds waited before answering each request
+        :param error_rate: probability to answer a prediction request with an http 500 error
+        :param training_delay: seconds after the last change of the training data before the model is ready
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.training_delay = training_delay
+        self.lock = threading.Lock()
+        self.calls = {}
+        self._random = random.Random(random_state)
+        self._ids = itertools.count(1)
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def new_id(self):
+        with self.lock:
+            return str(next(self._ids))
+
+    def fails(self):
+        with self.lock:
+            return self._random.random() < self.error_rate
+
+    def dispatch(self, method, path, request):
+        """
+        :return: (http status, json response) of the handler of the endpoint
+        """
+        for route_method, pattern, handler in self.routes:
+            match = re.match('^{}$'.format(pattern), path)
+            if route_method == method and match:
+                with self.lock:
+                    self.calls[handler] = self.calls.get(handler, 0) + 1
+                time.sleep(self.latency)
+                return getattr(self, handler)(request, *match.groups())
+        return 404, {'message': 'unknown endpoint {} {}'.format(method, path)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, as the real apis: the connections of the transport pool are reused
+    protocol_version = 'HTTP/1.1'
+    # the response is sent in one write: small unbuffered writes are delayed by the tcp stack
+    wbufsize = -1
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            body = dict((key, values[0].decode('utf-8')) for key, values in parse_qs(body).items())
+        # the agent (api.ai) or the bot (recast) queried is identified by the Authorization header
+        request = Request(query, body, self.headers.get('Authorization'))
+        status, response = self.server.dispatch(method, url.path, request)
+        payload = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class ApiaiStandIn(StandInServer):
+    routes = [
+        ('GET', '/v1/intents', 'get_intents'),
+        ('POST', '/v1/intents', 'create_intent'),
+        ('GET', '/v1/intents/([^/]+)', 'get_intent'),
+        ('PUT', '/v1/intents/([^/]+)', 'update_intent'),
+        ('DELETE', '/v1/intents/([^/]+)', 'delete_intent'),
+        ('POST', '/v1/query', 'query'),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        StandInServer.__init__(self, *args, **kwargs)
+        # one agent per token: token -> (model, intent id -> intent)
+        self.agents = {}
+
+    @property
+    def url(self):
+        return '{}/v1/'.format(StandInServer.url.fget(self))
+
+    def _agent(self, token):
+        with self.lock:
+            if token not in self.agents:
+                self.agents[token] = (Model(self.training_delay), {})
+            return self.agents[token]
+
+    @staticmethod
+    def _ok(result=None):
+        response = {'status': {'code': 200}}
+        if result:
+            response.update(result)
+        return 200, response
+
+    def _sync_model(self, model, intents):
+        model.intents = dict((intent['name'], intent['templates']) for intent in intents.values()
+                             if not intent['fallbackIntent'])
+        model.changed()
+
+    def get_intents(self, request):
+        model, intents = self._agent(request.token)
+        with self.lock:
+            return 200, [{'id': intent_id, 'name': intent['name']} for intent_id, intent in intents.items()]
+
+    def get_intent(self, request, intent_id):
+        model, intents = self._agent(request.token)
+        if intent_id not in intents:
+            return 404, {'status': {'code': 404, 'errorType': 'not_found'}}
+        intent = dict(intents[intent_id])
+        intent['id'] = intent_id
+        return 200, intent
+
+    def create_intent(self, request):
+        model, intents = self._agent(request.token)
+        intent_id = self.new_id()
+        with self.lock:
+            intents[intent_id] = request.body
+            self._sync_model(model, intents)
+        return self._ok({'id': intent_id})
+
+    def update_intent(self, request, intent_id):
+        model, intents = self._agent(request.token)
+        with self.lock:
+            intents[intent_id] = request.body
+            self._sync_model(model, intents)
+        return self._ok()
+
+    def delete_intent(self, request, intent_id):
+        model, intents = self._agent(request.token)
+        with self.lock:
+            intents.pop(intent_id, None)
+            self._sync_model(model, intents)
+        return self._ok()
+
+    def query(self, request):
+        if self.fails():
+            return 500, {'status': {'code': 500, 'errorType': 'internal_error'}}
+        model, intents = self._agent(request.token)
+        intent = model.predict(request.body['query'])
+        if intent is None:
+            with self.lock:
+                fallbacks = [intent['name'] for intent in intents.values() if intent['fallbackIntent']]
+            intent = fallbacks[0] if fallbacks else 'input.unknown'
+        return self._ok({'result': {'action': intent}})
+
+
+class LuisStandIn(StandInServer):
+    routes = [
+        ('POST', '/luis/v1.0/prog/apps', 'create_app'),
+        ('GET', '/luis/v1.0/prog/apps/([^/]+)', 'get_app'),
+        ('DELETE', '/luis/v1.0/prog/apps/([^/]+)', 'delete_app'),
+        ('POST', '/luis/v1.0/prog/apps/([^/]+)/publish', 'publish'),
+        ('GET', '/luis/v1.0/prog/apps/([^/]+)/intents', 'get_intents'),
+        ('POST', '/luis/v1.0/prog/apps/([^/]+)/intents', 'create_intent'),
+        ('DELETE', '/luis/v1.0/prog/apps/([^/]+)/intents/([^/]+)', 'delete_intent'),
+        ('GET', '/luis/v1.0/prog/apps/([^/]+)/examples', 'get_examples'),
+        ('POST', '/luis/v1.0/prog/apps/([^/]+)/examples', 'add_examples'),
+        ('POST', '/luis/v1.0/prog/apps/([^/]+)/example', 'add_example'),
+        ('DELETE', '/luis/v1.0/prog/apps/([^/]+)/examples/([^/]+)', 'delete_example'),
+        ('POST', '/luis/v1.0/prog/apps/([^/]+)/train', 'train'),
+        ('GET', '/luis/v1.0/prog/apps/([^/]+)/train', 'training_status'),
+        ('GET', '/luis/v1/application', 'query'),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        StandInServer.__init__(self, *args, **kwargs)
+        # app id -> {'model', 'intents': {id: name}, 'examples': {id: (intent, text)}, 'trained_at'}
+        self.apps = {}
+
+    @property
+    def url(self):
+        return '{}/luis/'.format(StandInServer.url.fget(self))
+
+    def _app(self, app_id):
+        with self.lock:
+            return self.apps.get(app_id)
+
+    def create_app(self, request):
+        app_id = self.new_id()
+        app = {'model': Model(self.training_delay), 'intents': {self.new_id(): 'None'}, 'examples': {}}
+        with self.lock:
+            self.apps[app_id] = app
+        return 201, app_id
+
+    def get_app(self, request, app_id):
+        if self._app(app_id) is None:
+            return 404, {'message': 'unknown app'}
+        return 200, {'id': app_id}
+
+    def delete_app(self, request, app_id):
+        with self.lock:
+            self.apps.pop(app_id, None)
+        return 200, {}
+
+    def publish(self, request, app_id):
+        return 200, {}
+
+    def get_intents(self, request, app_id):
+        app = self._app(app_id)
+        return 200, [{'id': intent_id, 'name': name} for intent_id, name in app['intents'].items()]
+
+    def create_intent(self, request, app_id):
+        intent_id = self.new_id()
+        self._app(app_id)['intents'][intent_id] = request.body['Name']
+        return 201, intent_id
+
+    def delete_intent(self, request, app_id, intent_id):
+        self._app(app_id)['intents'].pop(intent_id, None)
+        return 200, {}
+
+    def get_examples(self, request, app_id):
+        examples = sorted(self._app(app_id)['examples'].items(), key=lambda item: int(item[0]))
+        skip, count = int(request.query.get('skip', 0)), int(request.query.get('count', 100))
+        return 200, [{'exampleId': example_id, 'utteranceText': text, 'IntentsResults': {'Name': intent}}
+                     for example_id, (intent, text) in examples[skip:skip + count]]
+
+    def _add_example(self, app_id, example):
+        app = self._app(app_id)
+        example_id = self.new_id()
+        app['examples'][example_id] = (example['SelectedIntentName'], example['ExampleText'].lower())
+        return example_id
+
+    def add_examples(self, request, app_id):
+        return 201, [{'value': {'ExampleId': self._add_example(app_id, example)}} for example in request.body]
+
+    def add_example(self, request, app_id):
+        return 201, {'ExampleId': self._add_example(app_id, request.body)}
+
+    def delete_example(self, request, app_id, example_id):
+        self._app(app_id)['examples'].pop(example_id, None)
+        return 200, {}
+
+    def train(self, request, app_id):
+        app = self._app(app_id)
+        intents = {}
+        for intent, text in app['examples'].values():
+            if intent != 'None':
+                intents.setdefault(intent, []).append(text)
+        app['model'].intents = intents
+        app['model'].changed()
+        return 202, {}
+
+    def training_status(self, request, app_id):
+        app = self._app(app_id)
+        status = 'Success' if app['model'].is_ready() else 'InProgress'
+        return 200, [{'ModelId': intent_id, 'Details': {'Status': status}} for intent_id in app['intents']]
+
+    def query(self, request):
+        if self.fails():
+            return 500, {'message': 'internal error'}
+        app = self._app(request.query['id'])
+        if app is None:
+            return 404, {'message': 'unknown app'}
+        intent = app['model'].predict(request.query['q'].decode('utf-8'))
+        return 200, {'query': request.query['q'], 'intents': [{'intent': intent or 'None', 'score': 1.}]}
+
+
+class RecastStandIn(StandInServer):
+    routes = [
+        ('PUT', '/v2/users/([^/]+)/bots/([^/]+)', 'update_bot'),
+        ('GET', '/v2/users/([^/]+)/bots/([^/]+)/intents', 'get_intents'),
+        ('POST', '/v2/users/([^/]+)/bots/([^/]+)/intents', 'create_intent'),
+        ('GET', '/v2/users/([^/]+)/bots/([^/]+)/intents/([^/]+)', 'get_intent'),
+        ('DELETE', '/v2/users/([^/]+)/bots/([^/]+)/intents/([^/]+)', 'delete_intent'),
+        ('POST', '/v2/users/([^/]+)/bots/([^/]+)/intents/([^/]+)/expressions/bulk_create', 'create_expressions'),
+        ('DELETE', '/v2/users/([^/]+)/bots/([^/]+)/intents/([^/]+)/expressions/([^/]+)', 'delete_expression'),
+        ('POST', '/v2/request', 'request'),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        StandInServer.__init__(self, *args, **kwargs)
+        # (user, bot) -> {'model', 'intents': {slug: {'name', 'expressions': {id: expression}}}}
+        self.bots = {}
+        self._bot_tokens = {}
+
+    @property
+    def url(self):
+        return '{}/v2'.format(StandInServer.url.fget(self))
+
+    def _bot(self, user, bot):
+        with self.lock:
+            if (user, bot) not in self.bots:
+                self.bots[(user, bot)] = {'model': Model(self.training_delay), 'intents': {}}
+            return self.bots[(user, bot)]
+
+    def _sync_model(self, bot):
+        bot['model'].intents = dict((slug, [expression['source'] for expression in intent['expressions'].values()])
+                                    for slug, intent in bot['intents'].items())
+        bot['model'].changed()
+
+    def update_bot(self, request, user, bot):
+        self._bot(user, bot)
+        # recast predicts with the token of the bot: the last bot updated is the one queried
+        with self.lock:
+            self._bot_tokens[request.token] = (user, bot)
+        return 200, {'results': {'slug': bot}}
+
+    def get_intents(self, request, user, bot):
+        intents = self._bot(user, bot)['intents']
+        return 200, {'results': [{'name': intent['name'], 'slug': slug} for slug, intent in intents.items()]}
+
+    def get_intent(self, request, user, bot, slug):
+        intent = self._bot(user, bot)['intents'][slug]
+        expressions = [dict(expression, id=expression_id) for expression_id, expression in
+                       intent['expressions'].items()]
+        return 200, {'results': {'name': intent['name'], 'slug': slug, 'expressions': expressions}}
+
+    def _add_expressions(self, bot, slug, expressions):
+        for expression in expressions:
+            bot['intents'][slug]['expressions'][self.new_id()] = expression
+        self._sync_model(bot)
+
+    def create_intent(self, request, user, bot):
+        recast_bot = self._bot(user, bot)
+        slug = request.body['name'].lower()
+        recast_bot['intents'][slug] = {'name': request.body['name'], 'expressions': {}}
+        self._add_expressions(recast_bot, slug, request.body['expressions'])
+        return 201, {'results': {'name': request.body['name'], 'slug': slug}}
+
+    def delete_intent(self, request, user, bot, slug):
+        recast_bot = self._bot(user, bot)
+        recast_bot['intents'].pop(slug, None)
+        self._sync_model(recast_bot)
+        return 200, {'results': None}
+
+    def create_expressions(self, request, user, bot, slug):
+        self._add_expressions(self._bot(user, bot), slug, request.body['expressions'])
+        return 201, {'results': request.body['expressions']}
+
+    def delete_expression(self, request, user, bot, slug, expression_id):
+        recast_bot = self._bot(user, bot)
+        recast_bot['intents'][slug]['expressions'].pop(expression_id, None)
+        self._sync_model(recast_bot)
+        return 200, {'results': None}
+
+    def request(self, request):
+        if self.fails():
+            return 500, {'results': None, 'message': 'internal error'}
+        with self.lock:
+            bot = self._bot_tokens.get(request.token)
+        intent = self._bot(*bot)['model'].predict(request.body['text']) if bot else None
+        return 200, {'results': {'intents': [{'slug': intent}] if intent else []}}
@@ -1,31 +1,68 @@
 # -*- coding: utf-8 -*-
 
 from api_managers import api_builder
+from tools.checkpoint import Checkpoint
 from tools.comparator import Comparator
+from tools.log_sink import LogSink
+from tools.model_registry import ModelRegistry
 from tools.parametor import Parametor
+from tools.planner import Planner
+from tools.prediction_cache import PredictionCache
+from tools.result_store import ResultStore
 from tools.scorer import Scorer
+from tools.streamer import Streamer
+from tools import folds as fold_splits
 from tools import loader
+from tools import metrics as metric_registry
+from tools import plugins
+from tools import prediction_store
 from settings import settings
 
 import json
 import logging
-import operator
 import os
 
 logger = logging.getLogger(__name__)
 
 
 class Manager:
-    def __init__(self):
+    def __init__(self, dry_run=False):
+        """
+        :param dry_run: if True, the manager does not query the apis (see plan and rescore): the checkpoint
+            and the logs of the former run are kept as they are
+        """
+        plugins.load(settings.PLUGINS_FOLDER, settings.PLUGINS)
         self._comparator = None
         self._parametor = None
-        self._scorer = Scorer(self, settings.METRICS, settings.FALLBACK_NAME)
-        self._clean_logs()
+        cache = None
+        if settings.USE_PREDICTION_CACHE:
+            cache = PredictionCache(settings.PREDICTION_CACHE_FILE, settings.PREDICTION_CACHE_SIZE)
+        registry = None
+        if settings.USE_MODEL_REGISTRY:
+            registry = ModelRegistry(settings.MODEL_REGISTRY_FILE, settings.MODEL_REGISTRY_SIZE,
+                                     settings.MODEL_REGISTRY_KEEP_MODELS)
+        self._registry = registry
+        # every scored fold is stored at once: with settings.RESUME, the folds of the former run are not scored again
+        self._checkpoint = Checkpoint(settings.CHECKPOINT_FILE, resume=settings.RESUME or dry_run)
+        self._scorer = Scorer(self, settings.METRICS, settings.FALLBACK_NAME, cache=cache, registry=registry,
+                              fold_workers=settings.FOLD_WORKERS, n_bootstrap=settings.BOOTSTRAP_RESAMPLES,
+                              confidence=settings.BOOTSTRAP_CONFIDENCE, checkpoint=self._checkpoint)
+        self._store = ResultStore(settings.RESULT_STORE_FILE, settings.PREDICTIONS_FOLDER)
+        self._log_success = None
+        self._log_fallback = None
+        self._log_error = None
+        self._open_logs(append=settings.RESUME or dry_run)
 
     def compare(self):
         self._check_comparator_settings()
+        run = self._store.start_run('comparator', self._run_config(apis=settings.APIS))
+        previous = None
+        if settings.COMPARATOR_INCREMENTAL and os.path.isfile(settings.COMPARATOR_RESULT_FILE):
+            with open(settings.COMPARATOR_RESULT_FILE, 'rb') as f:
+                previous = json.load(f)
         self._comparator = Comparator(settings.CRITERIA, settings.APIS, self._scorer,
-                                      settings.FALLBACK_NAME)
+                                      settings.FALLBACK_NAME, settings.COMPARATOR_WORKERS,
+                                      settings.API_CONCURRENCY, run, previous)
         self._comparator.compare()
         results = self._comparator.results
         with open(settings.COMPARATOR_RESULT_FILE, 'wb') as f:
@@ -33,30 +70,122 @@ class Manager:
 
     def score_parameters(self):
         self._check_parametor_settings()
-        self._parametor = Parametor(settings.API, settings.CRITERIA, self._scorer, settings.FALLBACK_NAME)
-        results = self._parametor.score_parameter_for_language(settings.PARAMS)
-        results = self._show_parametor_results(results)
+        halving_rate = settings.PARAMETOR_HALVING_RATE if settings.PARAMETOR_HALVING else None
+        run = self._store.start_run('parametor', self._run_config(api=settings.API, params=settings.PARAMS,
+                                                                  search=settings.PARAMETOR_SEARCH,
+                                                                  halving_rate=halving_rate))
+        self._parametor = Parametor(settings.API, settings.CRITERIA, self._scorer, settings.FALLBACK_NAME,
+                                    settings.PARAMETOR_WORKERS, settings.PARAMETOR_SEARCH,
+                                    settings.PARAMETOR_RANDOM_CANDIDATES, halving_rate, run=run)
+        self._parametor.score_parameter_for_language(settings.PARAMS)
+        results = self._show_parametor_results(run.run_id)
         with open(settings.PARAMETOR_RESULT_FILE, 'wb') as f:
             f.write(json.dumps(results))
 
+    def plan(self):
+        """
+        Dry run of settings.PLANNER_ACTION: estimate the requests it would send to every api and its duration,
+        from the criteria, the caches and the timings measured by the former comparison
+        """
+        self._check_planner_settings()
+        timings = {}
+        if os.path.isfile(settings.COMPARATOR_RESULT_FILE):
+            with open(settings.COMPARATOR_RESULT_FILE, 'rb') as f:
+                former_results = json.load(f)
+            for language in former_results:
+                for criterion in former_results[language]:
+                    for api, result in former_results[language][criterion].items():
+                        timings.setdefault(api, []).append(result.get('timing'))
+        planner = Planner(self._scorer, settings.FALLBACK_NAME, timings, settings.CALL_BUDGETS)
+        logger.info('Planner ({}) :'.format(settings.PLANNER_ACTION))
+        if settings.PLANNER_ACTION == 'comparator':
+            plan = planner.plan_comparator(settings.CRITERIA, settings.APIS)
+        else:
+            halving_rate = settings.PARAMETOR_HALVING_RATE if settings.PARAMETOR_HALVING else None
+            parametor = Parametor(settings.API, settings.CRITERIA, self._scorer, settings.FALLBACK_NAME,
+                                  settings.PARAMETOR_WORKERS, settings.PARAMETOR_SEARCH,
+                                  settings.PARAMETOR_RANDOM_CANDIDATES, halving_rate)
+            plan = planner.plan_parametor(settings.API, settings.CRITERIA, settings.PARAMS, parametor)
+        with open(settings.PLANNER_RESULT_FILE, 'wb') as f:
+            f.write(json.dumps(plan))
+
+    def rescore(self):
+        """
+        Score settings.RESCORE_RUN again with the metrics and the fallback intent of the settings,
+        from its persisted predictions
+        """
+        self._check_rescore_settings()
+        run_id = settings.RESCORE_RUN
+        if run_id is None:
+            run_id = self._store.last_predictions_run()
+        run = self._store.get_run(run_id) if run_id is not None else None
+        if run is None or run[0] not in ['comparator', 'parametor']:
+            raise Exception('no predictions of the comparator or the parametor kept for run {}'.format(run_id))
+        action, config = run
+
+        logger.info('Rescore of run {} ({}) :'.format(run_id, action))
+        scorer = Scorer(self, settings.METRICS, settings.FALLBACK_NAME,
+                        n_fold=config.get('n_fold', self._scorer.n_fold),
+                        random_state=config.get('random_state', self._scorer.random_state),
+                        n_bootstrap=settings.BOOTSTRAP_RESAMPLES, confidence=settings.BOOTSTRAP_CONFIDENCE)
+        config.update({'source_run': run_id, 'metrics': settings.METRICS, 'fallback_name': settings.FALLBACK_NAME})
+        rescore_run = self._store.start_run('rescore', config, keep_predictions=False)
+        units = []
+        for language, criterion, api, parameter, value, fold, path in self._store.predictions(run_id):
+            if not units or units[-1][0] != (language, criterion, api, parameter, value):
+                units.append(((language, criterion, api, parameter, value), []))
+            predictions, timing = prediction_store.read(path)
+            fold_result = scorer.rescore_fold(predictions, timing)
+            fold_result['fold'] = fold
+            units[-1][1].append(fold_result)
+
+        results = {}
+        for (language, criterion, api, parameter, value), fold_results in units:
+            result = scorer.aggregate(fold_results)
+            rescore_run.record(language, criterion, api, fold_results, result['confidence_intervals'], parameter,
+                               value)
+            if action == 'comparator':
+                # scores, risk_rate, counts, intents, confidence_intervals and timing, as the comparator
+                results.setdefault(language, {}).setdefault(criterion, {})[api] = result
+        if action == 'parametor':
+            results = self._show_parametor_results(rescore_run.run_id)
+        with open(settings.RESCORE_RESULT_FILE, 'wb') as f:
+            f.write(json.dumps(results))
+
+    def stream(self):
+        self._check_streamer_settings()
+        streamer = Streamer(settings.APIS, settings.STREAM_LANGUAGE, settings.STREAM_CRITERION,
+                            settings.STREAM_TEST_FILE, self._scorer, settings.FALLBACK_NAME,
+                            settings.STREAM_CHUNK_SIZE, settings.STREAM_QUEUE_SIZE, settings.COMPARATOR_WORKERS,
+                            settings.API_CONCURRENCY)
+        streamer.stream()
+        with open(settings.STREAM_RESULT_FILE, 'wb') as f:
+            f.write(json.dumps(streamer.results))
+
     def log_success(self, api_name, sentence, intent_to_find):
-        with open(settings.LOG_SUCCESS, 'a') as f:
-            f.write(u'{}\t{}\t{}\n'.format(api_name, intent_to_find, sentence).encode('utf-8'))
+        self._log_success.write(u'{}\t{}\t{}\n'.format(api_name, intent_to_find, sentence).encode('utf-8'))
 
     def log_fallback(self, api_name, sentence, intent_to_find):
-        with open(settings.LOG_FALLBACK, 'a') as f:
-            f.write(u'{}\t{}\t{}\n'.format(api_name, intent_to_find, sentence).encode('utf-8'))
+        self._log_fallback.write(u'{}\t{}\t{}\n'.format(api_name, intent_to_find, sentence).encode('utf-8'))
 
     def log_error(self, api_name, sentence, intent_to_find, intent_found):
-        with open(settings.LOG_ERROR, 'a') as f:
-            f.write(u'{}\t{}\t{}\t{}\n'.format(api_name, intent_found, intent_to_find, sentence).encode('utf-8'))
+        self._log_error.write(
+            u'{}\t{}\t{}\t{}\n'.format(api_name, intent_found, intent_to_find, sentence).encode('utf-8'))
+
+    def close(self):
+        """
+        Write the logs still buffered. Must be called once the manager is no longer used
+        """
+        api_builder.release_artifacts(self._registry)
+        for log_sink in [self._log_success, self._log_fallback, self._log_error]:
+            log_sink.close()
+        self._checkpoint.close()
+        self._store.close()
 
     def _check_comparator_settings(self):
         self._check_general_settings()
         for api in settings.APIS:
-            if api not in settings.APIS_HANDLED:
-                raise Exception(
-                    'The Api \'{}\' is not handled. Add it in settings.apis_handled if it is implemented'.format(api))
+            self._check_api(api)
 
         comparator_result_file = settings.COMPARATOR_RESULT_FILE
         file_split = comparator_result_file.split('/')
@@ -70,15 +199,17 @@ class Manager:
 
     def _check_parametor_settings(self):
         self._check_general_settings()
-        if settings.API not in settings.APIS_HANDLED:
-            raise Exception(
-                'The Api \'{}\' is not handled. Add it in settings.apis_handled if it is implemented'.format(
-                    settings.API)
-            )
+        self._check_api(settings.API)
 
         if settings.PARAMETOR_RESULT_MODE not in settings.PARAMETOR_RESULT_MODE_HANDLED:
             raise Exception('the result mode {} of parametor is not handled'.format(settings.PARAMETOR_RESULT_MODE))
 
+        if settings.PARAMETOR_SEARCH not in settings.PARAMETOR_SEARCH_HANDLED:
+            raise Exception('the search {} of parametor is not handled'.format(settings.PARAMETOR_SEARCH))
+
+        if settings.PARAMETOR_HALVING and settings.PARAMETOR_HALVING_RATE < 2:
+            raise Exception('PARAMETOR_HALVING_RATE must be at least 2')
+
         parametor_result_file = settings.PARAMETOR_RESULT_FILE
         file_split = parametor_result_file.split('/')
         folder = '/'.join(file_split[:-1])
@@ -90,63 +221,124 @@ class Manager:
             logger.warn('Your result file already exists. It\'s content will be updated by the end of the execution')
         api_builder.check_params(settings.API, settings.PARAMS)
 
-    def _check_general_settings(self):
-        for metric in settings.METRICS:
-            if metric not in settings.METRICS_HANDLED:
-                raise Exception(
-                    'The metric \'{}\' is not handled. Add it in settings.metrics_handled if it is implemented')
+    def _check_planner_settings(self):
+        if settings.PLANNER_ACTION not in ['comparator', 'parametor']:
+            raise Exception('the planner only plans the comparator and the parametor, not {}'.format(
+                settings.PLANNER_ACTION))
+        self._check_general_settings()
+        if settings.PLANNER_ACTION == 'comparator':
+            for api in settings.APIS:
+                self._check_api(api)
+        else:
+            self._check_api(settings.API)
+            api_builder.check_params(settings.API, settings.PARAMS)
 
+        folder = os.path.dirname(settings.PLANNER_RESULT_FILE)
+        if folder != 'data/results/planner':
+            raise Exception(
+                'Your result file must be in data/results/planner directory. Yours is in {}'.format(folder)
+            )
+
+    def _check_rescore_settings(self):
+        self._check_metrics()
+        folder = os.path.dirname(settings.RESCORE_RESULT_FILE)
+        if folder != 'data/results/rescore':
+            raise Exception(
+                'Your result file must be in data/results/rescore directory. Yours is in {}'.format(folder)
+            )
+
+    def _check_streamer_settings(self):
+        self._check_metrics()
+        for api in settings.APIS:
+            self._check_api(api)
+        loader.check_file(settings.STREAM_LANGUAGE, settings.STREAM_CRITERION)
+        if not os.path.isfile(settings.STREAM_TEST_FILE):
+            raise Exception('the test file {} does not exist'.format(settings.STREAM_TEST_FILE))
+
+        folder = os.path.dirname(settings.STREAM_RESULT_FILE)
+        if folder != 'data/results/streamer':
+            raise Exception(
+                'Your result file must be in data/results/streamer directory. Yours is in {}'.format(folder)
+            )
+        if os.path.isfile(settings.STREAM_RESULT_FILE):
+            logger.warn('Your result file already exists. It\'s content will be updated by the end of the execution')
+
+    def _check_general_settings(self):
+        self._check_metrics()
         for language in settings.CRITERIA:
             for criterion in settings.CRITERIA[language]:
                 loader.check_file(language, criterion)
+                # fail before any api is trained rather than at the criterion
+                fold_splits.check(loader.load(language, criterion), self._scorer.n_fold,
+                                  '{} {}'.format(language, criterion))
+
+    def _check_api(self, api):
+        # the apis of the plugins are registered without being in APIS_HANDLED
+        if api not in settings.APIS_HANDLED and not api_builder.is_registered(api):
+            raise Exception(
+                'The Api \'{}\' is not handled. Add it in settings.apis_handled if it is implemented'.format(api))
+
+    def _check_metrics(self):
+        for metric in settings.METRICS:
+            if metric not in settings.METRICS_HANDLED and metric not in metric_registry.METRICS:
+                raise Exception(
+                    'The metric \'{}\' is not handled. Add it in settings.metrics_handled if it is implemented'.format(
+                        metric))
+
+    def _run_config(self, **config):
+        """
+        :return: settings of a run, recorded with its scores in the result store
+        """
+        config.update({
+            'criteria': settings.CRITERIA,
+            'metrics': settings.METRICS,
+            'n_fold': self._scorer.n_fold,
+            'random_state': self._scorer.random_state
+        })
+        return config
 
-    def _show_parametor_results(self, results):
-        results = self.invert_metric_param(results)
+    def _show_parametor_results(self, run_id):
         if settings.PARAMETOR_RESULT_MODE == 'all':
-            return results
+            return self.invert_metric_param(run_id)
         elif settings.PARAMETOR_RESULT_MODE == 'best':
-            return self._show_best_params(results)
+            return self._show_best_params(run_id)
 
         else:
             raise Exception('unknown mode {}'.format(settings.PARAMETOR_RESULT_MODE))
 
-    def invert_metric_param(self, results):
+    def invert_metric_param(self, run_id):
+        """
+        :return: score, confidence interval and number of folds scored of every value of every parameter,
+            by language, criterion and metric
+        """
         inverted_results = {}
-        metrics = settings.METRICS
-        for language in results:
-            inverted_results[language] = {}
-            for criterion in results[language]:
-                inverted_results[language][criterion] = {}
-                for metric in metrics:
-                    inverted_results[language][criterion][metric] = {}
-
-                for parameter_name in results[language][criterion]:
-                    for parameter_value in results[language][criterion][parameter_name]:
-                        for metric in metrics:
-                            score = results[language][criterion][parameter_name][parameter_value][metric]
-                            if parameter_name not in inverted_results[language][criterion][metric]:
-                                inverted_results[language][criterion][metric][parameter_name] = {}
-                            inverted_results[language][criterion][metric][parameter_name][parameter_value] = score
+        for language, criterion, metric, parameter_name, parameter_value, score, low, high, n_fold in \
+                self._store.mean_scores(run_id):
+            parameters = inverted_results.setdefault(language, {}).setdefault(criterion, {}).setdefault(metric, {})
+            parameters.setdefault(parameter_name, {})[parameter_value] = {
+                'score': score,
+                'confidence_interval': [low, high] if low is not None else None,
+                'n_fold': n_fold
+            }
         return inverted_results
 
-    def _show_best_params(self, results):
+    def _show_best_params(self, run_id):
         best_params = {}
-        for language in results:
-            best_params[language] = {}
-            for criterion in results[language]:
-                best_params[language][criterion] = {}
-                for metric in results[language][criterion]:
-                    best_params[language][criterion][metric] = {}
-                    for parameter_name in results[language][criterion][metric]:
-                        values = results[language][criterion][metric][parameter_name]
-                        best_params[language][criterion][metric][parameter_name] = \
-                            max(values.iteritems(), key=operator.itemgetter(1))[0]
+        for language, criterion, metric, parameter_name, parameter_value in self._store.best_values(run_id):
+            metrics = best_params.setdefault(language, {}).setdefault(criterion, {})
+            metrics.setdefault(metric, {})[parameter_name] = parameter_value
         return best_params
 
-    def _clean_logs(self):
-        with open(settings.LOG_SUCCESS, 'wb') as f:
-            f.write('API\tINTENT\tSENTENCE\n')
-        with open(settings.LOG_FALLBACK, 'wb') as f:
-            f.write('API\tINTENT\tSENTENCE\n')
-        with open(settings.LOG_ERROR, 'wb') as f:
-            f.write('API\tINTENT_FOUND\tREAL_INTENT\tSENTENCE\n')
+    def _open_logs(self, append):
+        """
+        :param append: if False, the logs are truncated. They are appended to when a former run is resumed
+        """
+        sink_params = {
+            'flush_size': settings.LOG_FLUSH_SIZE,
+            'flush_interval': settings.LOG_FLUSH_INTERVAL,
+            'compress': settings.LOG_COMPRESS,
+            'append': append
+        }
+        self._log_success = LogSink(settings.LOG_SUCCESS, 'API\tINTENT\tSENTENCE\n', **sink_params)
+        self._log_fallback = LogSink(settings.LOG_FALLBACK, 'API\tINTENT\tSENTENCE\n', **sink_params)
+        self._log_error = LogSink(settings.LOG_ERROR, 'API\tINTENT_FOUND\tREAL_INTENT\tSENTENCE\n', **sink_params)
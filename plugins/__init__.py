@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+"""
+Every module of this folder is imported at start (see settings.PLUGINS_FOLDER): it can add apis with
+api_managers.api_builder.register and metrics with tools.metrics.register, without editing BUNT.
+"""
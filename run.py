@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 
+from logging.config import dictConfig
 from manager import Manager
 from settings import settings
 
-manager = Manager()
-if settings.ACTION == 'comparator':
-    manager.compare()
-elif settings.ACTION == 'parametor':
-    manager.score_parameters()
-else:
-    raise Exception('Unknown action : \'{}\''.format(settings.ACTION))
+dictConfig(settings.LOGGING)
+manager = Manager(dry_run=settings.ACTION in ['planner', 'rescore'])
+try:
+    if settings.ACTION == 'comparator':
+        manager.compare()
+    elif settings.ACTION == 'parametor':
+        manager.score_parameters()
+    elif settings.ACTION == 'streamer':
+        manager.stream()
+    elif settings.ACTION == 'planner':
+        manager.plan()
+    elif settings.ACTION == 'rescore':
+        manager.rescore()
+    else:
+        raise Exception('Unknown action : \'{}\''.format(settings.ACTION))
+finally:
+    manager.close()
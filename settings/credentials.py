@@ -4,6 +4,9 @@
 For each API you want to evaluate, you have to create an account and complete the credentials.
 You can let all the parameters of the APIs you are not using to None.
 If you want to add your own api, add description to your credentials
+
+Every credential identifying an agent (token, key, bot_slug) can also be a list of agents.
+Each fold / parameter value leases a free agent, so that as many of them as agents can be scored at the same time.
 """
 
 """
@@ -11,6 +14,7 @@ apiai
 
 To use ApiAi, you have to create one agent for every language you want to test it on.
 Then put your developper access token for each agent
+(or a list of tokens of distinct agents of the same language)
 """
 APIAI_TOKENS = {
     'en': '',
@@ -21,6 +25,7 @@ APIAI_TOKENS = {
 luis
 
 To use Luis, there is no need to create agents. Only put your key.
+Each key listed allows one more app trained at the same time (a key may be listed several times)
 """
 LUIS_KEY = ''
 
@@ -28,6 +33,8 @@ LUIS_KEY = ''
 Recast
 
 To use Recast, you have to create one bot. You have to put your user_slug, your bot_slug and your token
+(RECAST_BOT_SLUG may be a list of bots of the same user: RECAST_TOKEN is then the list of their tokens, in the same
+order, since recast finds the bot queried from the token)
 """
 RECAST_USER_SLUG = ''
 RECAST_BOT_SLUG = ''
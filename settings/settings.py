@@ -1,18 +1,16 @@
 # -*- coding: utf-8 -*-
 
-from logging.config import dictConfig
-from requests.packages.urllib3 import disable_warnings
-
 """
 ____________________________________________
 *************General setting*************
 ____________________________________________
 ACTION:
     action that should do the program.
-    the available actions are 'comparator' and 'parametor'
+    the available actions are 'comparator', 'parametor', 'streamer', 'planner' and 'rescore'
 
 METRICS:
     list of all the scoring rules.
+    The '_latency_penalized' metrics divide the score by (1 + the 95th percentile of the latency in seconds)
 
 CRITERIA:
     Dictionary.
@@ -21,7 +19,25 @@ CRITERIA:
 
 API_HANDLED:
     list of the names of the apis available.
-    Please edit this list if you want to add yours
+    Please edit this list if you want to add yours.
+    'local' is a baseline trained in-process (tf-idf and logistic regression), which needs no credentials
+
+CALL_BUDGETS:
+    dictionary.
+    Keys : name of the apis
+    Values : dictionary with the maximum number of requests sent to the api ('calls').
+        Without 'period', the run is aborted once they are sent (set RESUME to True to go on later from the
+        last fold scored). With 'period' (seconds), at most 'calls' requests are sent every period,
+        the next ones waiting for the next period.
+    The apis absent from the dictionary have no limit
+
+PLUGINS_FOLDER:
+    folder (a python package) whose modules are all imported at start to add apis and metrics (see readme.md).
+    They register their apis with api_managers.api_builder.register and their metrics with tools.metrics.register.
+    The apis and metrics they register are handled without being added to APIS_HANDLED and METRICS_HANDLED
+
+PLUGINS:
+    list of other plugin modules imported at start, outside of PLUGINS_FOLDER
 
 FALLBACK_NAME:
     name of the fallback intent.
@@ -36,6 +52,109 @@ LOG_ERROR:
 LOG_FALLBACK:
     path to the file where the queries which the api did not provide any intent will be logged
 
+LOG_FLUSH_SIZE:
+    number of log lines buffered before they are written
+
+LOG_FLUSH_INTERVAL:
+    maximum number of seconds a log line is buffered before being written
+
+LOG_COMPRESS:
+    if True, the log files are gzipped ('.gz' is appended to their path)
+
+RESULT_STORE_FILE:
+    path to the sqlite file where the scores of every fold of every run are appended
+    (see tools/result_store.py to query and compare the runs)
+
+PREDICTIONS_FOLDER:
+    folder where the expected and predicted intents of every fold of every run of the comparator and the parametor
+    are kept (one compressed numpy file per fold), so that the runs can be scored again by the rescore action
+
+PREDICT_WORKERS:
+    number of queries sent concurrently to an api when predicting a test set.
+    Set it to 1 to query the apis one sentence after another
+
+APIAI_URL, LUIS_URL, RECAST_URL:
+    base url of the apis. Change them to use local stand-ins (see bench/stand_ins.py)
+
+HTTP_POOL_SIZE:
+    number of keep-alive connections kept open to each api.
+    None to size it for the peak concurrency of an api: PREDICT_WORKERS queries for each of the FOLD_WORKERS folds
+    scored at the same time. Beyond the pool, the connections are closed after each request
+
+HTTP_HEADERS:
+    headers sent with every request to the apis
+
+HTTP_COMPRESS_THRESHOLD:
+    size in bytes above which the training payloads are sent gzipped.
+    Set it to None to never compress them
+
+HTTP_RETRIES:
+    number of times a query or a read answered with a server error (5xx) is sent again.
+    The requests which create or change the models are not retried
+
+HTTP_RETRY_DELAY:
+    seconds to wait before sending a request again, doubled at each retry
+
+USE_CRITERIA_CACHE:
+    if True, a columnar copy of every criterion (.npz) is written next to its csv
+    and read instead of the csv while the content of the csv does not change
+
+USE_PREDICTION_CACHE:
+    if True, the predictions are stored on disk and reused when the same api, with the same parameters,
+    is trained on the same data again. Set it to False to always query the apis
+
+PREDICTION_CACHE_FILE:
+    path to the file where the predictions are cached
+
+PREDICTION_CACHE_SIZE:
+    maximum number of predictions kept in cache. The least recently used ones are removed first
+
+USE_MODEL_REGISTRY:
+    if True, the agents/apps holding a trained model are recorded, and an api is not trained again
+    on data it has already been trained on with the same parameters, as long as the model is still deployed
+
+MODEL_REGISTRY_FILE:
+    path to the file where the deployed models are recorded
+
+MODEL_REGISTRY_SIZE:
+    maximum number of models kept per api. Apis creating a new app per model (luis) delete the oldest ones
+
+MODEL_REGISTRY_KEEP_MODELS:
+    if False, the app of an agent (luis) is synced with the data of the next fold: only the changes are sent,
+    and the model it held is forgotten. If True, while the registry is not full, the app is kept with its model
+    and the next fold creates a new app and uploads all its data: slower, but scoring the same folds again
+    then trains nothing
+
+RESUME:
+    if True, the folds already scored by the former run (interrupted for instance) are not scored again,
+    and the logs are appended to instead of being truncated. Keep the same settings to resume a run
+
+CHECKPOINT_FILE:
+    path to the file where every fold is stored as soon as it is scored
+
+READINESS_TIMEOUT:
+    maximum number of seconds to wait for an api to be trained. An error is raised beyond it if the api tells
+    its training status (luis). An api probed with predictions only is assumed ready beyond it, with a warning
+
+READINESS_INITIAL_DELAY:
+    seconds to wait before checking again whether an api which is not ready is trained.
+    The delay doubles after each check
+
+READINESS_MAX_DELAY:
+    maximum seconds between two checks of the training status of an api
+
+BOOTSTRAP_RESAMPLES:
+    number of bootstrap samples used to compute the confidence interval of every metric.
+    The sentences already predicted are resampled: no api is queried. Set it to 0 to disable the intervals
+
+BOOTSTRAP_CONFIDENCE:
+    probability covered by the confidence intervals
+
+FOLD_WORKERS:
+    maximum number of folds of a criterion scored at the same time.
+    Each fold trains its own agent: folds only run concurrently when several agents
+    of the api are given in credentials.py
+
 
 ____________________________________________
 *************Comparator setting*************
@@ -47,7 +166,22 @@ APIS:
 COMPARATOR_RESULT_FILE:
     path to the file where the results will be written.
     If the file does not exist in the directory, it will be created
-    The program will erase any former content of the file
+    The program will erase any former content of the file, unless COMPARATOR_INCREMENTAL is True
+
+COMPARATOR_INCREMENTAL:
+    if True, only the (language, criterion, api) whose criterion file, api parameters or metrics changed
+    since the results in COMPARATOR_RESULT_FILE are scored again. They are merged with the former results,
+    which are kept for the criteria and apis not compared this time
+
+COMPARATOR_WORKERS:
+    maximum number of (language, criterion, api) scored at the same time
+
+API_CONCURRENCY:
+    dictionary.
+    Keys : name of the apis
+    Values : maximum number of (language, criterion) scored at the same time on the api. Defaults to 1.
+    Every (language, criterion) leases its agents from the ones given in credentials.py,
+    and waits while they are all busy
 ____________________________________________
 *************Parametor setting*************
 ____________________________________________
@@ -60,9 +194,34 @@ PARAMS:
     Keys : parameters to tune
     Values : list of the values of the parameter to try
 
+PARAMETOR_WORKERS:
+    maximum number of parameter values scored at the same time.
+    As for the folds, values only run concurrently when several agents of the api are given in credentials.py
+
+PARAMETOR_SEARCH:
+    way to explore the parameters. Defaults to 'single'
+    if single : each parameter is tuned alone, with the default values of the other ones
+    if grid : every combination of the values of the parameters is tried
+    if random : PARAMETOR_RANDOM_CANDIDATES combinations, drawn at random, are tried
+    Combinations are reported as a parameter 'name_1,name_2' of value 'value_1,value_2'
+
+PARAMETOR_RANDOM_CANDIDATES:
+    number of combinations tried by the random search
+
+PARAMETOR_HALVING:
+    if True, successive halving is used: every candidate is scored on one fold,
+    then only the best ones (on the first metric of METRICS) are scored on more folds.
+    Only the candidates scored on every fold compete for the best value.
+    If False, every candidate is scored on all the folds
+
+PARAMETOR_HALVING_RATE:
+    at each round of successive halving, only 1 / PARAMETOR_HALVING_RATE of the candidates are kept
+    and they are scored on PARAMETOR_HALVING_RATE times more folds
+
 RESULTS_MODE:
     way to show the results. Defaults to 'all'
-    if all : return the score obtained for each value of the parameters tested
+    if all : return the score obtained for each value of the parameters tested, with its confidence interval
+        and the number of folds it was scored on (fewer than the others for the candidates dropped by halving)
     if best: return only the best parameters
 
 PARAMETOR_RESULT_FILE :
@@ -70,6 +229,55 @@ PARAMETOR_RESULT_FILE :
     If the file does not exist in the directory, it will be created
     The program will erase any former content of the file
 
+____________________________________________
+*************Planner setting*************
+____________________________________________
+The planner is a dry run: it estimates the requests a run would send to every api and its duration
+from the criteria, the caches and the timings measured by the former comparison, without sending any.
+
+PLANNER_ACTION:
+    action planned: 'comparator' or 'parametor', with their settings
+
+PLANNER_RESULT_FILE:
+    path to the file where the estimations will be written, in data/results/planner
+
+____________________________________________
+*************Rescore setting*************
+____________________________________________
+The rescore action scores a former run of the comparator or the parametor again with METRICS and FALLBACK_NAME,
+from the predictions kept in PREDICTIONS_FOLDER, without querying any api. The predictions of the former
+fallback intent are fallen back to FALLBACK_NAME. The new scores are appended to RESULT_STORE_FILE as a run
+of its own.
+
+RESCORE_RUN:
+    id of the run scored again (see RESULT_STORE_FILE). None for the last run whose predictions were kept
+
+RESCORE_RESULT_FILE:
+    path to the file where the results will be written, in data/results/rescore.
+    They have the format of the results of the action of the run scored again
+
+____________________________________________
+*************Streamer setting*************
+____________________________________________
+The streamer trains the apis of APIS on a whole criterion, then scores them on a test file too large
+to be held in memory (a dump of real traffic for instance), read by chunks.
+
+STREAM_LANGUAGE, STREAM_CRITERION:
+    language and name of the criterion the apis are trained on
+
+STREAM_TEST_FILE:
+    tab-separated file with the columns 'sentence' and 'intent'
+
+STREAM_CHUNK_SIZE:
+    number of sentences read, predicted and scored at once
+
+STREAM_QUEUE_SIZE:
+    number of chunks waiting between two stages (reading, predicting, scoring).
+    The memory used is about (2 * STREAM_QUEUE_SIZE + 3) chunks, whatever the size of the test file
+
+STREAM_RESULT_FILE:
+    path to the file where the results will be written, in data/results/streamer
+
 """
 
 ACTION = 'comparator'
@@ -81,13 +289,62 @@ CRITERIA = {
 
 FALLBACK_NAME = 'fallback_not_understood'
 
-APIS_HANDLED = ['apiai', 'recast', 'luis']
-METRICS_HANDLED = ['error_10_penalized', 'error_3_penalized', 'accuracy']
+APIS_HANDLED = ['apiai', 'recast', 'luis', 'local']
+METRICS_HANDLED = ['error_10_penalized', 'error_3_penalized', 'accuracy', 'macro_precision', 'macro_recall',
+                   'macro_f1', 'accuracy_latency_penalized', 'error_3_latency_penalized']
 PARAMETOR_RESULT_MODE_HANDLED = ['all', 'best']
+PARAMETOR_SEARCH_HANDLED = ['single', 'grid', 'random']
+PLUGINS_FOLDER = 'plugins'
+PLUGINS = []
+CALL_BUDGETS = {}
 # logging
 LOG_SUCCESS = 'data/logs/log_success.csv'
 LOG_ERROR = 'data/logs/log_error.csv'
 LOG_FALLBACK = 'data/logs/log_fallback.csv'
+LOG_FLUSH_SIZE = 1000
+LOG_FLUSH_INTERVAL = 1.
+LOG_COMPRESS = False
+
+# results
+RESULT_STORE_FILE = 'data/results/results.sqlite'
+PREDICTIONS_FOLDER = 'data/results/predictions'
+
+PREDICT_WORKERS = 8
+
+# http
+APIAI_URL = 'https://api.api.ai/v1/'
+LUIS_URL = 'https://api.projectoxford.ai/luis/'
+RECAST_URL = 'https://api.recast.ai/v2'
+HTTP_POOL_SIZE = None
+HTTP_HEADERS = {
+    'User-Agent': 'bunt',
+    'Accept': 'application/json'
+}
+HTTP_COMPRESS_THRESHOLD = 64 * 1024
+HTTP_RETRIES = 3
+HTTP_RETRY_DELAY = 0.5
+
+# cache
+USE_CRITERIA_CACHE = True
+USE_PREDICTION_CACHE = True
+PREDICTION_CACHE_FILE = 'data/cache/predictions.sqlite'
+PREDICTION_CACHE_SIZE = 500000
+USE_MODEL_REGISTRY = True
+MODEL_REGISTRY_FILE = 'data/cache/models.json'
+MODEL_REGISTRY_SIZE = 20
+MODEL_REGISTRY_KEEP_MODELS = False
+RESUME = False
+CHECKPOINT_FILE = 'data/cache/checkpoint.sqlite'
+
+# training
+READINESS_TIMEOUT = 600
+READINESS_INITIAL_DELAY = 0.5
+READINESS_MAX_DELAY = 15
+
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_CONFIDENCE = 0.95
+
+FOLD_WORKERS = 5
 
 """
 ___________________________________________________________________________________________
@@ -95,8 +352,16 @@ ________________________________________________________________________________
 Comparator
 ___________________________________________________________________________________________
 """
-APIS = ['apiai, recast, luis']
+APIS = ['apiai', 'recast', 'luis', 'local']
 COMPARATOR_RESULT_FILE = 'data/results/comparator/all_results.json'
+COMPARATOR_INCREMENTAL = False
+COMPARATOR_WORKERS = 3
+API_CONCURRENCY = {
+    'apiai': 1,
+    'recast': 1,
+    'luis': 2,
+    'local': 1
+}
 
 """
 ___________________________________________________________________________________________
@@ -108,12 +373,48 @@ PARAMS = {
     'strictness': [0, 25, 50, 75, 100]
 }
 PARAMETOR_RESULT_MODE = 'all'
+PARAMETOR_WORKERS = 5
+PARAMETOR_SEARCH = 'single'
+PARAMETOR_RANDOM_CANDIDATES = 10
+PARAMETOR_HALVING = False
+PARAMETOR_HALVING_RATE = 2
 PARAMETOR_RESULT_FILE = 'data/results/parametor/result.json'
 
 API = 'recast'
 
+"""
+___________________________________________________________________________________________
 
-dictConfig({
+Planner
+___________________________________________________________________________________________
+"""
+PLANNER_ACTION = 'comparator'
+PLANNER_RESULT_FILE = 'data/results/planner/plan.json'
+
+"""
+___________________________________________________________________________________________
+
+Rescore
+___________________________________________________________________________________________
+"""
+RESCORE_RUN = None
+RESCORE_RESULT_FILE = 'data/results/rescore/result.json'
+
+"""
+___________________________________________________________________________________________
+
+Streamer
+___________________________________________________________________________________________
+"""
+STREAM_LANGUAGE = 'en'
+STREAM_CRITERION = 'smalltalk_en'
+STREAM_TEST_FILE = 'data/streams/traffic_en.csv'
+STREAM_CHUNK_SIZE = 1000
+STREAM_QUEUE_SIZE = 2
+STREAM_RESULT_FILE = 'data/results/streamer/results.json'
+
+# configuration of the logging, applied by run.py
+LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
@@ -137,7 +438,4 @@ dictConfig({
         'level': 'DEBUG',
         'handlers': ['console'],
     },
-})
-
-# Disable HTTPS warning
-disable_warnings()
+}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from api_managers.agent_pool import AgentPool
+
+import threading
+import unittest
+
+
+class _Api:
+    def __init__(self, agent, artifact=None, refused=()):
+        """
+        Manager of an agent holding one artifact (see ApiManager.get_artifact and load_artifact)
+        """
+        self.agent = agent
+        self.artifact = artifact
+        self.refused = refused
+
+    def get_artifact(self):
+        return self.artifact
+
+    def load_artifact(self, artifact):
+        if artifact in self.refused:
+            return False
+        self.artifact = artifact
+        return True
+
+
+class TestAgentPool(unittest.TestCase):
+    def setUp(self):
+        # the same key listed twice: two slots (see AgentPool)
+        self.pool = AgentPool('luis en', [{'key': 'k'}, {'key': 'k'}])
+
+    def _lease(self, artifact=None):
+        slot = self.pool.acquire()
+        api = _Api(self.pool.agent(slot), artifact)
+        self.assertIsNone(self.pool.attach(slot, api))
+        return slot, api
+
+    def test_identical_agents_are_distinct_slots(self):
+        slot_x, api_x = self._lease('app_x')
+        slot_y, api_y = self._lease('app_y')
+        self.assertNotEqual(slot_x, slot_y)
+        self.pool.release(slot_x, api_x)
+        self.pool.release(slot_y, api_y)
+        self.assertEqual(sorted(artifact for _, artifact in self.pool.artifacts()), ['app_x', 'app_y'])
+
+    def test_next_lease_starts_from_the_artifact_of_the_slot(self):
+        slot_x, api_x = self._lease('app_x')
+        slot_y, api_y = self._lease()
+        self.pool.release(slot_y)
+        self.pool.release(slot_x, api_x)
+        self.assertEqual(self.pool.acquire(), slot_y)
+        self.assertEqual(self.pool.acquire(), slot_x)
+        self.assertEqual(self.pool.attach(slot_x, _Api(self.pool.agent(slot_x))), 'app_x')
+
+    def test_artifact_of_a_leased_slot_is_refused(self):
+        slot_x, api_x = self._lease('app_x')
+        self.pool.release(slot_x, api_x)
+        slot_x, api_x = self._lease()
+        slot_y = self.pool.acquire()
+        api_y = _Api(self.pool.agent(slot_y))
+        self.assertEqual(self.pool.attach(slot_y, api_y), 'app_x')
+        self.assertFalse(self.pool.load_artifact(api_x, 'app_x'))
+        self.assertIsNone(api_x.artifact)
+
+    def test_artifact_created_during_a_lease_is_refused(self):
+        slot_x, api_x = self._lease()
+        slot_y, api_y = self._lease()
+        # app_y is only recorded by the pool at the release of slot_y
+        api_y.artifact = 'app_y'
+        self.assertFalse(self.pool.load_artifact(api_x, 'app_y'))
+
+    def test_artifact_of_a_free_slot_is_taken(self):
+        slot_x, api_x = self._lease('app_x')
+        self.pool.release(slot_x, api_x)
+        slot_y, api_y = self._lease('app_y')
+        self.assertTrue(self.pool.load_artifact(api_y, 'app_x'))
+        self.pool.release(slot_y, api_y)
+        # the free slot lost app_x, and app_y is abandoned to be released
+        self.assertEqual(sorted(artifact for _, artifact in self.pool.artifacts()), ['app_x', 'app_y'])
+        self.assertTrue(self.pool.holds('app_x'))
+        self.assertFalse(self.pool.holds('app_y'))
+
+    def test_refused_by_the_api(self):
+        slot, api = self._lease('app_x')
+        api.refused = ['app_y']
+        self.assertFalse(self.pool.load_artifact(api, 'app_y'))
+        self.pool.release(slot, api)
+        self.assertEqual([artifact for _, artifact in self.pool.artifacts()], ['app_x'])
+
+    def test_forget(self):
+        slot, api = self._lease('app_x')
+        self.pool.release(slot, api)
+        self.pool.forget('app_x')
+        self.assertEqual(self.pool.artifacts(), [])
+
+    def test_acquire_waits_for_a_release(self):
+        slots = [self.pool.acquire(), self.pool.acquire()]
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(self.pool.acquire()))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual(acquired, [])
+        self.pool.release(slots[0])
+        thread.join(5.)
+        self.assertEqual(acquired, [slots[0]])
+
+    def test_unleased_manager(self):
+        with self.assertRaises(Exception):
+            self.pool.load_artifact(_Api(None), 'app_x')
+
+
+if __name__ == '__main__':
+    unittest.main()
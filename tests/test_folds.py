@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from tools import folds
+
+import numpy as np
+import pandas as pd
+import unittest
+
+
+def _criterion(counts):
+    """
+    :param counts: dictionary intent -> number of sentences
+    """
+    intents = [intent for intent in sorted(counts) for _ in range(counts[intent])]
+    return pd.DataFrame({'sentence': ['sentence {}'.format(i) for i in range(len(intents))], 'intent': intents})
+
+
+class TestFolds(unittest.TestCase):
+    def test_split_covers_every_sentence_once(self):
+        df = _criterion({'greet': 10, 'bye': 7, 'mail': 5})
+        test_sets = folds.split(df, 5, 42)
+        self.assertEqual(len(test_sets), 5)
+        self.assertEqual(sorted(np.concatenate(test_sets).tolist()), list(range(len(df))))
+
+    def test_split_is_stratified(self):
+        df = _criterion({'greet': 10, 'bye': 5})
+        for test in folds.split(df, 5, 42):
+            self.assertEqual(sorted(df['intent'].iloc[test].tolist()), ['bye', 'greet', 'greet'])
+
+    def test_split_is_seeded(self):
+        df = _criterion({'greet': 10, 'bye': 7})
+        first = [test.tolist() for test in folds.split(df, 5, 42)]
+        self.assertEqual(first, [test.tolist() for test in folds.split(df, 5, 42)])
+
+    def test_fewer_sentences_than_folds(self):
+        df = _criterion({'greet': 2, 'bye': 2})
+        with self.assertRaises(Exception) as context:
+            folds.split(df, 5, 42, 'en small')
+        self.assertIn('en small has 4 sentences', str(context.exception))
+
+    def test_every_intent_smaller_than_folds(self):
+        df = _criterion({'greet': 4, 'bye': 3, 'mail': 2})
+        with self.assertRaises(Exception) as context:
+            folds.check(df, 5, 'en small')
+        self.assertIn('every intent of en small has fewer than 5 sentences', str(context.exception))
+
+    def test_one_intent_large_enough(self):
+        folds.check(_criterion({'greet': 5, 'bye': 1}), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
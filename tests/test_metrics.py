@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from tools import metrics
+
+import numpy as np
+import unittest
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        # 6 sentences: 3 found, 1 wrongly fallen back, 2 errors
+        y_true = ['Greet', 'greet', 'bye', 'bye', 'mail', 'mail']
+        y_pred = ['greet', 'greet', 'bye', 'none', 'bye', 'greet']
+        self.true_codes, self.pred_codes, self.labels, self.fallback_index = metrics.encode(y_true, y_pred, 'None')
+        self.confusion = metrics.confusion_matrix(self.true_codes, self.pred_codes, len(self.labels))
+
+    def test_encode(self):
+        self.assertEqual(self.labels, ['bye', 'greet', 'mail', 'none'])
+        self.assertEqual(self.fallback_index, 3)
+        self.assertEqual(self.true_codes.tolist(), [1, 1, 0, 0, 2, 2])
+
+    def test_counts(self):
+        self.assertEqual([int(count) for count in metrics.counts(self.confusion, self.fallback_index)], [3, 1, 2])
+
+    def test_registered_metrics(self):
+        self.assertAlmostEqual(metrics.compute('accuracy', self.confusion, self.fallback_index), 3 / 6.)
+        self.assertAlmostEqual(metrics.compute('error_3_penalized', self.confusion, self.fallback_index), 3 / 10.)
+        self.assertAlmostEqual(metrics.compute('error_10_penalized', self.confusion, self.fallback_index), 3 / 24.)
+        self.assertAlmostEqual(float(metrics.risk_rate(self.confusion, self.fallback_index)), 5 / 6.)
+
+    def test_latency_penalized(self):
+        self.assertAlmostEqual(metrics.compute('accuracy_latency_penalized', self.confusion, self.fallback_index, 1.),
+                               3 / 12.)
+        self.assertTrue(np.isnan(metrics.compute('accuracy_latency_penalized', self.confusion, self.fallback_index)))
+
+    def test_batch_of_confusions(self):
+        confusions = np.stack([self.confusion, np.diag([1, 1, 1, 0])])
+        self.assertEqual(metrics.compute('accuracy', confusions, self.fallback_index).tolist(), [0.5, 1.])
+
+    def test_empty_confusion(self):
+        self.assertEqual(float(metrics.compute('accuracy', np.zeros((2, 2), dtype=int), 0)), 0.)
+
+    def test_register(self):
+        @metrics.register('test_found')
+        def found(confusion, fallback_index):
+            return metrics.counts(confusion, fallback_index)[0]
+
+        try:
+            self.assertEqual(metrics.compute('test_found', self.confusion, self.fallback_index), 3)
+        finally:
+            del metrics.METRICS['test_found']
+
+    def test_accumulator_matches_confusion_matrix(self):
+        accumulator = metrics.ConfusionAccumulator('None')
+        accumulator.add(['Greet', 'greet', 'bye'], ['greet', 'greet', 'bye'])
+        accumulator.add(['bye', 'mail', 'mail'], ['none', 'bye', 'greet'])
+        order = [accumulator.labels.index(label) for label in self.labels]
+        self.assertEqual(accumulator.confusion[np.ix_(order, order)].tolist(), self.confusion.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
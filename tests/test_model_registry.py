@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from tools import model_registry
+from tools.model_registry import ModelRegistry
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def time(self):
+        self.now += 1.
+        return self.now
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'registry', 'models.json')
+        # every call returns a later time: the least recently used model is not a tie
+        self._time = model_registry.time
+        model_registry.time = _Clock()
+
+    def tearDown(self):
+        model_registry.time = self._time
+        shutil.rmtree(self.folder)
+
+    def test_record_and_lookup(self):
+        registry = ModelRegistry(self.path, 2)
+        self.assertIsNone(registry.lookup('key_1'))
+        self.assertEqual(registry.record('key_1', 'luis', 'app_1'), [])
+        self.assertEqual(registry.lookup('key_1'), 'app_1')
+        self.assertEqual(registry.peek('key_1'), 'app_1')
+        self.assertTrue(registry.holds('luis', 'app_1'))
+        self.assertFalse(registry.holds('recast', 'app_1'))
+
+    def test_persisted(self):
+        ModelRegistry(self.path, 2).record('key_1', 'luis', 'app_1')
+        self.assertEqual(ModelRegistry(self.path, 2).lookup('key_1'), 'app_1')
+
+    def test_overwritten_artifact_forgets_its_model(self):
+        registry = ModelRegistry(self.path, 2)
+        registry.record('key_1', 'luis', 'app_1')
+        registry.record('key_2', 'luis', 'app_1')
+        self.assertIsNone(registry.lookup('key_1'))
+        self.assertEqual(registry.lookup('key_2'), 'app_1')
+
+    def test_least_recently_used_evicted(self):
+        registry = ModelRegistry(self.path, 2)
+        registry.record('key_1', 'luis', 'app_1')
+        registry.record('key_2', 'luis', 'app_2')
+        self.assertFalse(registry.has_room('luis'))
+        self.assertTrue(registry.has_room('recast'))
+        registry.lookup('key_1')
+        self.assertEqual(registry.record('key_3', 'luis', 'app_3'), ['app_2'])
+        self.assertEqual(registry.lookup('key_1'), 'app_1')
+        self.assertIsNone(registry.lookup('key_2'))
+
+    def test_size_per_api(self):
+        registry = ModelRegistry(self.path, 1)
+        registry.record('key_1', 'luis', 'app_1')
+        self.assertEqual(registry.record('key_2', 'recast', 'bot_1'), [])
+        self.assertEqual(registry.lookup('key_1'), 'app_1')
+
+    def test_forget(self):
+        registry = ModelRegistry(self.path, 2)
+        registry.record('key_1', 'luis', 'app_1')
+        registry.forget('luis', 'app_1')
+        self.assertIsNone(registry.peek('key_1'))
+        self.assertTrue(registry.has_room('luis'))
+
+
+if __name__ == '__main__':
+    unittest.main()
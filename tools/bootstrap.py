@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from tools import lazy
+from tools import metrics as metric_registry
+
+np = lazy.module('numpy')
+
+# maximum number of resampled sentences held in memory at once: each one takes a few 8-byte integers
+# (about 8 MB per array for 10 ** 6), whatever the size of the fold or of the chunk
+_MAX_BATCH = 10 ** 6
+
+
+def confidence_intervals(folds, metrics, n_resamples=2000, confidence=0.95, random_state=42):
+    """
+    Bootstrap confidence intervals of the metrics averaged over the folds.
+    The sentences of every fold are resampled with replacement; no api is queried.
+
+    :param folds: list of dictionaries with the codes of the expected ('true') and predicted ('pred') intents,
+        the 'labels' and the 'fallback_index' of a fold (see metrics.encode),
+        and its 'latency' for the latency-penalized metrics. The latency is not resampled
+    :param metrics: names of the metrics
+    :param n_resamples: number of bootstrap samples
+    :param confidence: probability covered by the intervals
+    :return: dictionary metric -> [low, high]
+    """
+    rng = np.random.RandomState(random_state)
+    totals = dict((metric, np.zeros(n_resamples)) for metric in metrics)
+    for fold in folds:
+        true_codes = np.asarray(fold['true'])
+        pred_codes = np.asarray(fold['pred'])
+        n_sentences = len(true_codes)
+        n_labels = len(fold['labels'])
+        if n_sentences == 0:
+            continue
+        batch_size = max(1, _MAX_BATCH // n_sentences)
+        for start in range(0, n_resamples, batch_size):
+            n_batch = min(batch_size, n_resamples - start)
+            samples = rng.randint(0, n_sentences, size=(n_batch, n_sentences))
+            cells = (np.arange(n_batch)[:, None] * n_labels * n_labels +
+                     true_codes[samples] * n_labels + pred_codes[samples])
+            confusion = np.bincount(cells.ravel(), minlength=n_batch * n_labels * n_labels)
+            confusion = confusion.reshape(n_batch, n_labels, n_labels)
+            for metric in metrics:
+                totals[metric][start:start + n_batch] += metric_registry.compute(metric, confusion,
+                                                                                 fold['fallback_index'],
+                                                                                 fold.get('latency'))
+
+    return dict((metric, _interval(totals[metric] / float(max(1, len(folds))), confidence)) for metric in metrics)
+
+
+def _interval(values, confidence):
+    if np.isnan(values).any():
+        # latency-penalized metric of a fold whose latency is unknown (see metrics.compute)
+        return [float('nan'), float('nan')]
+    alpha = 100 * (1 - confidence) / 2.
+    return [float(np.percentile(values, alpha)), float(np.percentile(values, 100 - alpha))]
+
+
+class StreamingBootstrap:
+    def __init__(self, n_resamples=2000, random_state=42):
+        """
+        Poisson bootstrap, updated batch by batch: each sentence is counted Poisson(1) times in every resample.
+        The memory used grows with n_resamples and the square of the number of intents,
+        not with the number of sentences.
+        """
+        self.n_resamples = n_resamples
+        self._rng = np.random.RandomState(random_state)
+        self.confusions = np.zeros((n_resamples, 1, 1), dtype=np.int32)
+
+    def add(self, true_codes, pred_codes, n_labels):
+        """
+        :param true_codes, pred_codes: codes of a batch of sentences (see metrics.ConfusionAccumulator)
+        :param n_labels: number of intents known so far
+        """
+        self.confusions = metric_registry.grow(self.confusions, n_labels)
+        n_sentences = len(true_codes)
+        if n_sentences == 0:
+            return
+        n_cells = n_labels * n_labels
+        cells = np.asarray(true_codes) * n_labels + np.asarray(pred_codes)
+        batch_size = max(1, _MAX_BATCH // max(n_sentences, n_cells))
+        for start in range(0, self.n_resamples, batch_size):
+            n_batch = min(batch_size, self.n_resamples - start)
+            weights = self._rng.poisson(1., size=(n_batch, n_sentences))
+            indices = np.arange(n_batch)[:, None] * n_cells + cells
+            counts = np.bincount(indices.ravel(), weights=weights.ravel(), minlength=n_batch * n_cells)
+            self.confusions[start:start + n_batch] += counts.reshape(n_batch, n_labels, n_labels).astype(np.int32)
+
+    def intervals(self, metrics, fallback_index, confidence=0.95, latency=None):
+        """
+        :return: dictionary metric -> [low, high]
+        """
+        return dict((metric, _interval(metric_registry.compute(metric, self.confusions, fallback_index, latency),
+                                       confidence)) for metric in metrics)
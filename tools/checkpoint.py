@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from tools import lazy
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+np = lazy.module('numpy')
+
+logger = logging.getLogger(__name__)
+
+
+def _to_json(value):
+    # numpy arrays and numbers of the fold results
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class Checkpoint:
+    def __init__(self, path, resume=False):
+        """
+        Results of the units of work (folds) stored as soon as they are scored, each one in its own transaction,
+        so that an interrupted run can be resumed without scoring them again.
+
+        :param path: sqlite file where the results are stored
+        :param resume: if False, the results of the former run are discarded
+        """
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.text_factory = str
+        self._conn.execute('CREATE TABLE IF NOT EXISTS units (key TEXT PRIMARY KEY, result TEXT, finished_at REAL)')
+        if not resume:
+            self._conn.execute('DELETE FROM units')
+        else:
+            n_units = self._conn.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+            logger.info('resuming: {} units already scored'.format(n_units))
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        :return: the result of the unit, None if it has not been scored
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT result FROM units WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        """
+        :param result: json serializable result of the unit (numpy arrays are stored as lists)
+        """
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO units (key, result, finished_at) VALUES (?, ?, ?)',
+                               (key, json.dumps(result, default=_to_json), time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
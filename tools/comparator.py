@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from api_managers import api_builder
+from tools import fingerprint
 from tools import loader
+from tools.scheduler import Scheduler
 
 import logging
 
@@ -9,34 +11,86 @@ logger = logging.getLogger(__name__)
 
 
 class Comparator:
-    def __init__(self, criteria, apis, scorer, fallback_name):
+    def __init__(self, criteria, apis, scorer, fallback_name, n_workers=1, api_concurrency=None, run=None,
+                 previous=None):
+        """
+        :param n_workers: maximum number of apis scored at the same time
+        :param api_concurrency: dictionary api -> maximum number of criteria scored at the same time on this api.
+            Defaults to 1 for every api. Each criterion also waits for a free agent in the pool of the api
+        :param run: result_store.Run recording the scores of every fold, or None
+        :param previous: results of a former comparison. The (language, criterion, api) whose fingerprint
+            (content of the criterion, parameters of the api and of the scorer) did not change are not scored again,
+            and the former results of the criteria and apis absent from this comparison are kept
+        """
         self.criteria = criteria
         self.apis = apis
         self.scorer = scorer
         self.fallback_name = fallback_name
+        self.n_workers = n_workers
+        self.api_concurrency = api_concurrency or {}
+        self.run = run
+        self.previous = previous or {}
         self.results = {}
 
     def compare(self):
         results = {}
+        units = []
         logger.info('Comparator :')
+        for language in self.previous:
+            results[language] = dict((criterion, dict(api_results))
+                                     for criterion, api_results in self.previous[language].items())
         for language in self.criteria:
-            logger.info('\tlanguage: {}'.format(language))
-            results[language] = {}
+            results.setdefault(language, {})
             for criterion in self.criteria[language]:
-                logger.info('\t\tcriterion: {}'.format(criterion))
+                results[language].setdefault(criterion, {})
+                data_hash = loader.checksum(language, criterion)
+                apis = []
+                for api in self.apis:
+                    unit_fingerprint = self._fingerprint(api, data_hash)
+                    former = results[language][criterion].get(api)
+                    if former is not None and former.get('fingerprint') == unit_fingerprint:
+                        logger.info('\t{} {} {}: unchanged'.format(language, criterion, api))
+                        continue
+                    apis.append((api, unit_fingerprint))
+                if not apis:
+                    continue
+
                 # get data_frame
                 df = loader.load(language, criterion)
-                logger.info('\t\t\tdata ready')
+                logger.info('\t{} {}: data ready'.format(language, criterion))
+                for api, unit_fingerprint in apis:
+                    units.append((api, self._score_unit(language, criterion, api, df, data_hash, unit_fingerprint)))
 
-                results[language][criterion] = {}
-
-                for api in self.apis:
-                    api_manager = api_builder.build_api(api_name=api, fallback_name=self.fallback_name,
-                                                        language=language, params={})
-                    self.scorer.fit(api_manager, df)
-                    logger.info('\t\t\tscoring {}'.format(api))
-                    self.scorer.score()
-                    results[language][criterion][str(api_manager)] = {'scores': self.scorer.scores,
-                                                                      'risk_rate': self.scorer.risk_rate}
+        scheduler = Scheduler(self.n_workers, self.api_concurrency)
+        for language, criterion, api_name, result in scheduler.run(units):
+            results[language][criterion][api_name] = result
 
         self.results = results
+
+    def _fingerprint(self, api, data_hash):
+        """
+        :return: hash of everything the result of an api on a criterion depends on
+        """
+        return fingerprint.hash_values('comparator', api, fingerprint.hash_params({}), data_hash,
+                                       ','.join(sorted(self.scorer.metrics)), self.scorer.n_fold,
+                                       self.scorer.random_state, self.scorer.n_bootstrap, self.scorer.confidence,
+                                       self.fallback_name)
+
+    def _score_unit(self, language, criterion, api, df, data_hash, unit_fingerprint):
+        def score():
+            api_factory = api_builder.ApiFactory(api_name=api, fallback_name=self.fallback_name,
+                                                 language=language, params={})
+            scorer = self.scorer.clone()
+            scorer.fit(api_factory, df, language=language, params={}, criterion=criterion)
+            logger.info('\t\t\tscoring {} on {} {}'.format(api, language, criterion))
+            scorer.score()
+            if self.run is not None:
+                self.run.record(language, criterion, str(api_factory), scorer.fold_results,
+                                scorer.confidence_intervals)
+            return language, criterion, str(api_factory), {'scores': scorer.scores, 'risk_rate': scorer.risk_rate,
+                                                           'counts': scorer.counts, 'intents': scorer.intent_scores,
+                                                           'confidence_intervals': scorer.confidence_intervals,
+                                                           'timing': scorer.timing, 'data_hash': data_hash,
+                                                           'fingerprint': unit_fingerprint}
+
+        return score
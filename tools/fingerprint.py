@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    return u'{}'.format(value).encode('utf-8')
+
+
+def hash_dataframe(df):
+    """
+    Hash of the (sentence, intent) couples of a data frame.
+    The order of the rows does not change the hash.
+    """
+    rows = sorted(_encode(sentence) + b'\t' + _encode(intent)
+                  for sentence, intent in zip(df['sentence'], df['intent']))
+    sha = hashlib.sha1()
+    for row in rows:
+        sha.update(row)
+        sha.update(b'\n')
+    return sha.hexdigest()
+
+
+def hash_file(path, block_size=1 << 20):
+    """
+    Hash of the content of a file
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hash_params(params):
+    return hashlib.sha1(_encode(json.dumps(params or {}, sort_keys=True))).hexdigest()
+
+
+def hash_values(*values):
+    sha = hashlib.sha1()
+    for value in values:
+        sha.update(_encode(value))
+        sha.update(b'\x00')
+    return sha.hexdigest()
+
+
+def model_key(api_name, language, params, train_hash):
+    """
+    Identify the model obtained by training an api, with its parameters, on a training set
+    """
+    return hash_values(api_name, language, hash_params(params), train_hash)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from tools import lazy
+from tools import loader
+
+import threading
+
+np = lazy.module('numpy')
+
+# folds already drawn: (language, criterion, n_fold, random_state) -> list of test indices
+_folds = {}
+_folds_lock = threading.Lock()
+
+
+def check(df, n_fold, name='the criterion'):
+    """
+    :param name: name of the criterion, for the error message
+    :raise Exception: if df cannot be split in n_fold stratified folds
+    """
+    if len(df) < n_fold:
+        raise Exception('{} has {} sentences: it cannot be split in {} folds'.format(name, len(df), n_fold))
+    largest = int(df['intent'].value_counts().max())
+    if largest < n_fold:
+        raise Exception('every intent of {} has fewer than {} sentences (at most {}): it cannot be split in {} '
+                        'stratified folds'.format(name, n_fold, largest, n_fold))
+
+
+def split(df, n_fold, random_state, name='the criterion'):
+    """
+    Stratified k-fold split: every sentence is in the test set of exactly one fold,
+    and every fold holds about the same share of each intent.
+
+    :param name: name of the criterion, for the error message (see check)
+    :return: list of the n_fold arrays of the (positional) indices of the test set of each fold
+    """
+    check(df, n_fold, name)
+    # scikit-learn is only imported once the folds are drawn
+    from sklearn.cross_validation import StratifiedKFold
+
+    intents = np.asarray(df['intent'])
+    return [test for _, test in StratifiedKFold(intents, n_folds=n_fold, shuffle=True, random_state=random_state)]
+
+
+def get(language, criterion, n_fold, random_state):
+    """
+    Folds of a criterion (see split). They are drawn once per process and seed,
+    and shared by every api and parameter value scored on the criterion
+    """
+    df = loader.load(language, criterion)
+    key = (language, criterion, n_fold, random_state)
+    with _folds_lock:
+        if key not in _folds:
+            _folds[key] = split(df, n_fold, random_state, '{} {}'.format(language, criterion))
+        return _folds[key]
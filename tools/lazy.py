@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import sys
+
+
+class LazyModule:
+    def __init__(self, name):
+        """
+        Stand-in of a module imported at the first access to one of its attributes,
+        so that importing BUNT does not pay for the scientific libraries (numpy) a quick run never uses.
+
+        :param name: name of the module
+        """
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        # only called for the attributes of the module: _name and _module are set in __init__
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def module(name):
+    """
+    :return: the module if it has already been imported, else a LazyModule importing it at first use
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
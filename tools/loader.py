@@ -1,15 +1,134 @@
 # -*- coding: utf-8 -*-
 
+from settings import settings
+from tools import fingerprint
+from tools import lazy
+
+import logging
 import os
-import pandas as pd
+import threading
+
+np = lazy.module('numpy')
+
+logger = logging.getLogger(__name__)
+
+# criteria already parsed by the process: (language, criterion) -> DataFrame
+_datasets = {}
+_datasets_lock = threading.Lock()
+_SEPARATOR = b'\x00'
+
+
+def _data_file(language, criterion):
+    return 'data/criteria/{}/{}.csv'.format(language, criterion)
+
+
+def _columnar_file(language, criterion):
+    return 'data/criteria/{}/{}.npz'.format(language, criterion)
 
 
 def check_file(language, criterion):
-    data_file = 'data/criteria/{}/{}.csv'.format(language, criterion)
+    data_file = _data_file(language, criterion)
     if not os.path.isfile(data_file):
         raise Exception('criterion {} of language {} does not exist'.format(criterion, language))
 
 
+def checksum(language, criterion):
+    """
+    :return: hash of the content of the csv file of a criterion
+    """
+    return fingerprint.hash_file(_data_file(language, criterion))
+
+
 def load(language, criterion):
-    data_file = 'data/criteria/{}/{}.csv'.format(language, criterion)
-    return pd.read_csv(data_file, sep='\t')
+    """
+    Load a criterion. It is parsed once per process, the later calls return the same DataFrame:
+    it must not be modified.
+    When settings.USE_CRITERIA_CACHE is True, a columnar copy of the csv is kept next to it
+    and used as long as the checksum of the csv does not change.
+    """
+    key = (language, criterion)
+    with _datasets_lock:
+        if key not in _datasets:
+            _datasets[key] = _load(language, criterion)
+        return _datasets[key]
+
+
+def iter_chunks(path, chunk_size):
+    """
+    Read a tab-separated file with the columns 'sentence' and 'intent' by chunks, without loading it whole.
+
+    :return: generator of DataFrames of at most chunk_size rows
+    """
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False, chunksize=chunk_size):
+        yield chunk
+
+
+def _load(language, criterion):
+    data_file = _data_file(language, criterion)
+    if not settings.USE_CRITERIA_CACHE:
+        return _read_csv(data_file)
+
+    columnar_file = _columnar_file(language, criterion)
+    data_hash = checksum(language, criterion)
+    df = _read_columnar(columnar_file, data_hash)
+    if df is None:
+        logger.info('\tconverting {} {}'.format(language, criterion))
+        df = _read_csv(data_file)
+        _write_columnar(columnar_file, df, data_hash)
+    return df
+
+
+def _read_csv(data_file):
+    # pandas is only imported once a criterion is read: checking the settings does not need it
+    import pandas as pd
+
+    # sentences such as 'null' or 'NA' are kept as they are
+    return pd.read_csv(data_file, sep='\t', dtype=str, keep_default_na=False)
+
+
+def _write_columnar(columnar_file, df, checksum):
+    """
+    Store every column as its utf-8 encoded values separated by NUL characters, which tsv values cannot contain
+    """
+    arrays = {'checksum': np.array(checksum), 'columns': np.array([str(column) for column in df.columns])}
+    for i, column in enumerate(df.columns):
+        values = [value if isinstance(value, bytes) else value.encode('utf-8') for value in df[column]]
+        if any(_SEPARATOR in value for value in values):
+            logger.warn('column {} holds NUL characters: no columnar copy is written'.format(column))
+            return
+        arrays['data_{}'.format(i)] = np.frombuffer(_SEPARATOR.join(values), dtype=np.uint8)
+        arrays['size_{}'.format(i)] = np.array(len(values))
+
+    tmp_file = '{}.tmp'.format(columnar_file)
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(tmp_file, columnar_file)
+
+
+def _read_columnar(columnar_file, checksum):
+    """
+    :return: the DataFrame stored in the columnar file, None if it does not exist or if its checksum differs
+    """
+    if not os.path.isfile(columnar_file):
+        return None
+    import pandas as pd
+
+    try:
+        arrays = np.load(columnar_file)
+        if str(arrays['checksum']) != checksum:
+            return None
+        columns = {}
+        names = [str(column) for column in arrays['columns']]
+        for i, name in enumerate(names):
+            data = arrays['data_{}'.format(i)].tobytes()
+            if bytes is not str:
+                data = data.decode('utf-8')
+            # the values are split at once, at C speed
+            values = data.split('\x00') if int(arrays['size_{}'.format(i)]) > 0 else []
+            columns[name] = values
+        return pd.DataFrame(columns, columns=names)
+    except (IOError, KeyError, ValueError) as err:
+        logger.warn('columnar copy {} ignored: {}'.format(columnar_file, err))
+        return None
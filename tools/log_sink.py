@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from Queue import Empty, Queue
+
+import gzip
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class LogSink:
+    def __init__(self, path, header, flush_size=1000, flush_interval=1., compress=False, append=False):
+        """
+        File written by a background thread, which buffers the lines and writes them by batches.
+
+        :param path: path of the file. '.gz' is appended to it when compress is True
+        :param header: first line of the file
+        :param flush_size: number of buffered lines which triggers a write
+        :param flush_interval: maximum seconds a line stays in the buffer
+        :param compress: if True, the file is written gzipped
+        :param append: if True, the lines are appended to the file, and the header is only written if it was empty
+        """
+        self.path = '{}.gz'.format(path) if compress else path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        mode = 'ab' if append else 'wb'
+        with_header = not append or not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        # appended gzip members are read back as a single stream
+        self._file = gzip.open(self.path, mode) if compress else open(self.path, mode)
+        if with_header:
+            self._file.write(header)
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, name='log_sink:{}'.format(self.path))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, line):
+        """
+        :param line: encoded line, ending with a new line
+        """
+        self._queue.put(line)
+
+    def close(self):
+        """
+        Write the buffered lines and close the file
+        """
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+    def _run(self):
+        buffer = []
+        last_flush = time.time()
+        closed = False
+        while not closed:
+            timeout = max(0., self.flush_interval - (time.time() - last_flush))
+            try:
+                line = self._queue.get(timeout=timeout)
+                if line is _CLOSE:
+                    closed = True
+                else:
+                    buffer.append(line)
+            except Empty:
+                pass
+            if buffer and (closed or len(buffer) >= self.flush_size or
+                           time.time() - last_flush >= self.flush_interval):
+                self._file.write(b''.join(buffer))
+                self._file.flush()
+                buffer = []
+            if not buffer:
+                last_flush = time.time()
+        self._file.close()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+from tools import lazy
+
+"""
+Every metric is computed from a confusion matrix: confusion[..., i, j] is the number of sentences
+of intent i predicted as intent j. The metrics accept a stack of matrices (shape (..., k, k))
+and then return one score per matrix.
+"""
+
+np = lazy.module('numpy')
+
+METRICS = {}
+# metrics which also take the latency of the api
+LATENCY_METRICS = set()
+
+
+def register(name, latency=False):
+    """
+    Decorator adding a metric to the registry.
+    The function takes the confusion matrix and the index of the fallback intent in it.
+
+    :param latency: if True, the function also takes the 95th percentile of the latency of the api, in seconds
+    """
+    def decorator(func):
+        METRICS[name] = func
+        if latency:
+            LATENCY_METRICS.add(name)
+        return func
+
+    return decorator
+
+
+def compute(name, confusion, fallback_index, latency=None):
+    """
+    :param latency: 95th percentile of the latency of the api in seconds, None if unknown
+    :return: value of the metric. NaN for a latency-penalized metric whose latency is unknown:
+        scoring it without penalty would favor the apis read from the cache
+    """
+    if name in LATENCY_METRICS:
+        if latency is None:
+            return METRICS[name](confusion, fallback_index, 0.) * np.nan
+        return METRICS[name](confusion, fallback_index, latency)
+    return METRICS[name](confusion, fallback_index)
+
+
+def _divide(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1.), 0.)
+
+
+def counts(confusion, fallback_index):
+    """
+    :return: (n_found, n_fallback, n_error)
+        n_fallback counts the sentences wrongly predicted as fallback
+    """
+    n_all = confusion.sum(axis=(-2, -1))
+    n_found = np.trace(confusion, axis1=-2, axis2=-1)
+    n_fallback = confusion[..., :, fallback_index].sum(axis=-1) - confusion[..., fallback_index, fallback_index]
+    return n_found, n_fallback, n_all - n_found - n_fallback
+
+
+@register('accuracy')
+def accuracy(confusion, fallback_index):
+    n_found, n_fallback, n_error = counts(confusion, fallback_index)
+    return _divide(n_found, n_found + n_fallback + n_error)
+
+
+@register('error_3_penalized')
+def error_3_penalized(confusion, fallback_index):
+    # error counts for 3 errors
+    n_found, n_fallback, n_error = counts(confusion, fallback_index)
+    return _divide(n_found, n_found + n_fallback + 3 * n_error)
+
+
+@register('error_10_penalized')
+def error_10_penalized(confusion, fallback_index):
+    n_found, n_fallback, n_error = counts(confusion, fallback_index)
+    return _divide(n_found, n_found + n_fallback + 10 * n_error)
+
+
+@register('accuracy_latency_penalized', latency=True)
+def accuracy_latency_penalized(confusion, fallback_index, latency):
+    # the accuracy is halved for an api answering in 1 second
+    return accuracy(confusion, fallback_index) / (1. + latency)
+
+
+@register('error_3_latency_penalized', latency=True)
+def error_3_latency_penalized(confusion, fallback_index, latency):
+    return error_3_penalized(confusion, fallback_index) / (1. + latency)
+
+
+def risk_rate(confusion, fallback_index):
+    n_found, n_fallback, n_error = counts(confusion, fallback_index)
+    return 1 - _divide(n_fallback, n_found + n_fallback + n_error)
+
+
+def precision_recall_f1(confusion):
+    """
+    :return: (precision, recall, f1), each one of shape (..., k): one value per intent
+    """
+    true_positives = np.diagonal(confusion, axis1=-2, axis2=-1)
+    precision = _divide(true_positives, confusion.sum(axis=-2))
+    recall = _divide(true_positives, confusion.sum(axis=-1))
+    f1 = _divide(2 * precision * recall, precision + recall)
+    return precision, recall, f1
+
+
+def _macro(values, confusion):
+    # average over the intents present in the test set
+    support = confusion.sum(axis=-1) > 0
+    return _divide((values * support).sum(axis=-1), support.sum(axis=-1))
+
+
+@register('macro_precision')
+def macro_precision(confusion, fallback_index):
+    return _macro(precision_recall_f1(confusion)[0], confusion)
+
+
+@register('macro_recall')
+def macro_recall(confusion, fallback_index):
+    return _macro(precision_recall_f1(confusion)[1], confusion)
+
+
+@register('macro_f1')
+def macro_f1(confusion, fallback_index):
+    return _macro(precision_recall_f1(confusion)[2], confusion)
+
+
+def intent_scores(confusion, labels):
+    """
+    :param labels: name of the intent of each row of the confusion matrix
+    :return: dictionary intent -> {'precision', 'recall', 'f1', 'support'} for the intents of the test set
+    """
+    precision, recall, f1 = precision_recall_f1(confusion)
+    support = confusion.sum(axis=-1)
+    scores = {}
+    for i, label in enumerate(labels):
+        if support[i] > 0:
+            scores[label] = {
+                'precision': float(precision[i]),
+                'recall': float(recall[i]),
+                'f1': float(f1[i]),
+                'support': int(support[i])
+            }
+    return scores
+
+
+def _text(values):
+    return [value.decode('utf-8') if isinstance(value, bytes) else value for value in values]
+
+
+def encode(y_true, y_pred, fallback_name):
+    """
+    Encode the expected and predicted intents as integers. Intents are compared case-insensitively.
+
+    :return: (true_codes, pred_codes, labels, fallback_index)
+        labels is the name of the intent of each code
+    """
+    values = np.char.lower(np.asarray(_text([fallback_name] + list(y_true) + list(y_pred))))
+    labels, codes = np.unique(values, return_inverse=True)
+    n_true = len(y_true)
+    return codes[1:1 + n_true], codes[1 + n_true:], labels.tolist(), int(codes[0])
+
+
+def map_fallback(true_codes, pred_codes, labels, fallback_index, fallback_name):
+    """
+    Encode again intents encoded with another fallback intent: the intents predicted as the former fallback
+    are fallen back to fallback_name, and an intent named fallback_name is merged into it.
+
+    :return: (true_codes, pred_codes, labels, fallback_index), as encode
+    """
+    fallback_name = _text([fallback_name])[0].lower()
+    labels = list(labels)
+    codes = np.arange(len(labels))
+    if fallback_name in labels and labels.index(fallback_name) != fallback_index:
+        merged = labels.index(fallback_name)
+        codes[merged + 1:] -= 1
+        fallback_index -= int(fallback_index > merged)
+        codes[merged] = fallback_index
+        del labels[merged]
+    labels[fallback_index] = fallback_name
+    return codes[true_codes], codes[pred_codes], labels, fallback_index
+
+
+def confusion_matrix(true_codes, pred_codes, n_labels):
+    """
+    :return: confusion matrix of shape (n_labels, n_labels)
+    """
+    confusion = np.bincount(true_codes * n_labels + pred_codes, minlength=n_labels * n_labels)
+    return confusion.reshape(n_labels, n_labels)
+
+
+def grow(confusion, n_labels):
+    """
+    :return: the confusion matrices (shape (..., k, k)) padded with zeros to n_labels intents
+    """
+    n_missing = n_labels - confusion.shape[-1]
+    if n_missing <= 0:
+        return confusion
+    padding = [(0, 0)] * (confusion.ndim - 2) + [(0, n_missing), (0, n_missing)]
+    return np.pad(confusion, padding, 'constant')
+
+
+class ConfusionAccumulator:
+    def __init__(self, fallback_name):
+        """
+        Confusion matrix updated batch by batch, for test sets too large to be held in memory.
+        Intents are compared case-insensitively, and numbered in the order they appear.
+        """
+        self.labels = [_text([fallback_name])[0].lower()]
+        self.fallback_index = 0
+        self.confusion = np.zeros((1, 1), dtype=np.int64)
+        self._codes = {self.labels[0]: 0}
+
+    def encode(self, intents):
+        """
+        :return: the codes of the intents, new intents being added to labels
+        """
+        if len(intents) == 0:
+            return np.zeros(0, dtype=np.int64)
+        values, inverse = np.unique(np.char.lower(np.asarray(_text(intents))), return_inverse=True)
+        codes = []
+        for value in values.tolist():
+            if value not in self._codes:
+                self._codes[value] = len(self.labels)
+                self.labels.append(value)
+            codes.append(self._codes[value])
+        return np.asarray(codes, dtype=np.int64)[inverse]
+
+    def add(self, y_true, y_pred):
+        """
+        :return: (true_codes, pred_codes) of the batch
+        """
+        true_codes = self.encode(y_true)
+        pred_codes = self.encode(y_pred)
+        self.confusion = grow(self.confusion, len(self.labels))
+        self.confusion += confusion_matrix(true_codes, pred_codes, len(self.labels))
+        return true_codes, pred_codes
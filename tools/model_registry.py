@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self, path, max_size, keep_models=False):
+        """
+        Persistent mapping between the key of a trained model (see fingerprint.model_key)
+        and the remote artifact (agent, bot, app...) which currently holds it.
+
+        :param path: json file where the registry is stored
+        :param max_size: maximum number of models kept per api.
+            The least recently used models over this limit are released
+        :param keep_models: if True, while there is room, the artifact of a registered model is kept and the next fit
+            creates a new one, uploading all its data. Else the artifact is synced with the new data, and its model
+            is forgotten
+        """
+        self.path = path
+        self.max_size = max_size
+        self.keep_models = keep_models
+        self._lock = threading.Lock()
+        self._models = {}
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                self._models = json.loads(f.read())
+
+    def lookup(self, key):
+        """
+        :return: the artifact holding the model, None if it is not deployed
+        """
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                return None
+            model['last_used'] = time.time()
+            self._save()
+            return model['artifact']
+
+    def peek(self, key):
+        """
+        Read-only lookup: the model is not marked as used and the registry is not written (see planner)
+
+        :return: the artifact holding the model, None if it is not deployed
+        """
+        with self._lock:
+            model = self._models.get(key)
+            return None if model is None else model['artifact']
+
+    def holds(self, api_name, artifact):
+        """
+        :return: True if the artifact holds a model of the registry
+        """
+        with self._lock:
+            return any(model['api'] == api_name and model['artifact'] == artifact
+                       for model in self._models.values())
+
+    def has_room(self, api_name):
+        """
+        :return: True if another model of the api can be kept without evicting one
+        """
+        with self._lock:
+            return sum(1 for model in self._models.values() if model['api'] == api_name) < self.max_size
+
+    def forget(self, api_name, artifact):
+        """
+        Forget the models held by an artifact which is about to be overwritten
+        """
+        with self._lock:
+            former_keys = [key for key, model in self._models.items()
+                           if model['api'] == api_name and model['artifact'] == artifact]
+            for key in former_keys:
+                del self._models[key]
+            if former_keys:
+                self._save()
+
+    def record(self, key, api_name, artifact):
+        """
+        Register that the artifact now holds the model.
+        Models formerly held by the same artifact are forgotten since they have been overwritten.
+
+        :return: list of the artifacts evicted from the registry, which the api may delete
+        """
+        with self._lock:
+            for former_key in list(self._models):
+                model = self._models[former_key]
+                if model['api'] == api_name and model['artifact'] == artifact:
+                    del self._models[former_key]
+            self._models[key] = {'api': api_name, 'artifact': artifact, 'last_used': time.time()}
+
+            api_keys = sorted((model_key for model_key in self._models if self._models[model_key]['api'] == api_name),
+                              key=lambda model_key: self._models[model_key]['last_used'])
+            evicted = []
+            for model_key in api_keys[:max(0, len(api_keys) - self.max_size)]:
+                evicted.append(self._models.pop(model_key)['artifact'])
+            self._save()
+            return evicted
+
+    def _save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(self._models))
+        os.rename(tmp_path, self.path)
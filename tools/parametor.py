@@ -2,42 +2,146 @@
 
 from api_managers import api_builder
 from tools import loader
+from tools.scheduler import Scheduler
 
+import itertools
 import logging
+import math
+import random
 
 logger = logging.getLogger(__name__)
 
 
 class Parametor:
-    def __init__(self, api, criteria, scorer, fallback_name):
+    def __init__(self, api, criteria, scorer, fallback_name, n_workers=1, search='single', n_random_candidates=10,
+                 halving_rate=None, random_state=42, run=None):
+        """
+        :param n_workers: maximum number of parameter values scored at the same time.
+            Each value also waits for a free agent in the pool of the api
+        :param search: 'single' to tune the parameters one at a time,
+            'grid' to try every combination of the parameters, 'random' to try n_random_candidates of them
+        :param halving_rate: if set, successive halving is used: every candidate is scored on one fold,
+            then only the best 1 / halving_rate candidates are scored on halving_rate times more folds, and so on.
+            The candidates are ranked on the first metric of the scorer
+        :param run: result_store.Run recording the scores of every fold, or None
+        """
         self.criteria = criteria
         self.api = api
         self.scorer = scorer
         self.fallback_name = fallback_name
+        self.n_workers = n_workers
+        self.search = search
+        self.n_random_candidates = n_random_candidates
+        self.halving_rate = halving_rate
+        self.random_state = random_state
+        self.run = run
         self.results = {}
+        # language -> criterion -> parameter -> value -> metric -> [low, high], kept apart from the scores
+        self.confidence_intervals = {}
 
-    def _score_one_parameter(self, parameters, language, criterion, parameter_name):
+    def _score_candidates(self, df, language, criterion, candidates, keys):
+        """
+        :param candidates: list of dictionaries parameter name -> parameter value
+        :param keys: (parameter, value) under which each candidate is reported
+        :return: list of the aggregated result of each candidate (see Scorer.aggregate), over the folds
+            it has been scored on before being dropped
+        """
+        scorers = []
+        for candidate in candidates:
+            api_factory = api_builder.ApiFactory(api_name=self.api, fallback_name=self.fallback_name,
+                                                 language=language, params=candidate)
+            scorer = self.scorer.clone()
+            scorer.fit(api_factory, df, language=language, params=candidate, criterion=criterion)
+            scorers.append(scorer)
 
-        result = {}
-        df = loader.load(language, criterion)
+        n_fold = self.scorer.n_fold
+        fold_results = [[] for _ in candidates]
+        survivors = list(range(len(candidates)))
+        n_folds = 1 if self.halving_rate else n_fold
+        while True:
+            units = [(self.api, self._candidate_unit(scorers[i], candidates[i], range(len(fold_results[i]), n_folds)))
+                     for i in survivors]
+            for i, results in zip(survivors, Scheduler(self.n_workers, {self.api: self.n_workers}).run(units)):
+                fold_results[i].extend(results)
+            if n_folds >= n_fold:
+                break
 
-        for parameter_value in parameters:
-            logger.info('\t\t\t{}={}'.format(parameter_name, parameter_value))
-            builder_params = {parameter_name: parameter_value}
-            api_manager = api_builder.build_api(api_name=self.api, fallback_name=self.fallback_name, language=language,
-                                                params=builder_params)
-            self.scorer.fit(api_manager, df)
-            self.scorer.score()
-            scores = self.scorer.scores
-            result[parameter_value] = scores
-        return result
+            metric = self.scorer.metrics[0]
+            survivors.sort(key=lambda i: self.scorer.aggregate(fold_results[i], with_intervals=False)['scores'][metric],
+                           reverse=True)
+            n_survivors = int(math.ceil(len(survivors) / float(self.halving_rate)))
+            for i in survivors[n_survivors:]:
+                logger.info('\t\t\tdrop {} after {} folds'.format(candidates[i], n_folds))
+            survivors = survivors[:n_survivors]
+            # the last candidate is directly scored on every fold
+            n_folds = n_fold if n_survivors == 1 else min(n_fold, n_folds * self.halving_rate)
+
+        aggregated = []
+        for (parameter, value), results in zip(keys, fold_results):
+            result = self.scorer.aggregate(results)
+            if self.run is not None:
+                self.run.record(language, criterion, self.api, results, result['confidence_intervals'],
+                                parameter, value)
+            aggregated.append(result)
+        return aggregated
+
+    def _candidate_unit(self, scorer, candidate, folds):
+        def score():
+            logger.info('\t\t\t{}: folds {}'.format(candidate, list(folds)))
+            return scorer.score_folds(folds)
+
+        return score
+
+    def _combinations(self, parameters, names):
+        combinations = [dict(zip(names, values)) for values in
+                        itertools.product(*[parameters[name] for name in names])]
+        if self.search == 'random' and len(combinations) > self.n_random_candidates:
+            combinations = random.Random(self.random_state).sample(combinations, self.n_random_candidates)
+        return combinations
+
+    def candidate_groups(self, parameters):
+        """
+        :return: list of (parameter, candidates, keys) of the groups of candidates compared together (see
+            _score_candidates): one group per parameter with the single search, one group of combinations else
+        """
+        if self.search == 'single':
+            return [(parameter_name, [{parameter_name: value} for value in parameters[parameter_name]],
+                     [(parameter_name, value) for value in parameters[parameter_name]])
+                    for parameter_name in parameters]
+
+        # the combinations are reported as one parameter 'name_1,name_2' of value 'value_1,value_2'
+        names = sorted(parameters)
+        candidates = self._combinations(parameters, names)
+        keys = [(','.join(names), ','.join(str(candidate[name]) for name in names)) for candidate in candidates]
+        return [(','.join(names), candidates, keys)]
+
+    def folds_per_candidate(self, n_candidates):
+        """
+        :return: number of folds each of n_candidates is scored on (see halving_rate), the best ranked first
+        """
+        n_fold = self.scorer.n_fold
+        if not self.halving_rate:
+            return [n_fold] * n_candidates
+        n_folds = [0] * n_candidates
+        n_survivors = n_candidates
+        round_folds = 1
+        while True:
+            n_folds[:n_survivors] = [round_folds] * n_survivors
+            if round_folds >= n_fold:
+                return n_folds
+            n_survivors = int(math.ceil(n_survivors / float(self.halving_rate)))
+            round_folds = n_fold if n_survivors == 1 else min(n_fold, round_folds * self.halving_rate)
 
     def _score_parameter_for_criterion(self, language, parameters, criterion):
         result = {}
-        for parameter_name in parameters:
-            logger.info('\t\tparameter: {}'.format(parameter_name))
-            result[parameter_name] = self._score_one_parameter(parameters[parameter_name], language, criterion,
-                                                               parameter_name)
+        intervals = self.confidence_intervals.setdefault(language, {}).setdefault(criterion, {})
+        df = loader.load(language, criterion)
+        for parameter, candidates, keys in self.candidate_groups(parameters):
+            logger.info('\t\tparameter: {}'.format(parameter))
+            aggregated = self._score_candidates(df, language, criterion, candidates, keys)
+            result[parameter] = dict((value, aggregate['scores']) for (_, value), aggregate in zip(keys, aggregated))
+            intervals[parameter] = dict((value, aggregate['confidence_intervals'])
+                                        for (_, value), aggregate in zip(keys, aggregated))
 
         return result
 
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from Queue import Empty, Full, Queue
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(queue, item, stop):
+    # a full queue blocks the stage (backpressure) until the next stage takes an item or the pipeline stops
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _get(queue, stop):
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            pass
+    return _END
+
+
+def _feed(source, output, stop):
+    try:
+        for item in source:
+            if not _put(output, item, stop):
+                return
+        _put(output, _END, stop)
+    except Exception as err:
+        logger.exception('pipeline source failed')
+        _put(output, _Failure(err), stop)
+
+
+def _work(stage, input_queue, output, stop):
+    while True:
+        item = _get(input_queue, stop)
+        if item is _END or isinstance(item, _Failure):
+            _put(output, item, stop)
+            return
+        try:
+            result = stage(item)
+        except Exception as err:
+            logger.exception('pipeline stage failed')
+            _put(output, _Failure(err), stop)
+            return
+        if not _put(output, result, stop):
+            return
+
+
+def iterate(source, stages, queue_size=2):
+    """
+    Pass the items of source through the stages, each one running in its own thread.
+    The threads are linked by queues of queue_size items: a slow stage makes the previous ones wait,
+    so that at most about queue_size items per stage are held in memory.
+
+    :param source: iterable of the items (read in its own thread)
+    :param stages: list of functions taking the output of the previous stage
+    :return: generator of the outputs of the last stage, in the order of the source.
+        The first error raised by the source or a stage is raised again here
+    """
+    stop = threading.Event()
+    queues = [Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_feed, args=(source, queues[0], stop), name='pipeline:source')]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_work, args=(stage, queues[i], queues[i + 1], stop),
+                                        name='pipeline:stage_{}'.format(i)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while True:
+            item = _get(queues[-1], stop)
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # the consumer stopped (end, error or generator closed): the threads stop at their next queue operation
+        stop.set()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from api_managers import api_builder
+from api_managers import readiness
+from tools import lazy
+from tools import loader
+
+import logging
+
+np = lazy.module('numpy')
+
+logger = logging.getLogger(__name__)
+
+
+class Planner:
+    def __init__(self, scorer, fallback_name, timings=None, budgets=None):
+        """
+        Estimate the requests a comparison or a parameter search would send to every api, and its duration,
+        without sending any. The folds already checkpointed, the predictions cached and the models registered
+        are not counted.
+
+        :param scorer: Scorer of the run
+        :param timings: dictionary api -> list of the timings measured by former runs (see Scorer.timing),
+            used to estimate the number of readiness probes and the durations
+        :param budgets: dictionary api -> budget of requests (see settings.CALL_BUDGETS), reported alongside
+        """
+        self.scorer = scorer
+        self.fallback_name = fallback_name
+        self.timings = timings or {}
+        self.budgets = budgets or {}
+        self.plan = {}
+        # api -> number of its agents
+        self._sizes = {}
+
+    def plan_comparator(self, criteria, apis):
+        for language in criteria:
+            for criterion in criteria[language]:
+                df = loader.load(language, criterion)
+                for api in apis:
+                    self._plan_unit(api, language, criterion, df, {}, range(self.scorer.n_fold))
+        return self._finish()
+
+    def plan_parametor(self, api, criteria, parameters, parametor):
+        """
+        :param parametor: Parametor of the run, giving the candidates and the folds they are scored on
+        """
+        for language in criteria:
+            for criterion in criteria[language]:
+                df = loader.load(language, criterion)
+                for _, candidates, _ in parametor.candidate_groups(parameters):
+                    for candidate, n_folds in zip(candidates, parametor.folds_per_candidate(len(candidates))):
+                        self._plan_unit(api, language, criterion, df, candidate, range(n_folds))
+        return self._finish()
+
+    def _plan_unit(self, api, language, criterion, df, params, folds):
+        api_factory = api_builder.ApiFactory(api_name=api, fallback_name=self.fallback_name, language=language,
+                                             params=params)
+        scorer = self.scorer.clone()
+        scorer.fit(api_factory, df, language=language, params=params, criterion=criterion)
+        timing = self._timing(api)
+        n_probes = readiness.expected_probes(timing['time_to_ready'])
+        manager_class = api_builder.get_manager_class(api)
+
+        self._sizes[api] = api_factory.size
+        api_plan = self.plan.setdefault(api, {'fits': 0, 'sentences': 0,
+                                              'calls': {'fit': 0, 'predict': 0, 'delete': 0}})
+        for fold in scorer.plan_folds(folds):
+            if fold['fit']:
+                api_plan['fits'] += 1
+            api_plan['sentences'] += fold['n_test']
+            if not fold['fit'] and fold['n_test'] == 0:
+                continue
+            calls = manager_class.estimate_calls(fold['n_intents'], fold['n_train'], fold['n_test'], n_probes)
+            if calls is None:
+                api_plan['calls'] = None
+            elif api_plan['calls'] is not None:
+                if not fold['fit']:
+                    calls = dict(calls, fit=0, delete=0)
+                for key in api_plan['calls']:
+                    api_plan['calls'][key] += calls[key]
+
+    def _finish(self):
+        """
+        :return: dictionary api -> estimation with
+            - fits: number of trainings
+            - sentences: number of sentences predicted
+            - calls: requests sent to train ('fit'), predict ('predict') and delete ('delete'), their 'total',
+                None if the api gives no estimation
+            - budget: budget of requests of the api, None if unlimited
+            - duration: seconds spent training and predicting, one fold after another, None if never measured
+            - wall_time: duration divided by the number of folds scored at the same time
+        """
+        for api, api_plan in self.plan.items():
+            if api_plan['calls'] is not None:
+                api_plan['calls']['total'] = sum(api_plan['calls'].values())
+            api_plan['budget'] = self.budgets.get(api)
+            timing = self._timing(api)
+            api_plan['duration'] = None
+            if api_plan['fits'] == 0 and api_plan['sentences'] == 0:
+                api_plan['duration'] = 0.
+            elif timing['fit_duration'] is not None and timing['throughput']:
+                # the fit duration includes the wait for the model to be ready
+                api_plan['duration'] = (api_plan['fits'] * timing['fit_duration'] +
+                                        api_plan['sentences'] / timing['throughput'])
+            api_plan['wall_time'] = None
+            if api_plan['duration'] is not None:
+                api_plan['wall_time'] = api_plan['duration'] / max(1, min(self.scorer.fold_workers, self._sizes[api]))
+
+            logger.info('\t{}: {} fits, {} sentences, requests {}, budget {}, wall time {}'.format(
+                api, api_plan['fits'], api_plan['sentences'], api_plan['calls'], api_plan['budget'],
+                'unknown' if api_plan['wall_time'] is None else '{:.0f}s'.format(api_plan['wall_time'])))
+            budget = api_plan['budget'] or {}
+            if api_plan['calls'] is not None and budget.get('calls') is not None and budget.get('period') is None \
+                    and api_plan['calls']['total'] > budget['calls']:
+                logger.warn('\t{}: about {} requests for a budget of {}: the run would be aborted'.format(
+                    api, api_plan['calls']['total'], budget['calls']))
+        return self.plan
+
+    def _timing(self, api):
+        """
+        :return: fit_duration, time_to_ready and throughput of the api averaged over the former runs,
+            None when never measured
+        """
+        timing = {}
+        for key in ['fit_duration', 'time_to_ready', 'throughput']:
+            values = [run_timing[key] for run_timing in self.timings.get(api, [])
+                      if run_timing and run_timing.get(key) is not None]
+            timing[key] = float(np.mean(values)) if values else None
+        return timing
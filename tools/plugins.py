@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def discover(folder):
+    """
+    :param folder: plugin folder, a package relative to the working directory (see settings.PLUGINS_FOLDER)
+    :return: names of the modules and packages of the folder, in alphabetical order
+    """
+    if not folder or not os.path.isdir(folder):
+        return []
+    package = os.path.normpath(folder).replace(os.sep, '.')
+    names = []
+    for entry in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(entry)
+        if name.startswith('_'):
+            continue
+        if extension == '.py' or os.path.isfile(os.path.join(folder, entry, '__init__.py')):
+            names.append('{}.{}'.format(package, name))
+    return names
+
+
+def load(folder, modules=()):
+    """
+    Import the plugins of the folder, then the modules listed, so that they register their apis and metrics
+
+    :param modules: names of other plugin modules (see settings.PLUGINS)
+    """
+    names = discover(folder)
+    for name in names + [module for module in modules if module not in names]:
+        logger.debug('load plugin {}'.format(name))
+        importlib.import_module(name)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from tools import fingerprint
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    def __init__(self, path, max_size):
+        """
+        On-disk cache of the predictions of the apis, evicting the least recently used entries.
+        The latency of every prediction is kept with it, so that the latency-penalized metrics of a fold
+        read from the cache are still penalized.
+
+        :param path: sqlite file where the predictions are stored
+        :param max_size: maximum number of predictions kept
+        """
+        self.path = path
+        self.max_size = max_size
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.text_factory = str
+        self._conn.execute('CREATE TABLE IF NOT EXISTS predictions '
+                           '(key TEXT PRIMARY KEY, intent TEXT, last_used REAL, latency REAL)')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(predictions)')]
+        if 'latency' not in columns:
+            # cache written before the latencies were kept: their latency is unknown
+            self._conn.execute('ALTER TABLE predictions ADD COLUMN latency REAL')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+        self._conn.commit()
+
+    def get_many(self, fold_key, sentences):
+        """
+        :param fold_key: key of the model which made the predictions (see fingerprint.model_key)
+        :return: dictionary sentence -> (intent, latency) of the sentences found in the cache,
+            latency being the seconds the api took to answer, None if unknown
+        """
+        return self._select(fold_key, sentences, touch=True)
+
+    def peek_many(self, fold_key, sentences):
+        """
+        Read-only get_many: the predictions found are not marked as used, so that
+        a plan does not change which entries are evicted next (see planner)
+
+        :return: dictionary sentence -> (intent, latency), as get_many
+        """
+        return self._select(fold_key, sentences, touch=False)
+
+    def _select(self, fold_key, sentences, touch):
+        """
+        :param touch: if True, the last use of the predictions found is updated
+        """
+        keys = dict((fingerprint.hash_values(fold_key, sentence), sentence) for sentence in set(sentences))
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = self._conn.execute(
+                    'SELECT key, intent, latency FROM predictions WHERE key IN ({})'.format(
+                        ','.join('?' * len(chunk))),
+                    chunk
+                ).fetchall()
+                for key, intent, latency in rows:
+                    found[keys[key]] = (intent, latency)
+                if touch:
+                    self._conn.executemany('UPDATE predictions SET last_used = ? WHERE key = ?',
+                                           [(time.time(), row[0]) for row in rows])
+            if touch:
+                self._conn.commit()
+        return found
+
+    def set_many(self, fold_key, predictions, latencies=None):
+        """
+        :param predictions: dictionary sentence -> intent
+        :param latencies: dictionary sentence -> seconds the api took to answer, None if unknown
+        """
+        now = time.time()
+        latencies = latencies or {}
+        rows = [(fingerprint.hash_values(fold_key, sentence), intent, now, latencies.get(sentence))
+                for sentence, intent in predictions.items()]
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO predictions (key, intent, last_used, latency) '
+                                   'VALUES (?, ?, ?, ?)', rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        size = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        if size <= self.max_size:
+            return
+        logger.debug('prediction cache: evicting {} entries'.format(size - self.max_size))
+        self._conn.execute('DELETE FROM predictions WHERE key IN '
+                           '(SELECT key FROM predictions ORDER BY last_used ASC LIMIT ?)', (size - self.max_size,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from tools import lazy
+
+import json
+import os
+
+np = lazy.module('numpy')
+
+
+def write(path, predictions, timing):
+    """
+    Store the prediction matrix of a fold in a compressed numpy file: the codes of the expected and predicted
+    intent of every sentence, in the smallest integer type holding them, and the name of every code.
+
+    :param predictions: codes of the expected and predicted intents (see Scorer._score_fold)
+    :param timing: timing of the fold (see Scorer._fold_timing)
+    """
+    labels = list(predictions['labels'])
+    dtype = np.min_scalar_type(max(len(labels) - 1, 0))
+    arrays = {
+        'true': np.asarray(predictions['true'], dtype=dtype),
+        'pred': np.asarray(predictions['pred'], dtype=dtype),
+        'labels': np.array([label if isinstance(label, bytes) else label.encode('utf-8') for label in labels]),
+        'fallback_index': np.array(predictions['fallback_index']),
+        'timing': np.array(json.dumps(timing))
+    }
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # created meanwhile by the fold of another thread
+            if not os.path.isdir(folder):
+                raise
+
+    tmp_file = '{}.tmp'.format(path)
+    with open(tmp_file, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.rename(tmp_file, path)
+
+
+def read(path):
+    """
+    :return: (predictions, timing) of the fold stored in path, as given to write
+    """
+    arrays = np.load(path)
+    predictions = {
+        'true': arrays['true'].astype(np.int64),
+        'pred': arrays['pred'].astype(np.int64),
+        'labels': [label.decode('utf-8') for label in arrays['labels'].tolist()],
+        'fallback_index': int(arrays['fallback_index'])
+    }
+    timing = json.loads(str(arrays['timing']))
+    predictions['latency'] = timing['latency']['p95']
+    return predictions, timing
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+from tools import fingerprint
+from tools import prediction_store
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, action TEXT, started_at REAL, '
+    'config TEXT)',
+    'CREATE TABLE IF NOT EXISTS scores (run_id INTEGER, language TEXT, criterion TEXT, api TEXT, parameter TEXT, '
+    'value TEXT, fold INTEGER, metric TEXT, score REAL)',
+    'CREATE TABLE IF NOT EXISTS intervals (run_id INTEGER, language TEXT, criterion TEXT, api TEXT, parameter TEXT, '
+    'value TEXT, metric TEXT, low REAL, high REAL)',
+    'CREATE TABLE IF NOT EXISTS predictions (run_id INTEGER, language TEXT, criterion TEXT, api TEXT, '
+    'parameter TEXT, value TEXT, fold INTEGER, path TEXT)',
+    'CREATE INDEX IF NOT EXISTS scores_by_run ON scores (run_id, language, criterion, metric, parameter, value)',
+    'CREATE INDEX IF NOT EXISTS scores_by_criterion ON scores (language, criterion, metric, api)',
+    'CREATE INDEX IF NOT EXISTS intervals_by_run ON intervals (run_id, language, criterion, metric, parameter, value)',
+    'CREATE INDEX IF NOT EXISTS predictions_by_run ON predictions (run_id)'
+]
+
+# score of every (parameter, value) of a run, averaged over the n_fold folds it has been scored on
+_MEAN_SCORES = '''
+    SELECT language, criterion, metric, parameter, value, AVG(score) AS score, COUNT(DISTINCT fold) AS n_fold
+    FROM scores WHERE run_id = ?
+    GROUP BY language, criterion, metric, parameter, value
+'''
+
+
+class ResultStore:
+    def __init__(self, path, predictions_folder=None):
+        """
+        Append-only store of the scores of every run: one row per run, language, criterion, api,
+        (parameter, value), fold and metric, and the bootstrap interval of every (parameter, value).
+        The values are stored json encoded; the comparator stores its apis with the parameter '' and the value null.
+
+        :param path: sqlite file of the store
+        :param predictions_folder: folder where the prediction matrix of every fold is persisted
+            (see prediction_store), so that the runs can be scored again offline. None to persist none
+        """
+        self.path = path
+        self.predictions_folder = predictions_folder
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.text_factory = str
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def start_run(self, action, config=None, keep_predictions=True):
+        """
+        :param action: 'comparator', 'parametor' or 'rescore'
+        :param config: json serializable settings of the run
+        :param keep_predictions: if False, the prediction matrices of the folds are not persisted
+        :return: Run recording the scores of the run
+        """
+        with self._lock:
+            cursor = self._conn.execute('INSERT INTO runs (action, started_at, config) VALUES (?, ?, ?)',
+                                        (action, time.time(), json.dumps(config or {})))
+            self._conn.commit()
+        predictions_folder = None
+        if keep_predictions and self.predictions_folder is not None:
+            predictions_folder = os.path.join(self.predictions_folder, str(cursor.lastrowid))
+        return Run(self, cursor.lastrowid, predictions_folder)
+
+    def get_run(self, run_id):
+        """
+        :return: (action, config) of a run, None if it does not exist
+        """
+        rows = self._query('SELECT action, config FROM runs WHERE run_id = ?', (run_id,))
+        if not rows:
+            return None
+        return rows[0][0], json.loads(rows[0][1])
+
+    def last_predictions_run(self):
+        """
+        :return: id of the last run whose predictions were persisted, None if there is none
+        """
+        return self._query('SELECT MAX(run_id) FROM predictions', ())[0][0]
+
+    def predictions(self, run_id):
+        """
+        :return: list of (language, criterion, api, parameter, value, fold, path) of the prediction matrices
+            persisted by a run, path being the file read by prediction_store.read
+        """
+        rows = self._query('SELECT language, criterion, api, parameter, value, fold, path FROM predictions '
+                           'WHERE run_id = ? ORDER BY language, criterion, api, parameter, value, fold', (run_id,))
+        return [row[:4] + (json.loads(row[4]),) + row[5:] for row in rows]
+
+    def mean_scores(self, run_id):
+        """
+        :return: list of (language, criterion, metric, parameter, value, score, low, high, n_fold),
+            score being averaged over the n_fold folds and [low, high] its confidence interval (None if not computed)
+        """
+        query = '''
+            SELECT m.language, m.criterion, m.metric, m.parameter, m.value, m.score, i.low, i.high, m.n_fold
+            FROM ({}) AS m LEFT JOIN intervals AS i
+            ON i.run_id = ? AND i.language = m.language AND i.criterion = m.criterion AND i.metric = m.metric
+            AND i.parameter = m.parameter AND i.value = m.value
+        '''.format(_MEAN_SCORES)
+        rows = self._query(query, (run_id, run_id))
+        return [row[:4] + (json.loads(row[4]),) + row[5:] for row in rows]
+
+    def best_values(self, run_id):
+        """
+        :return: list of (language, criterion, metric, parameter, value) giving the value of every parameter
+            with the best mean score. Only the values scored on the most folds compete: the candidates dropped
+            by successive halving were scored on too few folds for their mean to be compared
+        """
+        # sqlite takes the bare columns of the row holding the maximum
+        query = '''
+            SELECT m.language, m.criterion, m.metric, m.parameter, m.value, MAX(m.score)
+            FROM ({0}) AS m JOIN (
+                SELECT language, criterion, metric, parameter, MAX(n_fold) AS n_fold
+                FROM ({0}) GROUP BY language, criterion, metric, parameter
+            ) AS f
+            ON f.language = m.language AND f.criterion = m.criterion AND f.metric = m.metric
+            AND f.parameter = m.parameter AND f.n_fold = m.n_fold
+            GROUP BY m.language, m.criterion, m.metric, m.parameter
+        '''.format(_MEAN_SCORES)
+        return [row[:4] + (json.loads(row[4]),) for row in self._query(query, (run_id, run_id))]
+
+    def history(self, metric, language=None, criterion=None):
+        """
+        Compare the runs: score of every api and (parameter, value) of every run, averaged over the folds
+
+        :return: DataFrame with the columns run_id, action, started_at, language, criterion, api, parameter, value,
+            score and n_fold
+        """
+        conditions = ['s.metric = ?']
+        params = [metric]
+        if language is not None:
+            conditions.append('s.language = ?')
+            params.append(language)
+        if criterion is not None:
+            conditions.append('s.criterion = ?')
+            params.append(criterion)
+        query = '''
+            SELECT s.run_id, r.action, r.started_at, s.language, s.criterion, s.api, s.parameter, s.value,
+                AVG(s.score) AS score, COUNT(*) AS n_fold
+            FROM scores AS s JOIN runs AS r ON r.run_id = s.run_id
+            WHERE {}
+            GROUP BY s.run_id, s.language, s.criterion, s.api, s.parameter, s.value
+            ORDER BY s.run_id
+        '''.format(' AND '.join(conditions))
+        import pandas as pd
+
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, query, params):
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def _insert(self, scores, intervals, predictions):
+        with self._lock:
+            self._conn.executemany('INSERT INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', scores)
+            self._conn.executemany('INSERT INTO intervals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', intervals)
+            self._conn.executemany('INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?)', predictions)
+            self._conn.commit()
+
+
+class Run:
+    def __init__(self, store, run_id, predictions_folder=None):
+        """
+        :param predictions_folder: folder of the prediction matrices of the run, None if they are not persisted
+        """
+        self.store = store
+        self.run_id = run_id
+        self.predictions_folder = predictions_folder
+
+    def record(self, language, criterion, api, fold_results, confidence_intervals=None, parameter='', value=None):
+        """
+        Store the scores of an api, with a value of a parameter, on a criterion, and the prediction matrices
+        of its folds
+
+        :param fold_results: results of the folds scored (see Scorer.score_folds)
+        :param confidence_intervals: dictionary metric -> [low, high], or None
+        """
+        value = json.dumps(value)
+        key = (self.run_id, language, criterion, api, parameter, value)
+        scores = [key + (fold['fold'], metric, score)
+                  for fold in fold_results for metric, score in fold['scores'].items()]
+        intervals = [key + (metric, interval[0], interval[1])
+                     for metric, interval in (confidence_intervals or {}).items()]
+        predictions = []
+        if self.predictions_folder is not None:
+            for fold in fold_results:
+                path = os.path.join(self.predictions_folder, '{}.npz'.format(
+                    fingerprint.hash_values(language, criterion, api, parameter, value, fold['fold'])))
+                prediction_store.write(path, fold['predictions'], fold['timing'])
+                predictions.append(key + (fold['fold'], path))
+        self.store._insert(scores, intervals, predictions)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    def __init__(self, n_workers, limits=None, default_limit=1):
+        """
+        Run independent units of work concurrently.
+
+        :param n_workers: maximum number of units running at the same time
+        :param limits: dictionary group -> maximum number of units of the group running at the same time
+        :param default_limit: limit of the groups absent from limits
+        """
+        self.n_workers = max(1, n_workers)
+        self.limits = limits or {}
+        self.default_limit = default_limit
+
+    def run(self, units):
+        """
+        :param units: list of (group, function without argument)
+        :return: list of the values returned by the functions, in the same order as the units.
+            If a unit raises, no new unit is started and the first error is raised
+            once the running ones are done.
+        """
+        results = [None] * len(units)
+        errors = []
+        pending = list(range(len(units)))
+        running = {}
+        condition = threading.Condition()
+
+        def work(index):
+            group, function = units[index]
+            try:
+                results[index] = function()
+            except Exception as err:
+                logger.exception('unit {} of {} failed'.format(index, group))
+                errors.append(err)
+            finally:
+                with condition:
+                    running[group] -= 1
+                    condition.notify()
+
+        with condition:
+            while (pending and not errors) or sum(running.values()):
+                for index in list(pending):
+                    if errors or sum(running.values()) >= self.n_workers:
+                        break
+                    group = units[index][0]
+                    if running.get(group, 0) < max(1, self.limits.get(group, self.default_limit)):
+                        pending.remove(index)
+                        running[group] = running.get(group, 0) + 1
+                        thread = threading.Thread(target=work, args=(index,), name='unit:{}'.format(index))
+                        thread.daemon = True
+                        thread.start()
+                condition.wait(1.)
+
+        if errors:
+            raise errors[0]
+        return results
@@ -1,95 +1,511 @@
 # -*- coding: utf-8 -*-
 
-from sklearn.cross_validation import train_test_split
+from contextlib import contextmanager
+from tools import bootstrap
+from tools import fingerprint
+from tools import folds as fold_splits
+from tools import lazy
+from tools import metrics as metric_registry
+from tools import pipeline
+from tools.scheduler import Scheduler
 
 import logging
-import numpy as np
+import random
+import time
+
+np = lazy.module('numpy')
 
 logger = logging.getLogger(__name__)
 
 
 class Scorer:
-    def __init__(self, manager, metrics, fallback_name, n_fold=5, test_size=0.3, random_state=42):
+    def __init__(self, manager, metrics, fallback_name, n_fold=5, random_state=42, cache=None,
+                 registry=None, fold_workers=1, n_bootstrap=0, confidence=0.95, checkpoint=None):
         self.manager = manager
         self.metrics = metrics
         self.fallback_name = fallback_name
         self.n_fold = n_fold
-        self.test_size = test_size
         self.random_state = random_state
+        self.cache = cache
+        self.registry = registry
+        self.fold_workers = fold_workers
+        self.n_bootstrap = n_bootstrap
+        self.confidence = confidence
+        self.checkpoint = checkpoint
         self.scores = None
         self.api = None
         self.df = None
+        self.test_indices = None
+        self.language = None
+        self.params = None
         self.risk_rate = None
+        self.counts = None
+        self.intent_scores = None
+        self.confidence_intervals = None
+        self.timing = None
+        self.fold_results = None
+
+    def clone(self):
+        """
+        :return: a new scorer with the same configuration, to score another api concurrently
+        """
+        return Scorer(self.manager, self.metrics, self.fallback_name, n_fold=self.n_fold,
+                      random_state=self.random_state, cache=self.cache, registry=self.registry,
+                      fold_workers=self.fold_workers, n_bootstrap=self.n_bootstrap, confidence=self.confidence,
+                      checkpoint=self.checkpoint)
 
-    def fit(self, api, df, test_size=None, random_state=None):
+    def fit(self, api, df, random_state=None, language=None, params=None, criterion=None, split=True):
+        """
+        :param api: ApiManager, or api_builder.ApiFactory leasing a manager of the api for every fold.
+            With a factory whose pool holds several agents, up to fold_workers folds are scored concurrently
+        :param criterion: criterion of the language df has been loaded from (see loader.load).
+            When given, its stratified folds are shared with the other scorers of the criterion
+        :param split: if False, df is not split in folds: the scorer is only used by score_stream,
+            which trains on the whole of df
+        """
         self.api = api
         self.df = df
-        if test_size is not None:
-            self.test_size = test_size
+        self.language = language
+        self.params = params
         if random_state is not None:
             self.random_state = random_state
+        if not split:
+            self.test_indices = None
+        elif criterion is not None:
+            self.test_indices = fold_splits.get(language, criterion, self.n_fold, self.random_state)
+        else:
+            self.test_indices = fold_splits.split(df, self.n_fold, self.random_state)
 
     def score(self):
+        self.fold_results = self.score_folds(range(self.n_fold))
+        result = self.aggregate(self.fold_results)
+        self.scores = result['scores']
+        self.risk_rate = result['risk_rate']
+        self.counts = result['counts']
+        self.intent_scores = result['intents']
+        self.confidence_intervals = result['confidence_intervals']
+        self.timing = result['timing']
+        for metric in self.metrics:
+            logger.info('\t\t\t\tmetric {}: {}'.format(metric, self.scores[metric]))
+
+    def score_stream(self, chunks, queue_size=2):
+        """
+        Train the api on the whole data frame given to fit, then score it on a test set read by chunks,
+        too large to be held in memory. Reading, predicting and scoring run as a pipeline:
+        at most about queue_size chunks wait between two stages, so the api is never queried faster
+        than the chunks are scored. The confusion matrix and the bootstrap intervals are updated chunk by chunk.
+
+        :param chunks: iterable of DataFrames with the columns 'sentence' and 'intent' (see loader.iter_chunks)
+        """
+        accumulator = metric_registry.ConfusionAccumulator(self.fallback_name)
+        resamples = None
+        if self.n_bootstrap > 0:
+            resamples = bootstrap.StreamingBootstrap(self.n_bootstrap, self.random_state)
+        latencies = _LatencySample()
+        model_key = None
+        if self.cache is not None or self.registry is not None:
+            model_key = fingerprint.model_key(str(self.api), self.language, self.params,
+                                              fingerprint.hash_dataframe(self.df))
+        # the api is trained when the first sentence missing from the cache is met
+        timing = {'fitted': False, 'fit_duration': None, 'time_to_ready': None, 'predict_duration': 0., 'n_queried': 0}
+
+        with self._lease_api() as api:
+            def fit_once():
+                if not timing['fitted']:
+                    start = time.time()
+                    timing['fitted'] = True
+                    if self._fit(api, self.df, model_key):
+                        timing['fit_duration'] = time.time() - start
+                        timing['time_to_ready'] = api.time_to_ready
+
+            def query(sentences):
+                """
+                :return: (intents predicted, latency of each sentence)
+                """
+                fit_once()
+                start = time.time()
+                intents_found = api.predict(sentences)
+                timing['predict_duration'] += time.time() - start
+                timing['n_queried'] += len(sentences)
+                query_latencies = list(api.latencies)
+                latencies.add(query_latencies)
+                return intents_found, query_latencies
+
+            def predict(chunk):
+                sentences = list(chunk['sentence'])
+                if self.cache is None:
+                    return chunk, query(sentences)[0]
+                cached = self.cache.get_many(model_key, sentences)
+                predictions = dict((x, intent) for x, (intent, _) in cached.items())
+                # the latencies of the cached predictions are part of the sample, not of the throughput
+                latencies.add([latency for _, latency in cached.values() if latency is not None])
+                missing = [x for x in set(sentences) if x not in predictions]
+                if missing:
+                    intents_found, query_latencies = query(missing)
+                    new_predictions = dict(zip(missing, intents_found))
+                    self.cache.set_many(model_key, new_predictions, dict(zip(missing, query_latencies)))
+                    predictions.update(new_predictions)
+                return chunk, [predictions[x] for x in sentences]
+
+            for chunk, intents_found in pipeline.iterate(chunks, [predict], queue_size):
+                X_test = np.array(chunk['sentence'])
+                y_test = np.array(chunk['intent'])
+                true_codes, pred_codes = accumulator.add(y_test, intents_found)
+                self._log_fold(X_test, y_test, intents_found, true_codes == pred_codes,
+                               pred_codes == accumulator.fallback_index)
+                if resamples is not None:
+                    resamples.add(true_codes, pred_codes, len(accumulator.labels))
+                logger.info('\t\t\t\t{} sentences scored'.format(int(accumulator.confusion.sum())))
+
+        fold_timing = self._fold_timing(timing['fit_duration'], timing['time_to_ready'], timing['predict_duration'],
+                                        latencies.values)
+        if timing['predict_duration'] > 0:
+            # the latencies are a sample: the throughput counts every sentence queried
+            fold_timing['throughput'] = timing['n_queried'] / timing['predict_duration']
+        latency = fold_timing['latency']['p95']
+        confusion = accumulator.confusion
+        fallback_index = accumulator.fallback_index
+
+        n_found, n_fallback, n_error = metric_registry.counts(confusion, fallback_index)
+        self.scores = dict((metric, float(metric_registry.compute(metric, confusion, fallback_index, latency)))
+                           for metric in self.metrics)
+        self.risk_rate = float(metric_registry.risk_rate(confusion, fallback_index))
+        self.counts = {'found': int(n_found), 'fallback': int(n_fallback), 'error': int(n_error)}
+        self.intent_scores = metric_registry.intent_scores(confusion, accumulator.labels)
+        self.confidence_intervals = None
+        if resamples is not None:
+            self.confidence_intervals = resamples.intervals(self.metrics, fallback_index, self.confidence, latency)
+        self.timing = fold_timing
+        for metric in self.metrics:
+            logger.info('\t\t\t\tmetric {}: {}'.format(metric, self.scores[metric]))
+
+    def score_folds(self, folds):
+        """
+        Score the api on some folds only
+        :param folds: indices of the folds, between 0 and n_fold - 1
+        :return: list of the results of each fold (see _score_fold), with the index of the fold in 'fold'
+        """
+        n_workers = min(self.fold_workers, getattr(self.api, 'size', 1))
+        units = [('fold', self._fold_unit(i)) for i in folds]
+        return Scheduler(n_workers, {'fold': n_workers}).run(units)
+
+    def aggregate(self, fold_results, with_intervals=True):
+        """
+        :param fold_results: list of the results returned by score_folds
+        :param with_intervals: if False, the bootstrap confidence intervals are not computed
+        :return: the results averaged over the folds (counts are summed).
+            'confidence_intervals' gives the [low, high] bootstrap interval of each metric,
+            or None if n_bootstrap is 0.
+            'timing' gives the fit duration, time to ready, latency percentiles and throughput averaged over the folds
+            where they were measured (None if they never were)
+        """
         scores = {}
-        risk_rate = 0
         for metric in self.metrics:
-            scores[metric] = []
-        for i in range(self.n_fold):
+            # a latency-penalized metric is NaN on the folds whose latency is unknown
+            values = [fold['scores'][metric] for fold in fold_results if not np.isnan(fold['scores'][metric])]
+            scores[metric] = float(np.mean(values)) if values else float('nan')
+        counts = {}
+        for count in ['found', 'fallback', 'error']:
+            counts[count] = sum(fold['counts'][count] for fold in fold_results)
+        intents = {}
+        for intent in set(intent for fold in fold_results for intent in fold['intents']):
+            intent_folds = [fold['intents'][intent] for fold in fold_results if intent in fold['intents']]
+            intents[intent] = dict((key, float(np.mean([intent_fold[key] for intent_fold in intent_folds])))
+                                   for key in ['precision', 'recall', 'f1'])
+            intents[intent]['support'] = sum(intent_fold['support'] for intent_fold in intent_folds)
+        confidence_intervals = None
+        if with_intervals and self.n_bootstrap > 0:
+            confidence_intervals = bootstrap.confidence_intervals([fold['predictions'] for fold in fold_results],
+                                                                  self.metrics, self.n_bootstrap, self.confidence,
+                                                                  self.random_state)
+        return {
+            'scores': scores,
+            'risk_rate': float(np.mean([fold['risk_rate'] for fold in fold_results])),
+            'counts': counts,
+            'intents': intents,
+            'confidence_intervals': confidence_intervals,
+            'timing': self._aggregate_timing([fold['timing'] for fold in fold_results])
+        }
+
+    @staticmethod
+    def _aggregate_timing(fold_timings):
+        def mean(values):
+            values = [value for value in values if value is not None]
+            return float(np.mean(values)) if values else None
+
+        return {
+            'fit_duration': mean(timing['fit_duration'] for timing in fold_timings),
+            'time_to_ready': mean(timing['time_to_ready'] for timing in fold_timings),
+            'latency': dict((percentile, mean(timing['latency'][percentile] for timing in fold_timings))
+                            for percentile in ['p50', 'p95', 'p99']),
+            'throughput': mean(timing['throughput'] for timing in fold_timings)
+        }
+
+    def _fold_unit(self, i):
+        def score_fold():
+            unit_key = None
+            if self.checkpoint is not None:
+                unit_key = self._unit_key(i)
+                result = self.checkpoint.get(unit_key)
+                if result is not None:
+                    logger.info('\t\t\t\tfold {}/{} already scored'.format(i + 1, self.n_fold))
+                    return result
             logger.info('\t\t\t\tscoring fold {}/{}'.format(i + 1, self.n_fold))
-            df_train, df_test = train_test_split(self.df, test_size=self.test_size, random_state=self.random_state + i)
-            self._fit(df_train)
-            score_fold, risk_rate_fold = self._score_fold(self.df)
-            risk_rate += risk_rate_fold
-            for metric in self.metrics:
-                scores[metric].append(score_fold[metric])
-        risk_rate /= float(self.n_fold)
-        for metric in self.metrics:
-            logger.info('\t\t\t\tmetric {}: {}'.format(metric, np.mean(scores[metric])))
-            scores[metric] = np.mean(scores[metric])
-        self.scores = scores
-        self.risk_rate = risk_rate
+            df_train, df_test = self._split(i)
+            intents_found, timing = self._predict_fold(df_train, df_test)
+            result = self._score_fold(df_test, intents_found, timing)
+            result['fold'] = i
+            if unit_key is not None:
+                self.checkpoint.put(unit_key, result)
+            return result
+
+        return score_fold
+
+    def _split(self, i):
+        """
+        :return: (df_train, df_test) of the fold i: the api is trained on the other folds
+            and only predicts the sentences of this one
+        """
+        in_test = np.zeros(len(self.df), dtype=bool)
+        in_test[self.test_indices[i]] = True
+        return self.df[~in_test], self.df[in_test]
+
+    def plan_folds(self, folds):
+        """
+        Work the folds would give to the api, without sending it anything nor changing the cache
+        or the registry (see Planner).
+        The folds already checkpointed, the predictions cached and the models registered are taken into account
 
-    def _score_fold(self, df_test):
+        :param folds: indices of the folds, between 0 and n_fold - 1
+        :return: list of dictionaries, one per fold, with
+            - fit: True if the api would be trained
+            - n_intents, n_train: number of intents and of sentences of the training set
+            - n_test: number of sentences which would be sent to the api
+        """
+        plans = []
+        for i in folds:
+            df_train, df_test = self._split(i)
+            plan = {'fit': False, 'n_intents': df_train['intent'].nunique(), 'n_train': len(df_train), 'n_test': 0}
+            plans.append(plan)
+            if self.checkpoint is not None and self.checkpoint.get(self._unit_key(i)) is not None:
+                continue
+            X_test = list(df_test['sentence'])
+            model_key = None
+            if self.cache is not None or self.registry is not None:
+                model_key = fingerprint.model_key(str(self.api), self.language, self.params,
+                                                  fingerprint.hash_dataframe(df_train))
+            if self.cache is not None:
+                predictions = self.cache.peek_many(model_key, X_test)
+                X_test = [x for x in set(X_test) if x not in predictions]
+            plan['n_test'] = len(X_test)
+            # a registered model is assumed to be still deployed
+            plan['fit'] = len(X_test) > 0 and (self.registry is None or self.registry.peek(model_key) is None)
+        return plans
+
+    def _unit_key(self, i):
+        """
+        :return: key of the fold i in the checkpoint: it changes with anything its result depends on
+        """
+        return fingerprint.hash_values('stratified_fold', str(self.api), self.language,
+                                       fingerprint.hash_params(self.params), fingerprint.hash_dataframe(self.df), i,
+                                       self.n_fold, self.random_state, ','.join(sorted(self.metrics)),
+                                       self.fallback_name)
+
+    @contextmanager
+    def _lease_api(self):
+        if hasattr(self.api, 'lease'):
+            with self.api.lease() as api:
+                yield api
+        else:
+            yield self.api
+
+    def _predict_fold(self, df_train, df_test):
+        """
+        Train the api on df_train and predict the sentences of df_test.
+        When a cache is set, only the sentences missing from it are sent to the api,
+        and the training is skipped if none is missing.
+
+        :return: (intents predicted, timing of the fold (see _fold_timing))
+        """
+        X_test = list(df_test['sentence'])
+        model_key = None
+        if self.cache is not None or self.registry is not None:
+            model_key = fingerprint.model_key(str(self.api), self.language, self.params,
+                                              fingerprint.hash_dataframe(df_train))
+        if self.cache is None:
+            with self._lease_api() as api:
+                return self._fit_predict(api, df_train, X_test, model_key)
+
+        cached = self.cache.get_many(model_key, X_test)
+        predictions = dict((x, intent) for x, (intent, _) in cached.items())
+        cached_latencies = [latency for _, latency in cached.values() if latency is not None]
+        missing = [x for x in set(X_test) if x not in predictions]
+        logger.info('\t\t\t\t\t{} predictions cached, {} to query'.format(len(predictions), len(missing)))
+        timing = self._fold_timing(None, None, None, [], cached_latencies)
+        if missing:
+            with self._lease_api() as api:
+                intents_found, timing = self._fit_predict(api, df_train, missing, model_key, cached_latencies)
+                new_latencies = dict(zip(missing, api.latencies))
+            new_predictions = dict(zip(missing, intents_found))
+            self.cache.set_many(model_key, new_predictions, new_latencies)
+            predictions.update(new_predictions)
+        return [predictions[x] for x in X_test], timing
+
+    def _fit_predict(self, api, df_train, X_test, model_key, cached_latencies=()):
+        """
+        :param cached_latencies: latencies of the predictions of the fold read from the cache (see _fold_timing)
+        :return: (intents predicted, timing of the fit and of the predictions (see _fold_timing))
+        """
+        start = time.time()
+        trained = self._fit(api, df_train, model_key)
+        fit_duration = time.time() - start
+
+        start = time.time()
+        intents_found = api.predict(X_test)
+        predict_duration = time.time() - start
+        if not trained:
+            return intents_found, self._fold_timing(None, None, predict_duration, api.latencies, cached_latencies)
+        return intents_found, self._fold_timing(fit_duration, api.time_to_ready, predict_duration, api.latencies,
+                                                cached_latencies)
+
+    @staticmethod
+    def _fold_timing(fit_duration, time_to_ready, predict_duration, latencies, cached_latencies=()):
+        """
+        :param fit_duration: seconds taken by the fit, None if no model was trained
+        :param time_to_ready: seconds between the upload of the training data and the model being queryable
+        :param predict_duration: seconds taken by the predict, None if no sentence was sent
+        :param latencies: seconds taken to answer each sentence sent
+        :param cached_latencies: seconds the api took to answer the predictions read from the cache,
+            when they were sent: they count in the percentiles, not in the throughput
+        :return: dictionary with
+            - fit_duration, time_to_ready
+            - latency: 50th, 95th and 99th percentiles of the latencies ('p50', 'p95', 'p99'),
+              None if no latency is known
+            - throughput: number of sentences answered per second
+        """
+        latency = {'p50': None, 'p95': None, 'p99': None}
+        all_latencies = list(latencies) + list(cached_latencies)
+        if len(all_latencies) > 0:
+            values = np.percentile(all_latencies, [50, 95, 99])
+            latency = {'p50': float(values[0]), 'p95': float(values[1]), 'p99': float(values[2])}
+        throughput = None
+        if predict_duration and len(latencies) > 0:
+            throughput = len(latencies) / predict_duration
+        return {
+            'fit_duration': fit_duration,
+            'time_to_ready': time_to_ready,
+            'latency': latency,
+            'throughput': throughput
+        }
+
+    def _score_fold(self, df_test, intents_found, timing):
+        """
+        :param timing: timing of the fold (see _fold_timing), its 95th percentile of latency is used by
+            the latency-penalized metrics
+        :return: dictionary with
+            - scores: value of each metric
+            - risk_rate: rate of sentences which did not fall back
+            - counts: number of sentences found, wrongly fallen back and wrongly predicted
+            - intents: precision, recall, f1 and support of each intent
+            - predictions: codes of the expected and predicted intents (see metrics.encode) and latency
+            - timing: the timing given
+        """
         X_test = np.array(df_test['sentence'])
         y_test = np.array(df_test['intent'])
 
-        n_found = 0
-        n_fallback = 0
-        n_error = 0
+        true_codes, pred_codes, labels, fallback_index = metric_registry.encode(y_test, intents_found,
+                                                                                self.fallback_name)
+        confusion = metric_registry.confusion_matrix(true_codes, pred_codes, len(labels))
+        self._log_fold(X_test, y_test, intents_found, true_codes == pred_codes, pred_codes == fallback_index)
 
-        for i, x in enumerate(X_test):
-            intent_found = self.api.predict([x])[0]
-            if intent_found.lower() == y_test[i].lower():
-                n_found += 1
-                self._log_success(sentence=x, intent_to_find=y_test[i])
-            elif intent_found == self.fallback_name:
-                self._log_fallback(sentence=x, intent_to_find=y_test[i])
-                n_fallback += 1
-
-            else:
-                self._log_error(sentence=x, intent_to_find=y_test[i], intent_found=intent_found)
-                n_error += 1
+        n_found, n_fallback, n_error = metric_registry.counts(confusion, fallback_index)
         logger.info('\t\t\t\t\t{} ok, {} fallback, {} errors'.format(n_found, n_fallback, n_error))
+        return self._fold_scores(confusion, true_codes, pred_codes, labels, fallback_index, timing)
+
+    def rescore_fold(self, predictions, timing):
+        """
+        Score a fold again from its persisted predictions (see prediction_store), with the metrics
+        and the fallback intent of this scorer, without querying the api
+
+        :param predictions: codes of the expected and predicted intents, as in the results of _score_fold
+        :return: result of the fold, as _score_fold
+        """
+        true_codes, pred_codes, labels, fallback_index = metric_registry.map_fallback(
+            predictions['true'], predictions['pred'], predictions['labels'], predictions['fallback_index'],
+            self.fallback_name)
+        confusion = metric_registry.confusion_matrix(true_codes, pred_codes, len(labels))
+        return self._fold_scores(confusion, true_codes, pred_codes, labels, fallback_index, timing)
+
+    def _fold_scores(self, confusion, true_codes, pred_codes, labels, fallback_index, timing):
+        n_found, n_fallback, n_error = metric_registry.counts(confusion, fallback_index)
+        latency = timing['latency']['p95']
         scores = {}
         for metric in self.metrics:
-            scores[metric] = self._score_metric(n_found, n_fallback, n_error, metric=metric)
+            scores[metric] = float(metric_registry.compute(metric, confusion, fallback_index, latency))
+
+        return {
+            'scores': scores,
+            'risk_rate': float(metric_registry.risk_rate(confusion, fallback_index)),
+            'counts': {'found': int(n_found), 'fallback': int(n_fallback), 'error': int(n_error)},
+            'intents': metric_registry.intent_scores(confusion, labels),
+            'predictions': {'true': true_codes, 'pred': pred_codes, 'labels': labels, 'fallback_index': fallback_index,
+                            'latency': latency},
+            'timing': timing
+        }
+
+    def _log_fold(self, X_test, y_test, intents_found, found, fallback):
+        for i in np.flatnonzero(found):
+            self._log_success(sentence=X_test[i], intent_to_find=y_test[i])
+        for i in np.flatnonzero(fallback & ~found):
+            self._log_fallback(sentence=X_test[i], intent_to_find=y_test[i])
+        for i in np.flatnonzero(~fallback & ~found):
+            self._log_error(sentence=X_test[i], intent_to_find=y_test[i], intent_found=intents_found[i])
 
-        risk_rate = 1 - n_fallback / float(n_fallback + n_found + n_error)
-        return scores, risk_rate
+    def _fit(self, api, df_train, model_key=None):
+        """
+        :return: True if a model was trained, False if the one held by a registered artifact is used
+        """
+        if self.registry is None or model_key is None:
+            api.fit(df_train)
+            return True
 
-    def _score_metric(self, n_found, n_fallback, n_error, metric):
-        if metric == 'accuracy':
-            return n_found / float(n_found + n_fallback + n_error)
+        api_name = str(api)
+        artifact = self.registry.lookup(model_key)
+        # the artifact may be used by another agent of the pool, or no longer exist
+        if artifact is not None and self._load_artifact(api, artifact):
+            logger.info('\t\t\t\t\tmodel already deployed, fit skipped')
+            return False
 
-        if metric == 'error_3_penalized':
-            # error counts for 3 errors
-            return n_found / float(n_found + n_fallback + 3 * n_error)
+        current_artifact = api.get_artifact()
+        # the current artifact is synced with the new data, unless its model is kept (once the registry is full,
+        # a new artifact would only evict another model)
+        if self.registry.keep_models and current_artifact is not None and \
+                self.registry.holds(api_name, current_artifact) and self.registry.has_room(api_name):
+            api.detach_artifact()
+        # forgotten before the fit: a fit failing partway leaves the artifact with no model the registry trusts
+        overwritten_artifact = api.get_artifact()
+        if overwritten_artifact is not None:
+            self.registry.forget(api_name, overwritten_artifact)
+        api.fit(df_train)
 
-        if metric == 'error_10_penalized':
-            return n_found / float(n_found + n_fallback + 10 * n_error)
+        artifact = api.get_artifact()
+        if artifact is not None:
+            for evicted_artifact in self.registry.record(model_key, api_name, artifact):
+                logger.info('\t\t\t\t\trelease model {}'.format(evicted_artifact))
+                self._release_artifact(api, evicted_artifact)
+        return True
 
-    def _fit(self, df_train):
-        self.api.fit(df_train)
+    def _load_artifact(self, api, artifact):
+        if hasattr(self.api, 'lease'):
+            # a factory refuses the artifacts used by its other leased agents
+            return self.api.load_artifact(api, artifact)
+        return api.load_artifact(artifact)
+
+    def _release_artifact(self, api, artifact):
+        if hasattr(self.api, 'lease'):
+            self.api.release_artifact(api, artifact)
+        else:
+            api.release_artifact(artifact)
 
     def _log_success(self, sentence, intent_to_find):
         self.manager.log_success(str(self.api), sentence, intent_to_find)
@@ -99,3 +515,24 @@ class Scorer:
 
     def _log_error(self, sentence, intent_to_find, intent_found):
         self.manager.log_error(str(self.api), sentence, intent_to_find, intent_found)
+
+
+class _LatencySample:
+    def __init__(self, size=10000, random_state=42):
+        """
+        Uniform sample (reservoir) of at most size latencies, to compute percentiles in constant memory
+        """
+        self.size = size
+        self.values = []
+        self._n_seen = 0
+        self._random = random.Random(random_state)
+
+    def add(self, latencies):
+        for latency in latencies:
+            self._n_seen += 1
+            if len(self.values) < self.size:
+                self.values.append(latency)
+            else:
+                index = self._random.randrange(self._n_seen)
+                if index < self.size:
+                    self.values[index] = latency
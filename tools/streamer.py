@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from api_managers import api_builder
+from tools import loader
+from tools.scheduler import Scheduler
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Streamer:
+    def __init__(self, apis, language, criterion, test_file, scorer, fallback_name, chunk_size=1000, queue_size=2,
+                 n_workers=1, api_concurrency=None):
+        """
+        Score apis trained on a criterion against a large test file (a dump of real traffic for instance),
+        read and scored by chunks in constant memory.
+
+        :param criterion: criterion of the language the apis are trained on, entirely
+        :param test_file: tab-separated file with the columns 'sentence' and 'intent'
+        :param chunk_size: number of sentences read and predicted at once
+        :param queue_size: number of chunks waiting between two stages of the pipeline (see Scorer.score_stream)
+        :param n_workers: maximum number of apis scored at the same time
+        :param api_concurrency: see Comparator
+        """
+        self.apis = apis
+        self.language = language
+        self.criterion = criterion
+        self.test_file = test_file
+        self.scorer = scorer
+        self.fallback_name = fallback_name
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.n_workers = n_workers
+        self.api_concurrency = api_concurrency or {}
+        self.results = {}
+
+    def stream(self):
+        logger.info('Streamer :')
+        df_train = loader.load(self.language, self.criterion)
+        units = [(api, self._score_unit(api, df_train)) for api in self.apis]
+        scheduler = Scheduler(self.n_workers, self.api_concurrency)
+        self.results = dict(scheduler.run(units))
+
+    def _score_unit(self, api, df_train):
+        def score():
+            api_factory = api_builder.ApiFactory(api_name=api, fallback_name=self.fallback_name,
+                                                 language=self.language, params={})
+            scorer = self.scorer.clone()
+            scorer.fit(api_factory, df_train, language=self.language, params={}, split=False)
+            logger.info('\t\tstreaming {} on {}'.format(api, self.test_file))
+            scorer.score_stream(loader.iter_chunks(self.test_file, self.chunk_size), self.queue_size)
+            return str(api_factory), {'scores': scorer.scores, 'risk_rate': scorer.risk_rate,
+                                      'counts': scorer.counts, 'intents': scorer.intent_scores,
+                                      'confidence_intervals': scorer.confidence_intervals, 'timing': scorer.timing}
+
+        return score